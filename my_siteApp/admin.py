@@ -1,3 +1,32 @@
 from django.contrib import admin
+from django.utils import timezone
 
-# Register your models here.
+from . import jobs
+from .models import Feedback, Job
+
+
+@admin.register(Feedback)
+class FeedbackAdmin(admin.ModelAdmin):
+    list_display = ('name', 'email', 'created_date')
+    # Фильтр и иерархия дат идут по индексу (created_date, id)
+    list_filter = ('created_date',)
+    date_hierarchy = 'created_date'
+    search_fields = ('name', 'email')
+    readonly_fields = ('created_date',)
+    # Без COUNT(*) по всей таблице на каждой странице списка
+    show_full_result_count = False
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'queue', 'status', 'attempts', 'run_at', 'created_date')
+    list_filter = ('status', 'queue', 'name')
+    search_fields = ('dedupe_key',)
+    readonly_fields = ('locked_at', 'locked_by', 'last_error', 'created_date')
+    show_full_result_count = False
+    actions = ['retry_jobs']
+
+    @admin.action(description='Повторить задачи с ошибкой')
+    def retry_jobs(self, request, queryset):
+        for job in queryset.filter(status=Job.FAILED):
+            jobs.release(job, attempts=0, run_at=timezone.now())
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class MySiteappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'my_siteApp'
+
+    def ready(self):
+        from django.contrib.auth.signals import user_logged_in
+        from .models import record_last_login
+
+        # Вместо UPDATE auth_user на каждый вход - буфер отложенной записи
+        user_logged_in.disconnect(dispatch_uid='update_last_login')
+        user_logged_in.connect(record_last_login, dispatch_uid='update_last_login')
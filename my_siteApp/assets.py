@@ -0,0 +1,163 @@
+"""
+Статика с хешем в имени и заранее сжатыми копиями.
+
+collectstatic через CompressedManifestStaticFilesStorage кладет в
+STATIC_ROOT файлы вида base.3f2a9c1d0b7e.css и рядом .gz (и .br, если
+установлен пакет brotli). StaticFilesMiddleware отдает из STATIC_ROOT
+подходящий по Accept-Encoding вариант; файлы с хешем - с
+Cache-Control: immutable, так что при повторных визитах браузер их даже
+не перепроверяет.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.http import FileResponse
+from django.utils._os import safe_join
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Сжимать имеет смысл только текст; картинки и шрифты уже сжаты
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.html', '.txt', '.json', '.xml', '.map', '.ico')
+# Не хуже этой доли исходного размера - иначе сжатая копия не нужна
+MIN_RATIO = 0.95
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'public, max-age=60'
+
+
+def compress_gzip(data):
+    # mtime=0: одинаковый вход дает одинаковый .gz при каждом collectstatic
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def compress_brotli(data):
+    return brotli.compress(data, quality=11)
+
+
+ENCODINGS = [('br', '.br', compress_brotli if brotli else None), ('gzip', '.gz', compress_gzip)]
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage, который дописывает .gz/.br рядом с файлами с хешем"""
+
+    def stored_name(self, name):
+        # Без манифеста (collectstatic не запускали: разработка, тесты)
+        # отдаем исходные имена, а не падаем на каждом {% static %}
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for hashed_name in set(self.hashed_files.values()):
+            if hashed_name.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+                self.write_compressed(hashed_name)
+
+    def write_compressed(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        for _, suffix, compress in ENCODINGS:
+            if compress is None:
+                continue
+            compressed = compress(data)
+            if len(compressed) < len(data) * MIN_RATIO:
+                with open(path + suffix, 'wb') as f:
+                    f.write(compressed)
+
+
+def parse_accept_encoding(header):
+    """{'br': 1.0, 'gzip': 0.8, ...}"""
+    accepted = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+class StaticFilesMiddleware(MiddlewareMixin):
+    """
+    Отдает файлы из STATIC_ROOT раньше остальных middleware (без сессий и
+    обращений к базе). Если файла в STATIC_ROOT нет, запрос идет дальше -
+    в разработке его обслужит django.contrib.staticfiles. Под ASGI
+    проверка выполняется в цикле событий, без пула потоков (см. __acall__)
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.static_prefix = '/' + settings.STATIC_URL.lstrip('/')
+        self.static_root = settings.STATIC_ROOT
+        self.immutable_names = None
+
+    def is_immutable(self, name):
+        if self.immutable_names is None:
+            hashed_files = getattr(staticfiles_storage, 'hashed_files', {})
+            self.immutable_names = set(hashed_files.values())
+        return name in self.immutable_names
+
+    def process_request(self, request):
+        if request.method not in ('GET', 'HEAD') or not self.static_root:
+            return None
+        if not request.path_info.startswith(self.static_prefix):
+            return None
+
+        name = posixpath.normpath(request.path_info[len(self.static_prefix):]).lstrip('/')
+        try:
+            path = safe_join(self.static_root, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        accepted = parse_accept_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        served_path, encoding = path, None
+        for coding, suffix, _ in ENCODINGS:
+            if accepted.get(coding, 0) > 0 and os.path.isfile(path + suffix):
+                served_path, encoding = path + suffix, coding
+                break
+
+        content_type, _ = mimetypes.guess_type(name)
+        response = FileResponse(
+            open(served_path, 'rb'),
+            content_type=content_type or 'application/octet-stream',
+        )
+        # FileResponse подставляет имя открытого файла (.br/.gz) - оно не нужно
+        del response['Content-Disposition']
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Vary'] = 'Accept-Encoding'
+        response['Cache-Control'] = (
+            IMMUTABLE_CACHE_CONTROL if self.is_immutable(name) else DEFAULT_CACHE_CONTROL
+        )
+        return response
+
+    async def __acall__(self, request):
+        # MiddlewareMixin выполнял бы process_request в пуле потоков на каждый
+        # запрос, включая асинхронные эндпоинты. Здесь только проверка пути и
+        # stat файла, их можно сделать сразу
+        response = self.process_request(request)
+        if response is None:
+            response = await self.get_response(request)
+        return response
@@ -0,0 +1,124 @@
+"""
+JWT-аутентификация с кешем пользователей в памяти процесса.
+
+Пользователь по access-токену ищется в LRU-кеше с ограниченным временем
+жизни (ключ - id пользователя и jti токена), поэтому с прогретым кешем
+аутентифицированный API-запрос не делает запросов к auth_user. Записи
+пользователя удаляются при его сохранении или удалении (сигналы в
+models.py); в других процессах они живут не дольше JWT_USER_CACHE['TTL'].
+Каждый запрос получает свою копию пользователя, поэтому изменение его
+атрибутов (last_login, save()) не видно параллельным запросам.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+USER_CACHE_SETTINGS = getattr(settings, 'JWT_USER_CACHE', {})
+
+
+class UserCache:
+    """Потокобезопасный LRU-кеш с TTL; get и set работают с копиями объектов"""
+
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, user = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+        return copy.copy(user)
+
+    def set(self, key, user):
+        user = copy.copy(user)
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, user)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        user_id = str(user_id)
+        with self._lock:
+            for key in [key for key in self._data if key[0] == user_id]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+user_cache = UserCache(
+    max_size=USER_CACHE_SETTINGS.get('MAX_SIZE', 1024),
+    ttl=USER_CACHE_SETTINGS.get('TTL', 60),
+)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication, который берет пользователя из user_cache"""
+
+    def get_cache_key(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        jti = validated_token.get(api_settings.JTI_CLAIM)
+        if user_id is None or jti is None:
+            return None
+        return (str(user_id), jti)
+
+    def get_user(self, validated_token):
+        key = self.get_cache_key(validated_token)
+        if key is None:
+            return super().get_user(validated_token)
+
+        user = user_cache.get(key)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(key, user)
+        return user
+
+    async def aauthenticate(self, request):
+        """
+        Асинхронный вариант authenticate: разбор и проверка подписи токена
+        не обращаются к базе и выполняются сразу, в поток уходит только
+        загрузка пользователя при промахе кеша
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+
+        key = self.get_cache_key(validated_token)
+        user = user_cache.get(key) if key is not None else None
+        if user is None:
+            user = await sync_to_async(self.get_user)(validated_token)
+        return user, validated_token
+
+
+class MiddlewareJWTAuthentication(CachedJWTAuthentication):
+    """
+    Класс для DEFAULT_AUTHENTICATION_CLASSES: если JWTAuthenticationMiddleware
+    уже разобрал токен, DRF повторно его не декодирует и пользователя не ищет
+    """
+
+    def authenticate(self, request):
+        django_request = getattr(request, '_request', request)
+        token = getattr(django_request, 'jwt_token', None)
+        if token is not None:
+            return django_request.user, token
+        return super().authenticate(request)
@@ -0,0 +1,202 @@
+"""
+Буфер отложенной записи (write-behind).
+
+Мелкие записи, которые не нужны в базе немедленно (last_login, учет
+выданных токенов, обращения из формы), складываются в память процесса,
+а фоновый поток пишет их пачкой, когда набралось MAX_SIZE элементов или
+прошло MAX_DELAY секунд с первого. Запрос, добавивший элемент, в базу не
+пишет. Элементы с одинаковым ключом схлопываются (остается последний),
+без ключа - копятся все. При нормальной остановке процесса (atexit)
+остаток записывается синхронно.
+
+atexit срабатывает, только если процесс завершается через sys.exit.
+Поэтому при импорте в главном потоке ставится и обработчик SIGTERM: он
+записывает все буферы и передает сигнал прежнему обработчику, а если его
+не было - завершает процесс, как SIGTERM по умолчанию. Так данные не
+теряются при остановке runserver, голого процесса или контейнера
+(docker stop), а также в gunicorn и uvicorn: они ставят свои обработчики
+поверх этого и выходят через sys.exit. После SIGKILL или падения
+процесса накопленное за последние MAX_DELAY секунд теряется.
+
+Пачка записывается через write_queue, как и остальные записи процесса;
+при ошибке она возвращается в буфер и повторяется, а после MAX_RETRIES
+неудач подряд отбрасывается с записью в лог. Внутри открытой транзакции
+(и в тестах) элемент записывается сразу, как в write_queue.
+"""
+import atexit
+import itertools
+import logging
+import os
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from .writequeue import write_queue
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_SETTINGS = getattr(settings, 'WRITE_BEHIND', {})
+
+# Все буферы процесса, для записи остатка по SIGTERM
+_buffers = []
+_previous_sigterm_handler = None
+
+
+class WriteBehindBuffer:
+
+    def __init__(self, flush_func, name, max_size=500, max_delay=1.0, max_retries=5, enabled=True):
+        self.flush_func = flush_func
+        self.name = name
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.enabled = enabled
+        self._items = {}
+        self._first_added = None
+        self._failures = 0
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        atexit.register(self.close)
+        _buffers.append(self)
+        install_sigterm_handler()
+
+    def add(self, item, key=None):
+        """Добавить элемент; с key более ранний элемент с тем же ключом заменяется"""
+        if not self.enabled or self._closed or connection.in_atomic_block:
+            write_queue.submit(self.flush_func, [item])
+            return
+        with self._condition:
+            if key is None:
+                key = ('item', next(self._counter))
+            else:
+                # Новое значение встает в конец, как самое свежее
+                self._items.pop(key, None)
+            self._items[key] = item
+            if self._first_added is None:
+                self._first_added = time.monotonic()
+            if len(self._items) >= self.max_size:
+                self._condition.notify()
+        self._ensure_thread()
+
+    def __len__(self):
+        with self._condition:
+            return len(self._items)
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._condition:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name=f'write-behind-{self.name}', daemon=True
+                )
+                self._thread.start()
+
+    def _take(self):
+        with self._condition:
+            items, self._items = self._items, {}
+            self._first_added = None
+        return items
+
+    def _restore(self, items):
+        """Вернуть неудачную пачку; более свежие значения тех же ключей важнее"""
+        with self._condition:
+            for key, item in items.items():
+                self._items.setdefault(key, item)
+            if self._items and self._first_added is None:
+                self._first_added = time.monotonic()
+
+    def flush(self):
+        """Записать все накопленное сейчас; возвращает число записанных элементов"""
+        with self._flush_lock:
+            items = self._take()
+            if not items:
+                return 0
+            try:
+                write_queue.submit(self.flush_func, list(items.values()))
+            except Exception:
+                self._failures += 1
+                if self._failures >= self.max_retries:
+                    logger.exception('%s: пачка из %d элементов отброшена', self.name, len(items))
+                    self._failures = 0
+                else:
+                    logger.warning('%s: ошибка записи пачки, повтор', self.name, exc_info=True)
+                    self._restore(items)
+                return 0
+            self._failures = 0
+            return len(items)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed:
+                    if self._items:
+                        waited = time.monotonic() - self._first_added
+                        if len(self._items) >= self.max_size or waited >= self.max_delay:
+                            break
+                        self._condition.wait(self.max_delay - waited)
+                    else:
+                        self._condition.wait()
+                if self._closed:
+                    return
+            self.flush()
+
+    def close(self):
+        """Остановить фоновый поток и записать остаток (вызывается при выходе)"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.max_delay + 5)
+        for _ in range(self.max_retries):
+            if not len(self):
+                break
+            self.flush()
+
+
+def flush_all():
+    for buffer in _buffers:
+        try:
+            buffer.flush()
+        except Exception:
+            logger.exception('%s: ошибка записи остатка', buffer.name)
+
+
+def _handle_sigterm(signum, frame):
+    flush_all()
+    previous = _previous_sigterm_handler
+    if callable(previous):
+        previous(signum, frame)
+    elif previous != signal.SIG_IGN:
+        # Обработчика не было: завершаемся так же, как без этого перехвата
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+
+
+def install_sigterm_handler():
+    """Поставить _handle_sigterm один раз; сигналы ставятся только из главного потока"""
+    global _previous_sigterm_handler
+    if threading.current_thread() is not threading.main_thread():
+        return
+    current = signal.getsignal(signal.SIGTERM)
+    if current is _handle_sigterm:
+        return
+    _previous_sigterm_handler = current
+    signal.signal(signal.SIGTERM, _handle_sigterm)
+
+
+def create_buffer(flush_func, name, **kwargs):
+    """Буфер с параметрами из settings.WRITE_BEHIND; kwargs их переопределяют"""
+    options = {
+        'enabled': WRITE_BEHIND_SETTINGS.get('ENABLED', True),
+        'max_size': WRITE_BEHIND_SETTINGS.get('MAX_SIZE', 500),
+        'max_delay': WRITE_BEHIND_SETTINGS.get('MAX_DELAY', 1.0),
+        **kwargs,
+    }
+    return WriteBehindBuffer(flush_func, name, **options)
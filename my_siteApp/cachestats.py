@@ -0,0 +1,95 @@
+"""
+Бэкенды кеша со счетчиками попаданий и промахов.
+
+Подключаются в CACHES вместо стандартных; счетчики живут в памяти процесса
+и показываются эндпоинтом api/cache/stats/ (только для персонала).
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+class HitCounter:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else None,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+# caches[alias] создает объект бэкенда на каждый поток, поэтому счетчики
+# общие для процесса и ищутся по классу и расположению кеша
+_counters = {}
+_counters_lock = threading.Lock()
+
+
+def get_counter(key):
+    with _counters_lock:
+        return _counters.setdefault(key, HitCounter())
+
+
+class InstrumentedCacheMixin:
+    """
+    Считает get(); у файлового и локального кеша get_many тоже идет через
+    get, так что учитывается и он
+    """
+    _missing = object()
+
+    def __init__(self, location, params):
+        super().__init__(location, params)
+        self.counter = get_counter((type(self).__name__, location))
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, self._missing, version=version)
+        if value is self._missing:
+            self.counter.record(0, 1)
+            return default
+        self.counter.record(1, 0)
+        return value
+
+
+class InstrumentedLocMemCache(InstrumentedCacheMixin, LocMemCache):
+    pass
+
+
+class InstrumentedFileBasedCache(InstrumentedCacheMixin, FileBasedCache):
+    pass
+
+
+def collect_stats():
+    """Счетчики всех кешей из CACHES, которые их ведут"""
+    stats = {}
+    for alias in settings.CACHES:
+        cache = caches[alias]
+        if isinstance(cache, InstrumentedCacheMixin):
+            stats[alias] = cache.counter.stats()
+    return stats
+
+
+def reset_all_stats():
+    for alias in settings.CACHES:
+        cache = caches[alias]
+        if isinstance(cache, InstrumentedCacheMixin):
+            cache.counter.reset()
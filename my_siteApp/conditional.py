@@ -0,0 +1,129 @@
+"""
+Условные GET-запросы (ETag / Last-Modified) для статей и комментариев.
+
+Каждая функция версии делает одну дешевую выборку (updated_at конкретной
+строки или max(updated_at) + count для списков) и возвращает пару
+(части ETag, Last-Modified). При совпадении валидаторов
+django.views.decorators.http.condition отвечает 304, не вызывая view,
+то есть без сериализатора и шаблона.
+
+Данные автора (имя, email) входят в ответы о статьях, но у User нет
+updated_at: при их изменении models.touch_author_articles обновляет
+updated_at его статей, и версии статей, списков и комментариев меняются.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.db.models import Count, Max
+from django.views.decorators.http import condition
+
+from .models import Article, Comment
+
+
+def make_etag(request, *parts):
+    """
+    Хеш версии данных плюс параметры представления: строка запроса
+    (cursor, fields, expand, order) и Accept (JSON или browsable API)
+    """
+    digest = hashlib.sha1()
+    parts += (request.META.get('QUERY_STRING', ''), request.META.get('HTTP_ACCEPT', ''))
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def conditional(version_func):
+    """Декоратор view: ETag и Last-Modified из одной выборки версии на запрос"""
+    cache_attr = f'_version_{version_func.__name__}'
+
+    def get_version(request, *args, **kwargs):
+        if not hasattr(request, cache_attr):
+            setattr(request, cache_attr, version_func(request, *args, **kwargs))
+        return getattr(request, cache_attr)
+
+    def etag_func(request, *args, **kwargs):
+        version = get_version(request, *args, **kwargs)
+        if version is None:
+            return None
+        return make_etag(request, *version[0])
+
+    def last_modified_func(request, *args, **kwargs):
+        version = get_version(request, *args, **kwargs)
+        if version is None:
+            return None
+        return version[1]
+
+    def decorator(view_func):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view_func)
+
+        if iscoroutinefunction(view_func):
+            # condition вызывает функции ETag синхронно, в цикле событий ORM
+            # недоступен: версия считается заранее одним sync_to_async и
+            # берется из атрибута запроса
+            @wraps(view_func)
+            async def async_wrapped_view(request, *args, **kwargs):
+                if request.method in ('GET', 'HEAD'):
+                    await sync_to_async(get_version)(request, *args, **kwargs)
+                    return await conditional_view(request, *args, **kwargs)
+                return await view_func(request, *args, **kwargs)
+            return async_wrapped_view
+
+        # Версия нужна только для GET/HEAD: POST (комментарий) ее не считает
+        @wraps(view_func)
+        def wrapped_view(request, *args, **kwargs):
+            if request.method in ('GET', 'HEAD'):
+                return conditional_view(request, *args, **kwargs)
+            return view_func(request, *args, **kwargs)
+        return wrapped_view
+    return decorator
+
+
+def article_version(request, id):
+    row = Article.objects.filter(id=id).values_list(
+        'updated_at', 'user__username', 'user__email', 'user__first_name', 'user__last_name'
+    ).first()
+    if row is None:
+        return None
+    return row, row[0]
+
+
+def comment_version(request, id):
+    row = Comment.objects.filter(id=id).values_list(
+        'updated_at', 'article__updated_at', 'article__user__username'
+    ).first()
+    if row is None:
+        return None
+    return row, max(row[0], row[1])
+
+
+def article_list_version(request, category=None):
+    articles = Article.objects.order_by()
+    if category:
+        articles = articles.filter(category=category)
+    stats = articles.aggregate(last=Max('updated_at'), total=Count('id'))
+    return (stats['last'], stats['total']), stats['last']
+
+
+def comment_list_version(request):
+    stats = Comment.objects.order_by().aggregate(last=Max('updated_at'), total=Count('id'))
+    articles_last = Article.objects.order_by().aggregate(last=Max('updated_at'))['last']
+    last_modified = max(filter(None, [stats['last'], articles_last]), default=None)
+    return (stats['last'], stats['total'], articles_last), last_modified
+
+
+def news_detail_version(request, id):
+    # Флеш-сообщения показываются один раз - такую страницу не подтверждаем 304
+    if 'messages' in request.COOKIES:
+        return None
+    article = Article.objects.filter(id=id).values_list('updated_at', 'user__username').first()
+    if article is None:
+        return None
+    stats = Comment.objects.filter(article_id=id).order_by().aggregate(
+        last=Max('updated_at'), total=Count('id')
+    )
+    # Кнопки редактирования зависят от пользователя, поэтому он входит в ETag
+    user_key = request.user.pk if request.user.is_authenticated else None
+    last_modified = max(filter(None, [article[0], stats['last']]))
+    return (article, stats['last'], stats['total'], user_key), last_modified
@@ -0,0 +1,136 @@
+"""
+Потоковая выгрузка статей и комментариев в NDJSON или JSON-массив.
+
+Строки читаются через QuerySet.iterator(chunk_size) в виде словарей
+(.values(), без создания моделей и сериализаторов) и сразу кодируются,
+поэтому память не зависит от объема выгрузки. Используется эндпоинтами
+api/articles/export/, api/comment/export/ и командой export_content.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Article, Comment
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'json': 'application/json; charset=utf-8',
+}
+CHUNK_SIZE = 2000
+# Сколько строк склеивать в один кусок ответа
+ROWS_PER_CHUNK = 200
+
+ARTICLE_FIELDS = ('id', 'title', 'text', 'created_date', 'category', 'user', 'comment_count')
+COMMENT_FIELDS = ('id', 'text', 'created_date', 'author_name', 'article')
+
+encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def encode_row(row):
+    # Как JSONRenderer DRF: U+2028/U+2029 экранируются, иначе построчные
+    # читатели NDJSON (и JavaScript) примут их за конец строки
+    return encoder.encode(row).replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+
+
+def parse_moment(value, end=False):
+    """
+    Дата (YYYY-MM-DD) или дата-время ISO 8601. Для конца диапазона дата
+    означает весь день включительно
+    """
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Неверная дата: {value}')
+        if end:
+            day += timedelta(days=1)
+        moment = datetime.combine(day, time.min)
+    elif end:
+        # Для верхней границы-момента сравнение строгое, поэтому сдвигаем
+        moment += timedelta(microseconds=1)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def get_filters(category=None, date_from=None, date_to=None):
+    """Проверка параметров выгрузки; ошибки - ValueError с сообщением для клиента"""
+    if category and category not in dict(Article.CATEGORY_CHOICES):
+        raise ValueError('Неверная категория')
+    filters = {'category': category or None}
+    filters['date_from'] = parse_moment(date_from) if date_from else None
+    filters['date_to'] = parse_moment(date_to, end=True) if date_to else None
+    return filters
+
+
+def filter_by_date(queryset, date_from=None, date_to=None):
+    if date_from is not None:
+        queryset = queryset.filter(created_date__gte=date_from)
+    if date_to is not None:
+        queryset = queryset.filter(created_date__lt=date_to)
+    return queryset
+
+
+def article_rows(category=None, date_from=None, date_to=None):
+    articles = Article.objects.all()
+    if category:
+        articles = articles.filter(category=category)
+    articles = filter_by_date(articles, date_from, date_to)
+    return articles.order_by('id').values(*ARTICLE_FIELDS, author_name=F('user__username'))
+
+
+def comment_rows(category=None, date_from=None, date_to=None):
+    comments = Comment.objects.all()
+    if category:
+        comments = comments.filter(article__category=category)
+    comments = filter_by_date(comments, date_from, date_to)
+    return comments.order_by('id').values(*COMMENT_FIELDS, article_title=F('article__title'))
+
+
+EXPORTERS = {
+    'articles': article_rows,
+    'comments': comment_rows,
+}
+
+
+def iter_rows(kind, chunk_size=CHUNK_SIZE, **filters):
+    return EXPORTERS[kind](**filters).iterator(chunk_size=chunk_size)
+
+
+def iter_ndjson(rows):
+    buffer = []
+    for row in rows:
+        buffer.append(encode_row(row))
+        buffer.append('\n')
+        if len(buffer) >= ROWS_PER_CHUNK * 2:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def iter_json_array(rows):
+    # Открывающая скобка уходит сразу, до первого запроса к базе
+    yield '['
+    buffer = []
+    separator = ''
+    for row in rows:
+        buffer.append(separator)
+        buffer.append(encode_row(row))
+        separator = ','
+        if len(buffer) >= ROWS_PER_CHUNK * 2:
+            yield ''.join(buffer)
+            buffer = []
+    buffer.append(']')
+    yield ''.join(buffer)
+
+
+def stream(kind, export_format='ndjson', chunk_size=CHUNK_SIZE, **filters):
+    """Генератор кусков текста выгрузки"""
+    rows = iter_rows(kind, chunk_size=chunk_size, **filters)
+    if export_format == 'json':
+        return iter_json_array(rows)
+    return iter_ndjson(rows)
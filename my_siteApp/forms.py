@@ -1,5 +1,7 @@
 from django import forms
+from django.contrib.auth.forms import AuthenticationForm
 from .models import Article, Comment
+from . import hashing
 
 class FeedbackForm(forms.Form):
     name = forms.CharField(
@@ -52,4 +54,17 @@ class CommentForm(forms.ModelForm):
         labels = {
             'author_name': 'Имя',
             'text': 'Комментарий',
-        }
\ No newline at end of file
+        }
+
+class LoginForm(AuthenticationForm):
+    """AuthenticationForm, проверяющая пароль в пуле процессов (my_siteApp.hashing)"""
+
+    def clean(self):
+        username = self.cleaned_data.get('username')
+        password = self.cleaned_data.get('password')
+        if username is not None and password:
+            self.user_cache = hashing.authenticate(self.request, username=username, password=password)
+            if self.user_cache is None:
+                raise self.get_invalid_login_error()
+            self.confirm_login_allowed(self.user_cache)
+        return self.cleaned_data
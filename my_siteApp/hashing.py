@@ -0,0 +1,200 @@
+"""
+Хеширование и проверка паролей в ограниченном пуле процессов.
+
+PBKDF2 занимает сотни миллисекунд процессора. Если считать его в потоке
+запроса, волна входов занимает все потоки воркера и обычные страницы
+ждут в очереди. Здесь хеширование уходит в пул из WORKERS процессов, а
+число задач в пуле (считаемые и ожидающие) ограничено MAX_PENDING: сверх
+него запрос сразу получает HashingPoolBusy (503), а не встает в очередь.
+Так под нагрузкой входом занято не больше MAX_PENDING потоков, остальные
+свободны для страниц.
+
+authenticate()/aauthenticate() - замена django.contrib.auth.authenticate
+для ModelBackend (пользователь ищется как обычно, пароль проверяется в
+пуле). С другими бэкендами используется стандартный authenticate.
+WORKERS=0 - считать в потоке запроса, как раньше.
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.hashers import make_password, verify_password
+from django.contrib.auth.signals import user_login_failed
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+PASSWORD_HASHING_SETTINGS = getattr(settings, 'PASSWORD_HASHING', {})
+
+MODEL_BACKEND = 'django.contrib.auth.backends.ModelBackend'
+
+
+class HashingPoolBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Сервер перегружен, попробуйте войти позже'
+    default_code = 'hashing_pool_busy'
+
+
+class PasswordHashingPool:
+
+    def __init__(self, workers=2, max_pending=8, timeout=10):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, а не fork: воркер Django многопоточный (поток-писатель,
+                # потоки сервера), и fork мог бы унести в дочерний процесс
+                # захваченные блокировки. Процессы стартуют при первом входе
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+            return self._executor
+
+    def _reset_executor(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def submit(self, func, *args):
+        """Поставить func(*args) в пул; при заполненном пуле - HashingPoolBusy сразу"""
+        if self.workers <= 0:
+            future = Future()
+            try:
+                future.set_result(func(*args))
+            except Exception as exc:
+                future.set_exception(exc)
+            return future
+
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise HashingPoolBusy()
+            self._pending += 1
+        executor = self._get_executor()
+        try:
+            future = executor.submit(func, *args)
+        except (BrokenProcessPool, RuntimeError):
+            self._release(None)
+            self._reset_executor(executor)
+            raise HashingPoolBusy()
+        future.add_done_callback(self._release)
+        return future
+
+    def run(self, func, *args):
+        future = self.submit(func, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise HashingPoolBusy()
+        except BrokenProcessPool:
+            # Процесс пула упал; следующий вызов создаст пул заново
+            if self._executor is not None:
+                self._reset_executor(self._executor)
+            raise HashingPoolBusy()
+
+    async def arun(self, func, *args):
+        future = self.submit(func, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise HashingPoolBusy()
+        except BrokenProcessPool:
+            if self._executor is not None:
+                self._reset_executor(self._executor)
+            raise HashingPoolBusy()
+
+    def make_password(self, password):
+        return self.run(make_password, password)
+
+    def verify_password(self, password, encoded):
+        """(пароль верен, хеш нужно пересчитать)"""
+        return self.run(verify_password, password, encoded)
+
+    async def amake_password(self, password):
+        return await self.arun(make_password, password)
+
+    async def averify_password(self, password, encoded):
+        return await self.arun(verify_password, password, encoded)
+
+
+password_pool = PasswordHashingPool(
+    workers=PASSWORD_HASHING_SETTINGS.get('WORKERS', 2),
+    max_pending=PASSWORD_HASHING_SETTINGS.get('MAX_PENDING', 8),
+    timeout=PASSWORD_HASHING_SETTINGS.get('TIMEOUT', 10),
+)
+
+
+def uses_model_backend():
+    return list(settings.AUTHENTICATION_BACKENDS) == [MODEL_BACKEND]
+
+
+def authenticate(request=None, username=None, password=None):
+    """
+    То же, что authenticate() с ModelBackend, но пароль проверяется в пуле.
+    Пароль пересчитывается, если изменились настройки хеширования
+    """
+    if not uses_model_backend():
+        return auth.authenticate(request, username=username, password=password)
+    if username is None or password is None:
+        return None
+    UserModel = auth.get_user_model()
+    try:
+        user = UserModel._default_manager.get_by_natural_key(username)
+    except UserModel.DoesNotExist:
+        # Как ModelBackend: хешируем впустую, чтобы по времени ответа
+        # нельзя было узнать, существует ли пользователь
+        password_pool.make_password(password)
+        user = None
+    else:
+        is_correct, must_update = password_pool.verify_password(password, user.password)
+        if is_correct and must_update:
+            user.password = password_pool.make_password(password)
+            user.save(update_fields=['password'])
+        if not is_correct or not user.is_active:
+            user = None
+    if user is None:
+        user_login_failed.send(sender=__name__, credentials={'username': username}, request=request)
+        return None
+    user.backend = MODEL_BACKEND
+    return user
+
+
+async def aauthenticate(request=None, username=None, password=None):
+    """Асинхронный вариант authenticate()"""
+    if not uses_model_backend():
+        return await auth.aauthenticate(request, username=username, password=password)
+    if username is None or password is None:
+        return None
+    UserModel = auth.get_user_model()
+    try:
+        user = await UserModel._default_manager.aget_by_natural_key(username)
+    except UserModel.DoesNotExist:
+        await password_pool.amake_password(password)
+        user = None
+    else:
+        is_correct, must_update = await password_pool.averify_password(password, user.password)
+        if is_correct and must_update:
+            user.password = await password_pool.amake_password(password)
+            await user.asave(update_fields=['password'])
+        if not is_correct or not user.is_active:
+            user = None
+    if user is None:
+        await user_login_failed.asend(sender=__name__, credentials={'username': username}, request=request)
+        return None
+    user.backend = MODEL_BACKEND
+    return user
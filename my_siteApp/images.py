@@ -0,0 +1,194 @@
+"""
+Адаптивные копии изображений из static/images.
+
+Команда build_images делает для каждой картинки уменьшенные копии
+нескольких ширин в AVIF, WebP и JPEG и кладет их в static/responsive. В
+имени файла стоит хеш исходника и настроек, поэтому копии можно кешировать
+навсегда, а повторный запуск пересобирает только изменившиеся исходники.
+Готовые копии описаны в manifest.json; тег {% responsive_image %} строит
+по нему <picture> с srcset/sizes, а без манифеста выводит обычный <img>.
+
+Pillow нужен только для сборки (pip install Pillow), не для работы сайта.
+"""
+import hashlib
+import json
+import os
+import threading
+
+from django.conf import settings
+
+IMAGE_SETTINGS = getattr(settings, 'RESPONSIVE_IMAGES', {})
+
+ROOT = IMAGE_SETTINGS.get('ROOT', settings.STATICFILES_DIRS[0])
+SOURCE_PREFIX = IMAGE_SETTINGS.get('SOURCE', 'images')
+OUTPUT_PREFIX = IMAGE_SETTINGS.get('OUTPUT', 'responsive')
+WIDTHS = sorted(IMAGE_SETTINGS.get('WIDTHS', [320, 480, 640, 800]))
+FORMATS = IMAGE_SETTINGS.get('FORMATS', ['avif', 'webp', 'jpeg'])
+QUALITY = {'avif': 50, 'webp': 75, 'jpeg': 80, **IMAGE_SETTINGS.get('QUALITY', {})}
+
+MANIFEST_NAME = 'manifest.json'
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+EXTENSIONS = {'avif': 'avif', 'webp': 'webp', 'jpeg': 'jpg'}
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+_manifest_lock = threading.Lock()
+_manifest_cache = {'mtime': None, 'data': {}}
+
+
+def manifest_path():
+    return os.path.join(ROOT, OUTPUT_PREFIX, MANIFEST_NAME)
+
+
+def read_manifest():
+    try:
+        with open(manifest_path(), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def get_image(path):
+    """
+    Запись манифеста для пути вида 'images/x.jpg' или None. Манифест
+    перечитывается, только если файл изменился
+    """
+    try:
+        mtime = os.stat(manifest_path()).st_mtime
+    except OSError:
+        return None
+    with _manifest_lock:
+        if _manifest_cache['mtime'] != mtime:
+            _manifest_cache['data'] = read_manifest()
+            _manifest_cache['mtime'] = mtime
+        return _manifest_cache['data'].get(path)
+
+
+def find_sources():
+    """Исходники относительно ROOT: ['images/a.jpg', ...]"""
+    source_dir = os.path.join(ROOT, SOURCE_PREFIX)
+    sources = []
+    for dirpath, _, filenames in os.walk(source_dir):
+        for filename in filenames:
+            if filename.lower().endswith(SOURCE_EXTENSIONS):
+                full_path = os.path.join(dirpath, filename)
+                sources.append(os.path.relpath(full_path, ROOT).replace(os.sep, '/'))
+    return sorted(sources)
+
+
+def source_digest(path, formats):
+    """Хеш содержимого исходника и настроек сборки"""
+    digest = hashlib.sha256()
+    with open(os.path.join(ROOT, path), 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    options = {'widths': WIDTHS, 'formats': formats, 'quality': QUALITY}
+    digest.update(json.dumps(options, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+
+def target_widths(width):
+    """Ширины копий: не больше исходной, сама исходная - если она меньше максимума"""
+    widths = [w for w in WIDTHS if w < width]
+    widths.append(min(width, WIDTHS[-1]))
+    return sorted(set(widths))
+
+
+def supported_formats():
+    from PIL import features
+
+    available = {'jpeg': True, 'webp': features.check('webp'), 'avif': features.check('avif')}
+    return [fmt for fmt in FORMATS if available.get(fmt)]
+
+
+def output_files(entry):
+    return [name for variants in entry['variants'].values() for _, name in variants]
+
+
+def is_built(entry, digest):
+    return (
+        entry is not None
+        and entry.get('digest') == digest
+        and all(os.path.exists(os.path.join(ROOT, name)) for name in output_files(entry))
+    )
+
+
+def build_image(path, digest, formats):
+    """Собрать копии одного исходника; возвращает запись манифеста"""
+    from PIL import Image, ImageOps
+
+    with Image.open(os.path.join(ROOT, path)) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        width, height = image.size
+
+        stem = os.path.splitext(os.path.basename(path))[0]
+        output_dir = os.path.join(ROOT, OUTPUT_PREFIX)
+        os.makedirs(output_dir, exist_ok=True)
+
+        variants = {fmt: [] for fmt in formats}
+        for target in target_widths(width):
+            resized = image
+            if target < width:
+                resized = image.resize((target, round(height * target / width)), Image.LANCZOS)
+            for fmt in formats:
+                name = f'{OUTPUT_PREFIX}/{stem}-{digest}-{target}w.{EXTENSIONS[fmt]}'
+                frame = resized.convert('RGB') if fmt == 'jpeg' else resized
+                options = {'quality': QUALITY[fmt]}
+                if fmt == 'jpeg':
+                    options.update(optimize=True, progressive=True)
+                elif fmt == 'webp':
+                    options.update(method=6)
+                frame.save(os.path.join(ROOT, name), fmt.upper(), **options)
+                variants[fmt].append([target, name])
+
+    return {'digest': digest, 'width': width, 'height': height, 'variants': variants}
+
+
+def remove_files(names):
+    for name in names:
+        try:
+            os.remove(os.path.join(ROOT, name))
+        except FileNotFoundError:
+            pass
+
+
+def write_manifest(manifest):
+    path = manifest_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def build_all(force=False, log=None):
+    """
+    Пересобрать копии изменившихся исходников, удалить копии удаленных.
+    Возвращает (собрано, пропущено)
+    """
+    formats = supported_formats()
+    manifest = read_manifest()
+    sources = find_sources()
+    built = skipped = 0
+
+    for path in sources:
+        digest = source_digest(path, formats)
+        entry = manifest.get(path)
+        if not force and is_built(entry, digest):
+            skipped += 1
+            continue
+        new_entry = build_image(path, digest, formats)
+        if entry is not None:
+            stale = set(output_files(entry)) - set(output_files(new_entry))
+            remove_files(stale)
+        manifest[path] = new_entry
+        built += 1
+        if log:
+            log(path, new_entry)
+
+    for path in set(manifest) - set(sources):
+        remove_files(output_files(manifest.pop(path)))
+
+    write_manifest(manifest)
+    return built, skipped
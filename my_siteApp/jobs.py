@@ -0,0 +1,197 @@
+"""
+Очередь фоновых задач в основной базе (модель Job).
+
+Дорогие побочные эффекты сохранения (сейчас - обновление поискового
+индекса) не выполняются в запросе: сигнал модели добавляет строку Job, а
+выполняет ее команда manage.py run_jobs. Если запись и enqueue идут в одном
+transaction.atomic (представления, сохраняющие статьи, его открывают),
+задача не теряется при падении процесса между COMMIT и выполнением и не
+появляется, если транзакция откатилась. В autocommit строка Job
+фиксируется отдельно от записи.
+
+- dedupe_key: пока в очереди есть ожидающая задача с тем же ключом, новая
+  не добавляется (частичный уникальный индекс, INSERT ... ON CONFLICT DO
+  NOTHING), поэтому десять сохранений статьи дают одну переиндексацию;
+- захват атомарный: условный UPDATE status='pending' -> 'running', который
+  проходит, только пока в очереди выполняется меньше задач, чем разрешено
+  JOB_QUEUE['QUEUES'][очередь], - лимит общий для всех процессов-воркеров;
+- при ошибке задача повторяется с экспоненциальной задержкой, после
+  max_attempts остается со статусом failed (видна в админке);
+- задачи, чей воркер умер, возвращаются в очередь через LOCK_TIMEOUT.
+
+Задачи должны быть идемпотентными: при сбое после COMMIT задача может
+выполниться повторно. С ENABLED=False задача выполняется сразу при
+постановке, как было до очереди.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUE_SETTINGS = getattr(settings, 'JOB_QUEUE', {})
+
+ENABLED = JOB_QUEUE_SETTINGS.get('ENABLED', True)
+QUEUES = JOB_QUEUE_SETTINGS.get('QUEUES', {'default': 1})
+POLL_INTERVAL = JOB_QUEUE_SETTINGS.get('POLL_INTERVAL', 1.0)
+LOCK_TIMEOUT = JOB_QUEUE_SETTINGS.get('LOCK_TIMEOUT', 300)
+BACKOFF = JOB_QUEUE_SETTINGS.get('BACKOFF', 5)
+MAX_BACKOFF = JOB_QUEUE_SETTINGS.get('MAX_BACKOFF', 3600)
+
+TASKS = {}
+
+
+class Task:
+
+    def __init__(self, func, name, queue, max_attempts):
+        self.func = func
+        self.name = name
+        self.queue = queue
+        self.max_attempts = max_attempts
+
+    def __call__(self, **payload):
+        return self.func(**payload)
+
+
+def task(name, queue='default', max_attempts=5):
+    """Декоратор: зарегистрировать функцию как задачу; аргументы - из payload"""
+    def decorator(func):
+        TASKS[name] = Task(func, name, queue, max_attempts)
+        return func
+    return decorator
+
+
+def get_task(name):
+    try:
+        return TASKS[name]
+    except KeyError:
+        raise ValueError(f'Неизвестная задача {name}')
+
+
+def enqueue(name, payload=None, dedupe_key='', delay=0):
+    """
+    Поставить задачу в очередь в текущей транзакции. Если ожидающая задача
+    с тем же dedupe_key уже есть, новая не добавляется
+    """
+    from .models import Job
+
+    job_task = get_task(name)
+    payload = payload or {}
+    if not ENABLED:
+        job_task(**payload)
+        return
+    job = Job(
+        queue=job_task.queue,
+        name=name,
+        payload=payload,
+        dedupe_key=dedupe_key,
+        max_attempts=job_task.max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+    # ignore_conflicts: дубликат по частичному уникальному индексу молча
+    # пропускается, не ломая транзакцию вызывающего кода
+    Job.objects.bulk_create([job], ignore_conflicts=True)
+
+
+def get_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+def claim(queues, worker_id, candidates=20):
+    """
+    Захватить одну готовую задачу из queues; None, если нечего выполнять
+    или у всех очередей исчерпан лимит параллельности
+    """
+    from .models import Job
+
+    now = timezone.now()
+    ready = list(
+        Job.objects.filter(status=Job.PENDING, queue__in=queues, run_at__lte=now)
+        .order_by('run_at', 'id')
+        .values_list('id', 'queue')[:candidates]
+    )
+    running = (
+        Job.objects.filter(queue=OuterRef('queue'), status=Job.RUNNING)
+        .order_by()
+        .values('queue')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    for job_id, queue in ready:
+        claimed = (
+            Job.objects.filter(id=job_id, status=Job.PENDING)
+            .alias(running=Coalesce(Subquery(running), Value(0)))
+            .filter(running__lt=QUEUES.get(queue, 1))
+            .update(status=Job.RUNNING, locked_at=now, locked_by=worker_id, attempts=F('attempts') + 1)
+        )
+        if claimed:
+            return Job.objects.get(id=job_id)
+    return None
+
+
+def get_backoff(attempts):
+    """Задержка перед повтором: BACKOFF * 2^(попытка-1) со случайным разбросом"""
+    delay = min(BACKOFF * 2 ** (attempts - 1), MAX_BACKOFF)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def release(job, **fields):
+    """
+    Вернуть задачу в очередь. Если за это время поставили такую же
+    (dedupe_key), она и выполнится, а эта удаляется
+    """
+    from .models import Job
+
+    try:
+        with transaction.atomic():
+            Job.objects.filter(id=job.id).update(status=Job.PENDING, locked_at=None, locked_by='', **fields)
+    except IntegrityError:
+        Job.objects.filter(id=job.id).delete()
+
+
+def run_job(job):
+    """Выполнить захваченную задачу; True - успешно"""
+    from .models import Job
+
+    try:
+        job_task = get_task(job.name)
+        with transaction.atomic():
+            job_task(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            logger.error('Задача %s #%s не выполнена после %s попыток', job.name, job.id, job.attempts)
+            Job.objects.filter(id=job.id).update(status=Job.FAILED, locked_at=None, last_error=error)
+        else:
+            logger.warning('Задача %s #%s: ошибка, повтор', job.name, job.id)
+            run_at = timezone.now() + timedelta(seconds=get_backoff(job.attempts))
+            release(job, run_at=run_at, last_error=error)
+        return False
+    Job.objects.filter(id=job.id).delete()
+    return True
+
+
+def requeue_stale():
+    """Вернуть в очередь задачи, чей воркер не отвечает дольше LOCK_TIMEOUT"""
+    from .models import Job
+
+    deadline = timezone.now() - timedelta(seconds=LOCK_TIMEOUT)
+    stale = list(Job.objects.filter(status=Job.RUNNING, locked_at__lt=deadline))
+    for job in stale:
+        if job.attempts >= job.max_attempts:
+            Job.objects.filter(id=job.id, status=Job.RUNNING).update(
+                status=Job.FAILED, locked_at=None, last_error='Воркер не завершил задачу'
+            )
+        else:
+            release(job)
+    return len(stale)
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from my_siteApp import rendering
+from my_siteApp.models import Article
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет Article.excerpt и Article.rendered_html для строк, где они пусты '
+        '(например, записанных в обход модели). С --all пересчитывает все статьи'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько статей обновлять за один запрос',
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересчитать все статьи (после изменения правил отображения)',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        updated = rendering.backfill(
+            Article, batch_size=options['batch_size'], only_missing=not options['all']
+        )
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено статей: {updated} за {elapsed:.2f} с'
+        ))
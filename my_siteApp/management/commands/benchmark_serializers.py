@@ -0,0 +1,113 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from my_siteApp.models import Article, Comment
+from my_siteApp.renderers import ORJSONRenderer
+from my_siteApp.serializers import ArticleSerializer, CommentSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает чтение списков обычным сериализатором DRF + JSONRenderer и '
+        'быстрым путем (.values() + ORJSONRenderer) на N статьях и N комментариях. '
+        'Данные создаются во временной транзакции и откатываются; ответы обоих '
+        'путей сверяются побайтно'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='1000,10000,100000',
+            help='Число строк через запятую',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help='Сколько раз повторять замер (берется лучший)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes: ожидаются числа через запятую')
+        if any(size <= 0 for size in sizes) or options['repeat'] <= 0:
+            raise CommandError('--sizes и --repeat должны быть положительными')
+
+        self.stdout.write(
+            f'{"список":<10}{"строк":>8}{"DRF, мс":>12}{"быстрый, мс":>14}{"ускорение":>12}'
+        )
+        for size in sizes:
+            with transaction.atomic():
+                articles, comments = self.create_rows(size)
+                for name, serializer_class, queryset in (
+                    ('articles', ArticleSerializer, articles),
+                    ('comments', CommentSerializer, comments),
+                ):
+                    slow, fast = self.measure(serializer_class, queryset, options['repeat'])
+                    self.stdout.write(
+                        f'{name:<10}{size:>8}{slow * 1000:>12.1f}{fast * 1000:>14.1f}'
+                        f'{slow / fast:>11.1f}x'
+                    )
+                transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS('Ответы обоих путей совпадают побайтно'))
+
+    def create_rows(self, size):
+        user = User.objects.create_user(f'benchmark-{time.time_ns()}')
+        now = timezone.now()
+        articles = []
+        for i in range(size):
+            article = Article(
+                title=f'Статья {i}',
+                text=f'Текст статьи {i}. ' * 20,
+                category=Article.CATEGORY_CHOICES[i % len(Article.CATEGORY_CHOICES)][0],
+                user=user,
+                created_date=now,
+                comment_count=1,
+            )
+            article.update_rendered_fields()
+            articles.append(article)
+        Article.objects.bulk_create(articles, batch_size=1000)
+        Comment.objects.bulk_create(
+            [
+                Comment(article=article, text=f'Комментарий {i}', author_name='Гость', created_date=now)
+                for i, article in enumerate(articles)
+            ],
+            batch_size=1000,
+        )
+        ordering = ('-created_date', '-id')
+        return (
+            Article.objects.filter(user=user).order_by(*ordering),
+            Comment.objects.filter(article__user=user).order_by(*ordering),
+        )
+
+    def measure(self, serializer_class, queryset, repeat):
+        """Лучшее время (запрос + сериализация + JSON) для обоих путей, в секундах"""
+        serializer = serializer_class(list_mode=True)
+
+        def drf_path():
+            rows = list(serializer.optimize_queryset(queryset))
+            data = serializer_class(rows, many=True, list_mode=True).data
+            return JSONRenderer().render(data)
+
+        def fast_path():
+            rows = list(serializer.get_values_queryset(queryset))
+            return ORJSONRenderer().render(serializer.represent_values(rows))
+
+        slow = fast = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            expected = drf_path()
+            slow = min(slow, time.perf_counter() - started)
+
+            started = time.perf_counter()
+            actual = fast_path()
+            fast = min(fast, time.perf_counter() - started)
+
+            if actual != expected:
+                raise CommandError(f'{serializer_class.__name__}: ответы путей различаются')
+        return slow, fast
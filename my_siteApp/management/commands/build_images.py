@@ -0,0 +1,46 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from my_siteApp import images
+
+
+class Command(BaseCommand):
+    help = (
+        'Собирает адаптивные копии (AVIF/WebP/JPEG нескольких ширин) изображений '
+        'из static/images в static/responsive и обновляет manifest.json. '
+        'Пересобираются только изменившиеся исходники'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересобрать все изображения',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            raise CommandError('Для сборки изображений нужен Pillow: pip install Pillow')
+
+        formats = images.supported_formats()
+        missing = [fmt for fmt in images.FORMATS if fmt not in formats]
+        if missing:
+            self.stderr.write(f'Pillow без поддержки {", ".join(missing)}, эти форматы пропущены')
+
+        built, skipped = images.build_all(force=options['force'], log=self.log_image)
+        self.stdout.write(self.style.SUCCESS(
+            f'Собрано изображений: {built}, без изменений: {skipped}'
+        ))
+
+    def log_image(self, path, entry):
+        source_size = os.path.getsize(os.path.join(images.ROOT, path))
+        smallest = min(
+            os.path.getsize(os.path.join(images.ROOT, name))
+            for name in images.output_files(entry)
+        )
+        self.stdout.write(
+            f'{path}: {entry["width"]}x{entry["height"]}, {source_size // 1024} КБ, '
+            f'самая легкая копия {smallest // 1024} КБ'
+        )
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from my_siteApp.tokens import blacklist_filter
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет просроченные выданные и отозванные токены пачками. '
+        'Запускать по расписанию (cron/systemd timer), например раз в сутки'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько токенов удалять в одной транзакции',
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0.0,
+            help='Пауза между пачками в секундах, чтобы не блокировать запись надолго',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        now = timezone.now()
+        outstanding_deleted = blacklisted_deleted = 0
+
+        while True:
+            ids = list(
+                OutstandingToken.objects.filter(expires_at__lte=now)
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            with transaction.atomic():
+                blacklisted_deleted += BlacklistedToken.objects.filter(token_id__in=ids).delete()[0]
+                outstanding_deleted += OutstandingToken.objects.filter(id__in=ids).delete()[0]
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        if blacklisted_deleted:
+            blacklist_filter.reset_epoch()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено выданных токенов: {outstanding_deleted}, отозванных: {blacklisted_deleted}'
+        ))
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from my_siteApp import export
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка статей или комментариев в NDJSON или JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(export.EXPORTERS), help='Что выгружать')
+        parser.add_argument(
+            '--format', dest='export_format', choices=sorted(export.FORMATS), default='ndjson',
+            help='NDJSON (по строке на объект) или JSON-массив',
+        )
+        parser.add_argument('--category', help='Только статьи этой категории (для комментариев - их статей)')
+        parser.add_argument('--date-from', help='Начало диапазона created_date (ISO 8601)')
+        parser.add_argument('--date-to', help='Конец диапазона created_date включительно (ISO 8601)')
+        parser.add_argument('--output', '-o', help='Файл для записи (по умолчанию stdout)')
+        parser.add_argument(
+            '--chunk-size', type=int, default=export.CHUNK_SIZE,
+            help='Сколько строк читать из базы за раз',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            filters = export.get_filters(
+                category=options['category'],
+                date_from=options['date_from'],
+                date_to=options['date_to'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        chunks = export.stream(
+            options['kind'], options['export_format'],
+            chunk_size=options['chunk_size'], **filters
+        )
+        started = time.monotonic()
+        written = 0
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+                    written += len(chunk)
+            # Сводка в stderr, чтобы не смешивать ее с данными при выводе в stdout
+            self.stderr.write(
+                f'Записано {written} символов в {options["output"]} '
+                f'за {time.monotonic() - started:.1f} с'
+            )
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,258 @@
+import csv
+import json
+import sys
+import time
+from collections import Counter
+from itertools import islice
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from my_siteApp.models import Article, Comment, UserProfile
+
+KINDS = ('users', 'articles', 'comments')
+FORMATS = ('ndjson', 'csv')
+
+# Поля, которые в NDJSON должны быть строками (или отсутствовать/null).
+# В CSV все значения - строки; ключи article (id) и username приводятся сами
+STRING_FIELDS = {
+    'users': ('email', 'first_name', 'last_name', 'password'),
+    'articles': ('title', 'text', 'category', 'author', 'created_date'),
+    'comments': ('text', 'author_name', 'created_date'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Быстрая загрузка пользователей, статей или комментариев из NDJSON или CSV. '
+        'Поля: users - username, email, first_name, last_name, password (готовый хеш '
+        'Django; обычный пароль тоже примется, но хеширование медленное); '
+        'articles - title, text, category, author (username), created_date; '
+        'comments - article (id), text, author_name, created_date'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=KINDS, help='Что загружать')
+        parser.add_argument('path', help='Файл с данными, "-" - stdin')
+        parser.add_argument(
+            '--format', dest='input_format', choices=FORMATS,
+            help='Формат входа (по умолчанию - по расширению файла)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк записывать в одной транзакции',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        input_format = options['input_format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        batch_size = options['batch_size']
+        if batch_size <= 0:
+            raise CommandError('--batch-size должен быть положительным')
+
+        importer = getattr(self, f'import_{options["kind"]}')
+        self.skipped = 0
+        processed = created = 0
+        started = time.monotonic()
+
+        with self.open_input(path) as source:
+            rows = self.read_rows(source, input_format)
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                with transaction.atomic():
+                    created += importer(batch)
+                processed += len(batch)
+                if options['verbosity'] >= 2:
+                    self.stdout.write(f'{processed} строк, {self.rate(processed, started):.0f} строк/с')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: {created}, пропущено: {self.skipped} из {processed} строк '
+            f'за {elapsed:.1f} с ({self.rate(processed, started):.0f} строк/с)'
+        ))
+
+    @staticmethod
+    def rate(rows, started):
+        return rows / max(time.monotonic() - started, 1e-6)
+
+    def open_input(self, path):
+        if path == '-':
+            # stdin не закрываем
+            return open(sys.stdin.fileno(), encoding='utf-8', newline='', closefd=False)
+        try:
+            return open(path, encoding='utf-8', newline='')
+        except OSError as e:
+            raise CommandError(f'Не удалось открыть {path}: {e}')
+
+    def read_rows(self, source, input_format):
+        """Построчное чтение: пары (номер строки, словарь полей)"""
+        if input_format == 'csv':
+            reader = csv.DictReader(source)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for number, line in enumerate(source, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                raise CommandError(f'Строка {number}: неверный JSON')
+            if not isinstance(row, dict):
+                raise CommandError(f'Строка {number}: ожидается объект')
+            yield number, row
+
+    def skip(self, number, reason):
+        self.skipped += 1
+        self.stderr.write(f'Строка {number}: {reason}')
+
+    def check_types(self, kind, batch):
+        """Строки пачки, у которых поля STRING_FIELDS[kind] - строки; остальные пропускаются"""
+        valid = []
+        for number, row in batch:
+            wrong = [
+                name for name in STRING_FIELDS[kind]
+                if row.get(name) is not None and not isinstance(row[name], str)
+            ]
+            if wrong:
+                self.skip(number, f'должны быть строками: {", ".join(wrong)}')
+            else:
+                valid.append((number, row))
+        return valid
+
+    def parse_created_date(self, number, value):
+        """created_date из строки; None - ошибка (строка пропущена)"""
+        if not value:
+            return timezone.now()
+        try:
+            moment = parse_datetime(value)
+        except ValueError:
+            moment = None
+        if moment is None:
+            self.skip(number, f'неверная дата {value}')
+            return None
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    @staticmethod
+    def get_password(value):
+        if not value:
+            return make_password(None)
+        try:
+            identify_hasher(value)
+        except ValueError:
+            return make_password(value)
+        return value
+
+    def import_users(self, batch):
+        batch = self.check_types('users', batch)
+        usernames = {str(row.get('username') or '').strip() for _, row in batch}
+        # Один запрос на пачку: какие имена уже заняты
+        taken = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+
+        users = []
+        for number, row in batch:
+            username = str(row.get('username') or '').strip()
+            if not username:
+                self.skip(number, 'не указан username')
+                continue
+            if username in taken:
+                self.skip(number, f'пользователь {username} уже существует')
+                continue
+            taken.add(username)
+            users.append(User(
+                username=username,
+                email=row.get('email') or '',
+                first_name=row.get('first_name') or '',
+                last_name=row.get('last_name') or '',
+                password=self.get_password(row.get('password')),
+            ))
+
+        # bulk_create не отправляет post_save, поэтому профили создаем сами
+        User.objects.bulk_create(users)
+        UserProfile.objects.bulk_create([UserProfile(user=user) for user in users])
+        return len(users)
+
+    def import_articles(self, batch):
+        batch = self.check_types('articles', batch)
+        usernames = {row.get('author') for _, row in batch if row.get('author')}
+        authors = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+        categories = dict(Article.CATEGORY_CHOICES)
+        max_title = Article._meta.get_field('title').max_length
+
+        articles = []
+        for number, row in batch:
+            author_id = authors.get(row.get('author'))
+            title = row.get('title') or ''
+            category = row.get('category') or 'news'
+            if author_id is None:
+                self.skip(number, f'автор {row.get("author")} не найден')
+                continue
+            if not title or len(title) > max_title:
+                self.skip(number, 'пустой или слишком длинный заголовок')
+                continue
+            if category not in categories:
+                self.skip(number, f'неверная категория {category}')
+                continue
+            created_date = self.parse_created_date(number, row.get('created_date'))
+            if created_date is None:
+                continue
+            article = Article(
+                title=title,
+                text=row.get('text') or '',
+                category=category,
+                user_id=author_id,
+                created_date=created_date,
+            )
+            article.update_rendered_fields()
+            articles.append(article)
+
+        Article.objects.bulk_create(articles)
+        Article.after_bulk_save(articles)
+        return len(articles)
+
+    def import_comments(self, batch):
+        batch = self.check_types('comments', batch)
+        article_ids = set()
+        for _, row in batch:
+            try:
+                article_ids.add(int(row.get('article')))
+            except (TypeError, ValueError):
+                pass
+        existing = set(Article.objects.filter(id__in=article_ids).values_list('id', flat=True))
+        max_author = Comment._meta.get_field('author_name').max_length
+
+        comments = []
+        for number, row in batch:
+            try:
+                article_id = int(row.get('article'))
+            except (TypeError, ValueError):
+                article_id = None
+            author_name = row.get('author_name') or ''
+            if article_id not in existing:
+                self.skip(number, f'статья {row.get("article")} не найдена')
+                continue
+            if not row.get('text') or not author_name or len(author_name) > max_author:
+                self.skip(number, 'пустой текст или неверное имя автора')
+                continue
+            created_date = self.parse_created_date(number, row.get('created_date'))
+            if created_date is None:
+                continue
+            comments.append(Comment(
+                article_id=article_id,
+                text=row['text'],
+                author_name=author_name,
+                created_date=created_date,
+            ))
+
+        Comment.objects.bulk_create(comments)
+        Article.adjust_comment_counts(Counter(comment.article_id for comment in comments))
+        Comment.after_bulk_save(comments)
+        return len(comments)
@@ -0,0 +1,94 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from my_siteApp import pagecache
+from my_siteApp.models import Article, Comment
+
+
+def actual_comment_count():
+    """Подзапрос COUNT(*) комментариев статьи для UPDATE ... SET comment_count = (...)"""
+    counts = (
+        Comment.objects.filter(article_id=OuterRef('pk'))
+        .order_by()
+        .values('article_id')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counts), Value(0))
+
+
+class Command(BaseCommand):
+    help = 'Сверяет Article.comment_count с реальным числом комментариев и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько статей проверять за один проход',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения, ничего не записывать',
+        )
+
+    def find_drifted(self, batch):
+        """Статьи пачки, у которых счетчик расходится с числом комментариев: {id: число}"""
+        ids = [article_id for article_id, _, _ in batch]
+        actual = dict(
+            Comment.objects.filter(article_id__in=ids)
+            .order_by()
+            .values('article_id')
+            .annotate(total=Count('id'))
+            .values_list('article_id', 'total')
+        )
+        return {
+            article_id: actual.get(article_id, 0)
+            for article_id, stored, _ in batch
+            if stored != actual.get(article_id, 0)
+        }
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        checked = fixed = 0
+        last_id = 0
+
+        while True:
+            batch = list(
+                Article.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'comment_count', 'category')[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            checked += len(batch)
+
+            drifted = self.find_drifted(batch)
+            if not drifted:
+                continue
+
+            fixed += len(drifted)
+            for article_id, total in drifted.items():
+                self.stdout.write(f'Статья {article_id}: comment_count -> {total}')
+            if not dry_run:
+                # Счетчик пересчитывается в самом UPDATE, а не записывается
+                # прочитанным выше значением: комментарий, добавленный или
+                # удаленный за время прохода, не затирается
+                with transaction.atomic():
+                    Article.objects.filter(pk__in=drifted).update(
+                        comment_count=actual_comment_count(), updated_at=timezone.now()
+                    )
+                    # UPDATE не отправляет сигналов - кеш страниц сбрасывается здесь
+                    pagecache.invalidate_articles([
+                        Article(id=article_id, category=category)
+                        for article_id, _, category in batch
+                        if article_id in drifted
+                    ])
+
+        action = 'Найдено' if dry_run else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено статей: {checked}. {action} расхождений: {fixed}'
+        ))
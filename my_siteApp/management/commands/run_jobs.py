@@ -0,0 +1,114 @@
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from my_siteApp import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        'Воркер очереди фоновых задач (my_siteApp.jobs): захватывает готовые задачи '
+        'и выполняет их в нескольких потоках. Лимиты параллельности очередей '
+        '(JOB_QUEUE["QUEUES"]) общие для всех запущенных воркеров. SIGTERM/SIGINT - '
+        'дождаться текущих задач и выйти'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queues',
+            help='Очереди через запятую (по умолчанию все из JOB_QUEUE["QUEUES"])',
+        )
+        parser.add_argument(
+            '--threads', type=int, default=None,
+            help='Сколько задач выполнять одновременно в этом процессе '
+                 '(по умолчанию - сумма лимитов выбранных очередей)',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить все готовые задачи и выйти',
+        )
+
+    def handle(self, *args, **options):
+        if options['queues']:
+            queues = [queue.strip() for queue in options['queues'].split(',') if queue.strip()]
+        else:
+            queues = list(jobs.QUEUES)
+        unknown = set(queues) - set(jobs.QUEUES)
+        if unknown:
+            raise CommandError(f'Неизвестные очереди: {", ".join(sorted(unknown))}')
+        threads = options['threads'] or sum(jobs.QUEUES[queue] for queue in queues)
+        if threads <= 0:
+            raise CommandError('--threads должен быть положительным')
+
+        self.once = options['once']
+        self.verbosity = options['verbosity']
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.done = self.failed = 0
+        if not self.once:
+            signal.signal(signal.SIGTERM, self.request_stop)
+            signal.signal(signal.SIGINT, self.request_stop)
+
+        started = time.monotonic()
+        stale = jobs.requeue_stale()
+        self.last_stale_check = time.monotonic()
+        if stale:
+            self.stdout.write(f'Возвращено в очередь зависших задач: {stale}')
+        if not self.once:
+            self.stdout.write(f'Очереди: {", ".join(queues)}, потоков: {threads}')
+
+        workers = [
+            threading.Thread(target=self.work, args=(queues,), name=f'job-worker-{i}')
+            for i in range(threads)
+        ]
+        for worker in workers:
+            worker.start()
+        # Главный поток только ждет: так сигналы обрабатываются сразу
+        while any(worker.is_alive() for worker in workers):
+            for worker in workers:
+                worker.join(timeout=0.5)
+            if not self.once and not self.stop.is_set():
+                self.requeue_stale_periodically()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Выполнено задач: {self.done}, с ошибкой: {self.failed} за {elapsed:.1f} с'
+        ))
+
+    def request_stop(self, signum, frame):
+        self.stdout.write('Остановка: ждем завершения текущих задач')
+        self.stop.set()
+
+    def requeue_stale_periodically(self):
+        if time.monotonic() - self.last_stale_check < jobs.LOCK_TIMEOUT:
+            return
+        self.last_stale_check = time.monotonic()
+        jobs.requeue_stale()
+
+    def work(self, queues):
+        worker_id = jobs.get_worker_id()
+        try:
+            while not self.stop.is_set():
+                job = jobs.claim(queues, worker_id)
+                if job is None:
+                    if self.once:
+                        return
+                    self.stop.wait(jobs.POLL_INTERVAL)
+                    continue
+                started = time.monotonic()
+                ok = jobs.run_job(job)
+                with self.lock:
+                    if ok:
+                        self.done += 1
+                    else:
+                        self.failed += 1
+                if self.verbosity >= 2:
+                    status = 'ok' if ok else 'ошибка'
+                    self.stdout.write(
+                        f'{job.name} #{job.id} ({job.queue}): {status}, {time.monotonic() - started:.2f} с'
+                    )
+        finally:
+            connection.close()
@@ -1,37 +1,54 @@
 from django.utils.deprecation import MiddlewareMixin
 from django.http import JsonResponse
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from .authentication import CachedJWTAuthentication
 from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
 from django.contrib.auth.models import AnonymousUser
 
 class JWTAuthenticationMiddleware(MiddlewareMixin):
+    """
+    Работает и в WSGI, и в ASGI. Под ASGI MiddlewareMixin выполнял бы
+    process_request в пуле потоков на каждый запрос, поэтому здесь свой
+    __acall__: токен проверяется в цикле событий, в поток уходит только
+    загрузка пользователя при промахе кеша
+    """
+    jwt_auth = CachedJWTAuthentication()
     
-    def process_request(self, request):
+    def should_authenticate(self, request):
         if request.path.startswith('/admin/') or \
             request.path.startswith('/static/') or \
             request.path.startswith('/media/'):
-            return None
-        
-        if request.path.startswith('/api/'):
+            return False
+        return request.path.startswith('/api/')
+
+    def set_auth_result(self, request, auth_result):
+        if auth_result is not None:
+            user, token = auth_result
+            request.user = user
+            request.jwt_token = token
+        else:
+            request.user = AnonymousUser()
+
+    def process_request(self, request):
+        if self.should_authenticate(request):
             try:
-                jwt_auth = JWTAuthentication()
-                auth_result = jwt_auth.authenticate(request)
-                
-                if auth_result is not None:
-                    user, token = auth_result
-                    request.user = user
-                    request.jwt_token = token
-                else:
-                    request.user = AnonymousUser()
+                self.set_auth_result(request, self.jwt_auth.authenticate(request))
             except (InvalidToken, AuthenticationFailed) as e:
                 request.user = AnonymousUser()
         
         return None
 
+    async def __acall__(self, request):
+        if self.should_authenticate(request):
+            try:
+                self.set_auth_result(request, await self.jwt_auth.aauthenticate(request))
+            except (InvalidToken, AuthenticationFailed):
+                request.user = AnonymousUser()
+        return await self.get_response(request)
+
     def process_exception(self, request, exception):
         if isinstance(exception, (InvalidToken, AuthenticationFailed)):
             return JsonResponse({
                 'error': 'Неверный или просроченный токен',
                 'detail': str(exception)
             }, status=401)
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+from my_siteApp.search import FTS_TABLE, ARTICLE_TABLE, CREATE_TABLE_SQL, DROP_TABLE_SQL, is_supported
+
+
+def create_search_index(apps, schema_editor):
+    if not is_supported(schema_editor.connection):
+        return
+    schema_editor.execute(CREATE_TABLE_SQL)
+    schema_editor.execute(
+        f"INSERT INTO {FTS_TABLE} (rowid, title, text) "
+        f"SELECT id, title, text FROM {ARTICLE_TABLE}"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(DROP_TABLE_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_siteApp', '0003_article_comment_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:56
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_comment_count(apps, schema_editor):
+    Article = apps.get_model('my_siteApp', 'Article')
+    Comment = apps.get_model('my_siteApp', 'Comment')
+    counts = (
+        Comment.objects.filter(article=OuterRef('pk'))
+        .order_by()
+        .values('article')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    Article.objects.update(comment_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_siteApp', '0005_article_comment_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Число комментариев'),
+        ),
+        migrations.RunPython(fill_comment_count, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['comment_count', 'id'], name='article_comments_id_idx'),
+        ),
+    ]
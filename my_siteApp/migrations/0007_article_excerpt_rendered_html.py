@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:14
+
+from django.db import migrations, models
+
+from my_siteApp import rendering
+
+
+def fill_rendered_fields(apps, schema_editor):
+    rendering.backfill(apps.get_model('my_siteApp', 'Article'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_siteApp', '0006_article_comment_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='excerpt',
+            field=models.TextField(blank=True, editable=False, verbose_name='Начало текста'),
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='rendered_html',
+            field=models.TextField(blank=True, editable=False, verbose_name='Текст в HTML'),
+        ),
+        migrations.RunPython(fill_rendered_fields, migrations.RunPython.noop),
+    ]
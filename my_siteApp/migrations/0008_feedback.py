@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:27
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_siteApp', '0007_article_excerpt_rendered_html'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Feedback',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Имя')),
+                ('email', models.EmailField(max_length=254, verbose_name='Email')),
+                ('message', models.TextField(verbose_name='Сообщение')),
+                ('created_date', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата отправки')),
+            ],
+            options={
+                'verbose_name': 'Обращение',
+                'verbose_name_plural': 'Обращения',
+                'ordering': ['-created_date'],
+                'indexes': [models.Index(fields=['created_date', 'id'], name='feedback_created_id_idx')],
+            },
+        ),
+    ]
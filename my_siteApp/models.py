@@ -1,8 +1,17 @@
 from django.db import models
+from django.db.models import F, Q, Case, When, Value
+from django.db.models.functions import Greatest
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
+from . import search
+from . import pagecache
+from . import rendering
+from .buffers import create_buffer
+from .authentication import user_cache
+from .tokens import blacklist_filter
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -11,14 +20,111 @@ class UserProfile(models.Model):
     def __str__(self):
         return self.user.username
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_values = instance.get_field_values()
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._saved_values = self.get_field_values()
+
+    def get_field_values(self):
+        return {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields}
+
+    def get_changed_fields(self):
+        """Поля, измененные после загрузки или сохранения"""
+        saved = getattr(self, '_saved_values', {})
+        return [
+            name for name, value in self.get_field_values().items()
+            if name not in saved or saved[name] != value
+        ]
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.userprofile.save()
+def save_user_profile(sender, instance, created, **kwargs):
+    # Профиль сохраняется вместе с пользователем, только если он уже
+    # загружен и его поля изменились: обычное сохранение User (вход,
+    # смена пароля) не читает и не пишет профиль
+    if created or not User.userprofile.is_cached(instance):
+        return
+    profile = instance.userprofile
+    if profile.pk is None:
+        profile.save()
+        return
+    changed = [name for name in profile.get_changed_fields() if name != 'id']
+    if changed:
+        profile.save(update_fields=changed)
+
+def write_last_logins(items):
+    """Пачка (id пользователя, время входа) одним UPDATE; post_save не отправляется"""
+    users = [User(pk=user_id, last_login=last_login) for user_id, last_login in items]
+    User.objects.bulk_update(users, ['last_login'])
+    for user in users:
+        user_cache.invalidate_user(user.pk)
+
+last_login_buffer = create_buffer(write_last_logins, 'last_login')
+
+def record_last_login(sender, user, **kwargs):
+    """
+    Замена django.contrib.auth.models.update_last_login: время входа
+    попадает в буфер (повторные входы одного пользователя схлопываются),
+    а не в UPDATE auth_user на каждый вход. Подключается в apps.py
+    """
+    user.last_login = timezone.now()
+    last_login_buffer.add((user.pk, user.last_login), key=user.pk)
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate_user(instance.pk)
+
+# Поля автора, которые видны в ответах о статьях (author_name, author_details)
+AUTHOR_FIELDS = ['username', 'email', 'first_name', 'last_name']
+
+@receiver(pre_save, sender=User)
+def check_author_fields(sender, instance, update_fields=None, **kwargs):
+    instance._author_changed = False
+    if instance.pk is None or kwargs.get('raw'):
+        return
+    if update_fields is not None and not set(AUTHOR_FIELDS) & set(update_fields):
+        return
+    saved = User.objects.filter(pk=instance.pk).values(*AUTHOR_FIELDS).first()
+    instance._author_changed = saved is not None and any(
+        saved[name] != getattr(instance, name) for name in AUTHOR_FIELDS
+    )
+
+@receiver(post_save, sender=User)
+def touch_author_articles(sender, instance, created, **kwargs):
+    """
+    Смена имени или email автора меняет ответы о его статьях: обновляем
+    их updated_at (от него считаются ETag) и сбрасываем кеш страниц
+    """
+    if created or not getattr(instance, '_author_changed', False):
+        return
+    instance._author_changed = False
+    articles = Article.objects.filter(user=instance)
+    articles.update(updated_at=timezone.now())
+    pagecache.invalidate_articles(list(articles.only('id', 'category')))
+
+@receiver(post_save, sender=BlacklistedToken)
+def add_blacklisted_jti(sender, instance, created, **kwargs):
+    if created:
+        blacklist_filter.add(instance.token.jti)
+
+class ArticleQuerySet(models.QuerySet):
+    def with_card_data(self):
+        """
+        Статьи с автором (JOIN) для карточек списка, без запросов на каждую
+        карточку; число комментариев берется из comment_count, текст - из
+        excerpt, поэтому полный текст не читается
+        """
+        return self.select_related('user').defer('text', 'rendered_html')
 
 class Article(models.Model):
     CATEGORY_CHOICES = [
@@ -30,6 +136,10 @@ class Article(models.Model):
     title = models.CharField(max_length=200, verbose_name="Заголовок")
     text = models.TextField(verbose_name="Текст статьи")
     created_date = models.DateTimeField(default=timezone.now, verbose_name="Дата создания")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Дата изменения")
+    comment_count = models.PositiveIntegerField(default=0, verbose_name="Число комментариев")
+    excerpt = models.TextField(blank=True, editable=False, verbose_name="Начало текста")
+    rendered_html = models.TextField(blank=True, editable=False, verbose_name="Текст в HTML")
     category = models.CharField(
         max_length=20, 
         choices=CATEGORY_CHOICES, 
@@ -44,11 +154,99 @@ class Article(models.Model):
         verbose_name="Автор"
     )
     
+    objects = ArticleQuerySet.as_manager()
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Категория на момент загрузки - чтобы при ее смене сбросить кеш старого списка
+        instance._loaded_category = instance.__dict__.get('category')
+        return instance
+    
     def __str__(self):
         return self.title
     
+    RENDERED_FIELDS = ['excerpt', 'rendered_html']
+    
+    def update_rendered_fields(self):
+        """Пересчитать excerpt и rendered_html из text (перед bulk_create/bulk_update)"""
+        self.excerpt = rendering.make_excerpt(self.text)
+        self.rendered_html = rendering.render_html(self.text)
+    
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            # Если text не загружен (defer), он и не сохраняется - пересчитывать нечего
+            if 'text' not in self.get_deferred_fields():
+                self.update_rendered_fields()
+        elif 'text' in update_fields:
+            self.update_rendered_fields()
+            kwargs['update_fields'] = {*update_fields, *self.RENDERED_FIELDS}
+        super().save(*args, **kwargs)
+    
     class Meta:
         ordering = ['-created_date']
+        indexes = [
+            models.Index(fields=['created_date', 'id'], name='article_created_id_idx'),
+            models.Index(fields=['category', 'created_date', 'id'], name='article_cat_created_id_idx'),
+            models.Index(fields=['comment_count', 'id'], name='article_comments_id_idx'),
+        ]
+    
+    @classmethod
+    def adjust_comment_count(cls, article_id, delta):
+        """
+        Атомарно меняет счетчик комментариев (UPDATE ... SET comment_count =
+        comment_count + delta) и обновляет updated_at, чтобы сбросились ETag.
+        Возвращает число обновленных статей (0 - статьи уже нет)
+        """
+        return cls.adjust_comment_counts({article_id: delta})
+    
+    @classmethod
+    def adjust_comment_counts(cls, deltas):
+        """То же для нескольких статей одним UPDATE: {article_id: delta}"""
+        deltas = {article_id: delta for article_id, delta in deltas.items() if delta}
+        if not deltas:
+            return 0
+        # Ветка CASE на каждое значение delta, а не на каждую статью: при
+        # массовой загрузке различных значений единицы, а статей тысячи
+        by_delta = {}
+        for article_id, delta in deltas.items():
+            by_delta.setdefault(delta, []).append(article_id)
+        # Не ниже нуля: счетчик мог разойтись с реальностью (см. команду
+        # reconcile_comment_counts), и удаление комментария не должно падать
+        # на CHECK положительного поля
+        return cls.objects.filter(pk__in=deltas).update(
+            comment_count=Greatest(
+                F('comment_count') + Case(
+                    *[When(pk__in=ids, then=Value(delta)) for delta, ids in by_delta.items()],
+                    default=Value(0),
+                ),
+                Value(0),
+            ),
+            updated_at=timezone.now(),
+        )
+    
+    @classmethod
+    def after_bulk_save(cls, articles):
+        """
+        Побочные эффекты post_save для статей, записанных через
+        bulk_create/bulk_update (эти методы сигналы не отправляют)
+        """
+        search.enqueue_reindex([article.pk for article in articles])
+        pagecache.invalidate_articles(articles)
+    
+    @classmethod
+    def bulk_delete(cls, articles):
+        """
+        Удалить статьи вместе с комментариями двумя DELETE. QuerySet.delete()
+        отправил бы post_delete на каждую статью (и задачу переиндексации на
+        каждую), поэтому побочные эффекты выполняются здесь одним пакетом
+        """
+        ids = [article.pk for article in articles]
+        Comment.objects.filter(article_id__in=ids)._raw_delete(Comment.objects.db)
+        cls.objects.filter(pk__in=ids)._raw_delete(cls.objects.db)
+        search.enqueue_reindex(ids)
+        pagecache.invalidate_articles(articles)
     
     def can_user_create_article(user, category):
         """
@@ -78,6 +276,7 @@ class Comment(models.Model):
     text = models.TextField(verbose_name="Текст комментария")
     created_date = models.DateTimeField(default=timezone.now, verbose_name="Дата создания")
     author_name = models.CharField(max_length=100, verbose_name="Имя автора")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Дата изменения")
     
     article = models.ForeignKey(
         Article,
@@ -89,5 +288,111 @@ class Comment(models.Model):
     def __str__(self):
         return f"Комментарий от {self.author_name}"
     
+    @classmethod
+    def after_bulk_save(cls, comments):
+        """Побочные эффекты post_save для комментариев из bulk_create/bulk_update"""
+        pagecache.invalidate_comments(comments, dict(Article.CATEGORY_CHOICES))
+    
+    @classmethod
+    def bulk_delete(cls, comments):
+        """Удалить комментарии одним DELETE без post_delete на каждый (см. Article.bulk_delete)"""
+        cls.objects.filter(pk__in=[comment.pk for comment in comments])._raw_delete(cls.objects.db)
+        pagecache.invalidate_comments(comments, dict(Article.CATEGORY_CHOICES))
+    
+    class Meta:
+        ordering = ['created_date']
+        indexes = [
+            models.Index(fields=['created_date', 'id'], name='comment_created_id_idx'),
+        ]
+
+# Индекс обновляется в фоне (run_jobs), одна задача на статью, сколько бы
+# сохранений ни было до ее запуска. Статья и задача попадают в базу вместе,
+# только если вызывающий код держит transaction.atomic: save() сам транзакцию
+# не открывает, и в autocommit post_save срабатывает уже после COMMIT статьи
+@receiver(post_save, sender=Article)
+@receiver(post_delete, sender=Article)
+def reindex_article(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {'title', 'text'} & set(update_fields):
+        return
+    search.enqueue_reindex([instance.pk])
+
+@receiver(post_save, sender=Article)
+@receiver(post_delete, sender=Article)
+def invalidate_article_pages(sender, instance, **kwargs):
+    pagecache.invalidate_article(instance)
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_pages(sender, instance, **kwargs):
+    # При каскадном удалении статьи ее страницы уже сброшены
+    if isinstance(kwargs.get('origin'), Article):
+        return
+    pagecache.invalidate_comment(instance, dict(Article.CATEGORY_CHOICES))
+
+class Feedback(models.Model):
+    name = models.CharField(max_length=100, verbose_name="Имя")
+    email = models.EmailField(verbose_name="Email")
+    message = models.TextField(verbose_name="Сообщение")
+    # Время отправки формы, а не записи пачки в базу
+    created_date = models.DateTimeField(default=timezone.now, verbose_name="Дата отправки")
+    
+    def __str__(self):
+        return f"Сообщение от {self.name}"
+    
+    class Meta:
+        ordering = ['-created_date']
+        verbose_name = "Обращение"
+        verbose_name_plural = "Обращения"
+        indexes = [
+            models.Index(fields=['created_date', 'id'], name='feedback_created_id_idx'),
+        ]
+
+def write_feedback(items):
+    Feedback.objects.bulk_create(items)
+
+# Обращения из формы пишутся пачками: всплеск отправок не дает COMMIT на
+# каждую, а остаток записывается при остановке процесса
+feedback_buffer = create_buffer(write_feedback, 'feedback')
+
+class Job(models.Model):
+    """Фоновая задача (my_siteApp.jobs); выполненные задачи удаляются"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Ошибка'),
+    ]
+    
+    queue = models.CharField(max_length=50, default='default', verbose_name="Очередь")
+    name = models.CharField(max_length=100, verbose_name="Задача")
+    payload = models.JSONField(default=dict, blank=True, verbose_name="Аргументы")
+    dedupe_key = models.CharField(max_length=200, blank=True, default='', verbose_name="Ключ дедупликации")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, verbose_name="Статус")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Попыток")
+    max_attempts = models.PositiveIntegerField(default=5, verbose_name="Максимум попыток")
+    run_at = models.DateTimeField(default=timezone.now, verbose_name="Выполнить после")
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name="Захвачена")
+    locked_by = models.CharField(max_length=200, blank=True, default='', verbose_name="Воркер")
+    last_error = models.TextField(blank=True, default='', verbose_name="Последняя ошибка")
+    created_date = models.DateTimeField(default=timezone.now, verbose_name="Дата создания")
+    
+    def __str__(self):
+        return f"{self.name} #{self.pk}"
+    
     class Meta:
-        ordering = ['created_date']
\ No newline at end of file
+        ordering = ['run_at', 'id']
+        verbose_name = "Задача"
+        verbose_name_plural = "Задачи"
+        indexes = [
+            # Выборка готовых задач и подсчет выполняемых по очереди
+            models.Index(fields=['status', 'queue', 'run_at', 'id'], name='job_status_queue_run_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['queue', 'dedupe_key'],
+                condition=Q(status='pending') & ~Q(dedupe_key=''),
+                name='job_pending_dedupe_uniq',
+            ),
+        ]
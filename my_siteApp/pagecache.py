@@ -0,0 +1,152 @@
+"""
+Кеш HTML-страниц для анонимных посетителей.
+
+Страницы home, articles_list и news_detail одинаковы для всех анонимов,
+пока не изменится статья или комментарий, поэтому готовый HTML хранится
+в общем кеше (файловый бэкенд виден всем воркерам). Ключи точечные:
+изменение статьи сбрасывает только ее страницу, список ее категории,
+общий список и главную.
+
+У каждой страницы есть токен версии (ключ "<ключ>:version"), который
+промах читает до рендеринга и сохраняет вместе с HTML, а инвалидация
+заменяет на новый. Если промах прочитал базу до изменения, а записал
+страницу после инвалидации, токены не совпадут и старая страница не
+будет выдана.
+"""
+import re
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import patch_vary_headers
+
+PAGE_CACHE_ALIAS = getattr(settings, 'PAGE_CACHE_ALIAS', 'default')
+PAGE_CACHE_TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 600)
+
+# CSRF-токен в форме у каждого посетителя свой, поэтому в кеш страница
+# попадает с заглушкой, а при выдаче подставляется токен текущего запроса
+CSRF_PLACEHOLDER = '__page_cache_csrf_token__'
+CSRF_INPUT_RE = re.compile(r'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+
+
+def home_key():
+    return 'page:home'
+
+
+def articles_list_key(category=None):
+    return f'page:articles:{category or "all"}'
+
+
+def news_detail_key(id):
+    return f'page:news:{id}'
+
+
+def get_cache():
+    return caches[PAGE_CACHE_ALIAS]
+
+
+def version_key(key):
+    return f'{key}:version'
+
+
+def get_version(cache, key):
+    """Текущий токен версии страницы; если его нет - создается"""
+    token = cache.get(version_key(key))
+    if token is None:
+        cache.add(version_key(key), uuid.uuid4().hex, None)
+        token = cache.get(version_key(key))
+    return token
+
+
+def is_cacheable(request):
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if request.GET:
+        return False
+    # Флеш-сообщения показываются один раз и только этому посетителю
+    if 'messages' in request.COOKIES:
+        return False
+    return not request.user.is_authenticated
+
+
+def cache_anonymous_page(key_func):
+    """Декоратор view: отдает анонимам сохраненный HTML по ключу key_func(**kwargs)"""
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapped_view(request, *args, **kwargs):
+            if not is_cacheable(request):
+                return view_func(request, *args, **kwargs)
+
+            cache = get_cache()
+            key = key_func(*args, **kwargs)
+            cached = cache.get_many([key, version_key(key)])
+            page = cached.get(key)
+            version = cached.get(version_key(key))
+            if page is not None and version is not None and page[0] == version:
+                _, content, content_type = page
+                content = content.replace(CSRF_PLACEHOLDER, get_token(request))
+                response = HttpResponse(content, content_type=content_type)
+                response['X-Page-Cache'] = 'hit'
+                patch_vary_headers(response, ('Cookie',))
+                return response
+
+            # Токен читается до рендеринга: страница будет принята, только
+            # если за время рендеринга ее не инвалидировали
+            if version is None:
+                version = get_version(cache, key)
+            response = view_func(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                content = CSRF_INPUT_RE.sub(
+                    rf'\g<1>{CSRF_PLACEHOLDER}\g<2>', response.content.decode(response.charset)
+                )
+                cache.set(key, (version, content, response['Content-Type']), PAGE_CACHE_TIMEOUT)
+                response['X-Page-Cache'] = 'miss'
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapped_view
+    return decorator
+
+
+def invalidate_keys(keys):
+    """Новые токены версий (старые страницы больше не выдаются) и удаление страниц"""
+    cache = get_cache()
+    cache.set_many({version_key(key): uuid.uuid4().hex for key in keys}, None)
+    cache.delete_many(keys)
+
+
+def delete_after_commit(keys):
+    """Сбрасывает страницы после фиксации транзакции, чтобы не закешировать старые данные"""
+    keys = list(dict.fromkeys(keys))
+    transaction.on_commit(lambda: invalidate_keys(keys))
+
+
+def invalidate_article(article):
+    invalidate_articles([article])
+
+
+def invalidate_articles(articles):
+    keys = [home_key(), articles_list_key()]
+    for article in articles:
+        keys += [articles_list_key(article.category), news_detail_key(article.pk)]
+        loaded_category = getattr(article, '_loaded_category', None)
+        if loaded_category and loaded_category != article.category:
+            keys.append(articles_list_key(loaded_category))
+        article._loaded_category = article.category
+    delete_after_commit(keys)
+
+
+def invalidate_comment(comment, categories):
+    invalidate_comments([comment], categories)
+
+
+def invalidate_comments(comments, categories):
+    # Счетчик комментариев виден в карточках списка, поэтому чистим и списки.
+    # Категорию статьи не запрашиваем: удалить несколько ключей дешевле запроса
+    keys = [news_detail_key(comment.article_id) for comment in comments]
+    keys.append(articles_list_key())
+    keys += [articles_list_key(category) for category in categories]
+    delete_after_commit(keys)
@@ -0,0 +1,143 @@
+import base64
+import json
+from types import SimpleNamespace
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная (keyset) пагинация по паре (ordering_field, id).
+
+    Вместо OFFSET следующая страница выбирается условием
+    "после последней строки предыдущей страницы", поэтому запрос к
+    глубоким страницам стоит столько же, сколько к первой, и опирается
+    на составной индекс (ordering_field, id).
+    """
+    page_size = api_settings.PAGE_SIZE or 20
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering_field = 'created_date'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def __init__(self, descending=True, ordering_field=None):
+        self.descending = descending
+        if ordering_field is not None:
+            self.ordering_field = ordering_field
+
+    def get_query_params(self, request):
+        # DRF Request или обычный HttpRequest (асинхронные view)
+        return getattr(request, 'query_params', request.GET)
+
+    def get_page_size(self, request):
+        try:
+            size = int(self.get_query_params(request)[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def encode_cursor(self, instance):
+        field = self.model._meta.get_field(self.ordering_field)
+        if isinstance(instance, dict):
+            # Строка из .values(): value_to_string нужен только атрибут поля
+            instance = SimpleNamespace(**{field.attname: instance[self.ordering_field], 'pk': instance['id']})
+        value = getattr(instance, field.attname)
+        payload = {
+            'f': self.ordering_field,
+            'v': field.value_to_string(instance) if value is not None else None,
+            'id': instance.pk,
+            'd': self.descending,
+        }
+        raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, model, encoded):
+        """
+        (значение, id, по убыванию) из курсора. Поддельный курсор или курсор
+        другого списка (с другим полем сортировки) - 400, а не 500
+        """
+        try:
+            padding = '=' * (-len(encoded) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(encoded + padding))
+            if payload['f'] != self.ordering_field or payload['v'] is None:
+                raise ValueError
+            field = model._meta.get_field(self.ordering_field)
+            value = field.to_python(payload['v'])
+            pk = int(payload['id'])
+            descending = bool(payload['d'])
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError, ValidationError):
+            raise ParseError(self.invalid_cursor_message)
+        return value, pk, descending
+
+    def get_ordering(self):
+        prefix = '-' if self.descending else ''
+        return [f'{prefix}{self.ordering_field}', f'{prefix}id']
+
+    def apply_cursor(self, queryset, value, pk):
+        lookup = 'lt' if self.descending else 'gt'
+        return queryset.filter(
+            Q(**{f'{self.ordering_field}__{lookup}': value}) |
+            Q(**{self.ordering_field: value, f'id__{lookup}': pk})
+        )
+
+    def get_page_queryset(self, queryset, request):
+        """Срез на page_size + 1 строк после курсора (запрос еще не выполнен)"""
+        self.request = request
+        self.model = queryset.model
+        self.page_size_value = self.get_page_size(request)
+
+        encoded = self.get_query_params(request).get(self.cursor_query_param)
+        if encoded:
+            # Направление сортировки зашито в курсор, чтобы смена параметра
+            # order посреди обхода не перепутала страницы
+            value, pk, self.descending = self.decode_cursor(queryset.model, encoded)
+            queryset = self.apply_cursor(queryset.order_by(*self.get_ordering()), value, pk)
+        else:
+            queryset = queryset.order_by(*self.get_ordering())
+        return queryset[:self.page_size_value + 1]
+
+    def set_page(self, rows):
+        self.has_next = len(rows) > self.page_size_value
+        self.page = rows[:self.page_size_value]
+        return self.page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        rows = [row async for row in self.get_page_queryset(queryset, request)]
+        return self.set_page(rows)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,45 @@
+"""
+JSON-рендерер на orjson с тем же выводом, что у JSONRenderer DRF.
+
+Побайтовое совпадение обеспечивается так: компактные разделители и UTF-8
+без \\u-экранирования у orjson те же; U+2028/U+2029 экранируются после
+кодирования, как это делает DRF; даты и прочие типы, которые orjson
+записал бы по-своему, уходят в JSONEncoder DRF. Во всех остальных случаях
+(нет orjson, запрошен indent, UNICODE_JSON/COMPACT_JSON выключены,
+неподдерживаемые данные) работает обычный JSONRenderer.
+
+Числа с плавающей точкой orjson пишет иначе, чем json (1e-06 против 1e-6),
+поэтому рендерер подключается только к эндпоинтам без float в ответе.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    encoder = JSONEncoder()
+
+    def can_use_orjson(self, accepted_media_type, renderer_context):
+        return (
+            orjson is not None
+            and self.ensure_ascii is False
+            and self.compact
+            and self.get_indent(accepted_media_type, renderer_context or {}) is None
+        )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or not self.can_use_orjson(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder.default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
@@ -0,0 +1,45 @@
+"""
+Заранее вычисляемые представления текста статьи.
+
+То же, что раньше делали фильтры шаблонов на каждом показе:
+truncatewords:30 для карточки списка и linebreaks для страницы статьи.
+Результат хранится в Article.excerpt и Article.rendered_html и
+пересчитывается при сохранении (см. Article.update_rendered_fields).
+"""
+from django.utils.html import linebreaks
+from django.utils.text import Truncator
+
+EXCERPT_WORDS = 30
+
+
+def make_excerpt(text):
+    """Как {{ text|truncatewords:30 }}; результат - обычный текст (экранируется в шаблоне)"""
+    return Truncator(text).words(EXCERPT_WORDS, truncate=' …')
+
+
+def render_html(text):
+    """Как {{ text|linebreaks }} с автоэкранированием; результат - готовый HTML"""
+    return linebreaks(text, autoescape=True)
+
+
+def backfill(model, batch_size=500, only_missing=True):
+    """
+    Заполнить excerpt/rendered_html пачками по id. Принимает модель явно,
+    чтобы вызываться и из миграции (историческая модель), и из команды
+    backfill_article_html. Возвращает число обновленных строк
+    """
+    articles = model.objects.order_by('id')
+    if only_missing:
+        articles = articles.filter(rendered_html='')
+    updated = 0
+    last_id = 0
+    while True:
+        batch = list(articles.filter(id__gt=last_id).only('id', 'text')[:batch_size])
+        if not batch:
+            return updated
+        for article in batch:
+            article.excerpt = make_excerpt(article.text)
+            article.rendered_html = render_html(article.text)
+        model.objects.bulk_update(batch, ['excerpt', 'rendered_html'])
+        updated += len(batch)
+        last_id = batch[-1].id
@@ -0,0 +1,114 @@
+"""
+Разделение чтения и записи между основной базой и репликами.
+
+Чтения в безопасных запросах (GET/HEAD/OPTIONS) уходят на одну из баз
+DATABASE_REPLICAS, все записи - на основную. Запрос закрепляется за
+основной базой, если он пишущий, если в нем уже была запись (чтобы читать
+то, что только что записали) или если клиент недавно что-то записал -
+последнее отмечается cookie на DATABASE_REPLICA_PIN_SECONDS, чтобы редирект
+после POST не попал на отстающую реплику.
+
+Реплика используется только внутри запроса, который пропустил
+ReplicaRoutingMiddleware. Команды manage.py, поток-писатель, воркеры
+run_jobs и потоки буферов всегда читают с основной базы. Внутри открытой
+транзакции на основной базе чтения тоже идут в нее, иначе они не увидели
+бы собственных незафиксированных записей.
+"""
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+PRIMARY_DB = 'default'
+PIN_COOKIE = 'db_primary_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Вне запроса (значение по умолчанию) - только основная база
+_pinned = ContextVar('db_primary_pinned', default=True)
+_wrote = ContextVar('db_primary_wrote', default=False)
+
+
+def pin_to_primary():
+    _pinned.set(True)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+class PrimaryReplicaRouter:
+    """Подключается через DATABASE_ROUTERS; список реплик - DATABASE_REPLICAS"""
+
+    def get_replicas(self):
+        return getattr(settings, 'DATABASE_REPLICAS', [])
+
+    def db_for_read(self, model, **hints):
+        replicas = self.get_replicas()
+        if not replicas or _pinned.get() or connections[PRIMARY_DB].in_atomic_block:
+            return PRIMARY_DB
+        # Связанные объекты читаются из той же базы, что и исходный
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        _pinned.set(True)
+        _wrote.set(True)
+        return PRIMARY_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY_DB, *self.get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY_DB
+
+
+class ReplicaRoutingMiddleware:
+    """Определяет для каждого запроса, можно ли читать с реплики"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tokens = self.start(request)
+        try:
+            return self.finish(self.get_response(request))
+        finally:
+            self.reset(tokens)
+
+    async def __acall__(self, request):
+        tokens = self.start(request)
+        try:
+            return self.finish(await self.get_response(request))
+        finally:
+            self.reset(tokens)
+
+    def start(self, request):
+        pinned = request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+        return _pinned.set(pinned), _wrote.set(False)
+
+    def finish(self, response):
+        if _wrote.get():
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 5),
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+    def reset(self, tokens):
+        pinned_token, wrote_token = tokens
+        _pinned.reset(pinned_token)
+        _wrote.reset(wrote_token)
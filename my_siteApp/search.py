@@ -0,0 +1,186 @@
+"""
+Полнотекстовый поиск по статьям на SQLite FTS5.
+
+Виртуальная таблица хранит копию title/text, rowid совпадает с id статьи.
+Индекс обновляется фоновой задачей search.reindex_articles, которую ставят
+сигналы Article (post_save/post_delete), полная перестройка - командой
+manage.py rebuild_search_index.
+"""
+import re
+import sqlite3
+from functools import lru_cache
+
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from . import jobs
+
+FTS_TABLE = 'my_siteApp_article_fts'
+ARTICLE_TABLE = 'my_siteApp_article'
+
+# Маркеры подсветки: управляющие символы не встречаются в тексте статьи,
+# поэтому после экранирования HTML их можно безопасно заменить на <mark>
+MARK_START = '\x02'
+MARK_END = '\x03'
+SNIPPET_TOKENS = 24
+
+CREATE_TABLE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+    f"USING fts5(title, text, tokenize='unicode61 remove_diacritics 2')"
+)
+DROP_TABLE_SQL = f"DROP TABLE IF EXISTS {FTS_TABLE}"
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+@lru_cache(maxsize=None)
+def has_fts5():
+    """Собран ли SQLite с FTS5 (та же библиотека, что у бэкенда Django)"""
+    probe = sqlite3.connect(':memory:')
+    try:
+        probe.execute('CREATE VIRTUAL TABLE probe USING fts5(x)')
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        probe.close()
+    return True
+
+
+def is_supported(using=None):
+    conn = using or connection
+    return conn.vendor == 'sqlite' and has_fts5()
+
+
+def create_index_table(cursor):
+    cursor.execute(CREATE_TABLE_SQL)
+
+
+def index_articles(articles):
+    """Добавить или обновить несколько статей двумя executemany"""
+    if not is_supported() or not articles:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [[article.pk] for article in articles]
+        )
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, text) VALUES (%s, %s, %s)",
+            [[article.pk, article.title, article.text] for article in articles],
+        )
+
+
+@jobs.task('search.reindex_articles', queue='search')
+def reindex_articles(ids):
+    """Задача очереди: обновить статьи ids в индексе, удаленные - убрать из него"""
+    from .models import Article
+
+    if not is_supported():
+        return
+    articles = list(Article.objects.filter(id__in=ids).only('id', 'title', 'text'))
+    index_articles(articles)
+    missing = set(ids) - {article.pk for article in articles}
+    if missing:
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [[pk] for pk in missing])
+
+
+def enqueue_reindex(ids):
+    """Поставить переиндексацию; для одной статьи повторные постановки схлопываются"""
+    ids = sorted(set(ids))
+    if not ids:
+        return
+    dedupe_key = f'search:article:{ids[0]}' if len(ids) == 1 else ''
+    jobs.enqueue('search.reindex_articles', {'ids': ids}, dedupe_key=dedupe_key)
+
+
+def rebuild_index(batch_size=1000):
+    """Полная перестройка индекса пакетами, возвращает число статей"""
+    from .models import Article
+
+    total = 0
+    with connection.cursor() as cursor:
+        create_index_table(cursor)
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        rows = Article.objects.order_by().values_list('id', 'title', 'text').iterator(chunk_size=batch_size)
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                cursor.executemany(
+                    f"INSERT INTO {FTS_TABLE} (rowid, title, text) VALUES (%s, %s, %s)", batch
+                )
+                total += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, text) VALUES (%s, %s, %s)", batch
+            )
+            total += len(batch)
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return total
+
+
+def build_match_query(query):
+    """
+    Превращает пользовательский ввод в безопасное выражение MATCH:
+    каждое слово берется в кавычки, последнее ищется по префиксу
+    """
+    tokens = TOKEN_RE.findall(query or '')
+    if not tokens:
+        return ''
+    terms = ['"%s"' % token.replace('"', '""') for token in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def highlight(value):
+    """Экранирует HTML и заменяет маркеры FTS5 на <mark>"""
+    value = escape(value or '')
+    return mark_safe(value.replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+def search_articles(query, category=None, offset=0, limit=20):
+    """
+    Поиск статей, отсортированных по релевантности (bm25, заголовок весит
+    больше текста). Возвращает до limit + 1 статей, чтобы вызывающий код мог
+    понять, есть ли следующая страница. У каждой статьи заполнены
+    search_title, search_snippet (HTML с <mark>) и search_rank.
+    """
+    from .models import Article
+
+    match = build_match_query(query)
+    if not match:
+        return []
+
+    sql = (
+        f"SELECT {FTS_TABLE}.rowid, "
+        f"highlight({FTS_TABLE}, 0, %s, %s), "
+        f"snippet({FTS_TABLE}, 1, %s, %s, '…', {SNIPPET_TOKENS}), "
+        f"bm25({FTS_TABLE}, 10.0, 1.0) AS rank "
+        f"FROM {FTS_TABLE} "
+        f"JOIN {ARTICLE_TABLE} a ON a.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH %s"
+    )
+    params = [MARK_START, MARK_END, MARK_START, MARK_END, match]
+    if category:
+        sql += " AND a.category = %s"
+        params.append(category)
+    sql += " ORDER BY rank LIMIT %s OFFSET %s"
+    params += [limit + 1, offset]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    articles = Article.objects.select_related('user').defer('text', 'rendered_html').in_bulk([row[0] for row in rows])
+    results = []
+    for article_id, title, snippet, rank in rows:
+        article = articles.get(article_id)
+        if article is None:
+            continue
+        article.search_title = highlight(title)
+        article.search_snippet = highlight(snippet)
+        article.search_rank = rank
+        results.append(article)
+    return results
@@ -1,6 +1,159 @@
+from django.db.models import F
 from rest_framework import serializers
+from rest_framework.exceptions import ParseError
 from .models import Article, Comment
 from django.contrib.auth.models import User
+from rest_framework_simplejwt.serializers import TokenVerifySerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import UntypedToken
+from .tokens import is_blacklisted
+from .hashing import authenticate, password_pool
+
+def parse_field_list(value):
+    """Разбор параметра вида "id,title, text" в список имен"""
+    if not value:
+        return []
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+class DynamicFieldsMixin:
+    """
+    Поддержка ?fields= (выбор полей) и ?expand= (вложенные объекты по запросу).
+
+    expandable_fields - вложенные сериализаторы, которые отдаются только при
+    явном expand; expand вида "article_details.author_details" раскрывает
+    вложенные уровни. field_relations - связи, которые нужно подтянуть через
+    select_related, если поле попало в ответ.
+
+    list_mode=True (списки): поля list_excluded_fields отдаются, только если
+    их явно перечислили в ?fields=. Поля модели из deferrable_fields, которых
+    нет в ответе, не читаются из базы (defer). Неизвестное имя в fields или
+    expand - 400 (ParseError).
+
+    values_fields (имя поля ответа -> путь для .values()) включает быстрый
+    путь чтения: если все выбранные поля в нем есть и ничего не раскрыто,
+    строки берутся словарями из .values() с JOIN и превращаются в ответ без
+    моделей и to_representation; вывод тот же, что у сериализатора.
+    """
+    expandable_fields = ()
+    field_relations = {}
+    list_excluded_fields = ()
+    deferrable_fields = ()
+    values_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', None)
+        self.list_mode = kwargs.pop('list_mode', False)
+        super().__init__(*args, **kwargs)
+
+        request = self.context.get('request') if 'context' in kwargs else None
+        if request is not None:
+            params = getattr(request, 'query_params', request.GET)
+            if fields is None:
+                fields = parse_field_list(params.get('fields'))
+            if expand is None:
+                expand = parse_field_list(params.get('expand'))
+        self.set_field_selection(fields or [], expand or [])
+
+    def set_field_selection(self, fields, expand):
+        self.selected_fields = fields
+        self.expand_map = {}
+        for path in expand:
+            name, _, rest = path.partition('.')
+            self.expand_map.setdefault(name, [])
+            if rest:
+                self.expand_map[name].append(rest)
+        # fields - cached_property, сбрасываем, чтобы пересобрать с новым выбором
+        self.__dict__.pop('fields', None)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        unknown = [
+            name for name in [*self.selected_fields, *self.expand_map]
+            if name not in fields
+        ]
+        if unknown:
+            raise ParseError(f'Неизвестные поля: {", ".join(unknown)}')
+        for name in list(fields):
+            if name in self.expandable_fields and name not in self.expand_map:
+                fields.pop(name)
+            elif self.selected_fields and name not in self.selected_fields \
+                    and name not in self.expand_map:
+                fields.pop(name)
+            elif self.list_mode and name in self.list_excluded_fields \
+                    and name not in self.selected_fields:
+                fields.pop(name)
+
+        for name, nested_expand in self.expand_map.items():
+            field = fields.get(name)
+            if isinstance(field, DynamicFieldsMixin):
+                field.set_field_selection([], nested_expand)
+        return fields
+
+    def get_select_related(self):
+        """Список связей для select_related под выбранный набор полей"""
+        relations = []
+        for name, field in self.fields.items():
+            relation = self.field_relations.get(name)
+            if relation is None:
+                continue
+            if relation not in relations:
+                relations.append(relation)
+            if isinstance(field, DynamicFieldsMixin):
+                for nested in field.get_select_related():
+                    path = f'{relation}__{nested}'
+                    if path not in relations:
+                        relations.append(path)
+        return relations
+
+    def can_use_values(self):
+        return not self.expand_map and all(name in self.values_fields for name in self.fields)
+
+    def get_values_queryset(self, queryset, extra=()):
+        """
+        .values() под выбранные поля; extra - поля модели, нужные помимо
+        ответа (например, для курсора пагинации)
+        """
+        names, expressions = [], {}
+        for name in self.fields:
+            path = self.values_fields[name]
+            if path == name:
+                names.append(name)
+            else:
+                expressions[name] = F(path)
+        names += [name for name in extra if name not in names and name not in expressions]
+        return queryset.values(*names, **expressions)
+
+    def represent_values(self, rows):
+        """Список словарей из get_values_queryset в формате to_representation"""
+        names = list(self.fields)
+        # Преобразование нужно только полям, у которых представление отличается
+        # от значения из базы (даты); остальное копируется как есть
+        converters = [
+            (name, field.to_representation)
+            for name, field in self.fields.items()
+            if isinstance(field, (serializers.DateTimeField, serializers.DateField, serializers.DecimalField))
+        ]
+        result = []
+        for row in rows:
+            item = {name: row[name] for name in names}
+            for name, convert in converters:
+                if item[name] is not None:
+                    item[name] = convert(item[name])
+            result.append(item)
+        return result
+
+    def get_deferred_fields(self):
+        return [name for name in self.deferrable_fields if name not in self.fields]
+
+    def optimize_queryset(self, queryset):
+        relations = self.get_select_related()
+        if relations:
+            queryset = queryset.select_related(*relations)
+        deferred = self.get_deferred_fields()
+        if deferred:
+            queryset = queryset.defer(*deferred)
+        return queryset
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -8,10 +161,30 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
         read_only_fields = ['id']
 
-class ArticleSerializer(serializers.ModelSerializer):
+class ArticleSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     author_name = serializers.CharField(source='user.username', read_only=True)
     author_details = UserSerializer(source='user', read_only=True)
     
+    expandable_fields = ('author_details',)
+    field_relations = {
+        'author_name': 'user',
+        'author_details': 'user',
+    }
+    # В списках вместо полного текста - excerpt
+    list_excluded_fields = ('text',)
+    deferrable_fields = ('text', 'rendered_html')
+    values_fields = {
+        'id': 'id',
+        'title': 'title',
+        'text': 'text',
+        'created_date': 'created_date',
+        'category': 'category',
+        'user': 'user',
+        'author_name': 'user__username',
+        'comment_count': 'comment_count',
+        'excerpt': 'excerpt',
+    }
+    
     class Meta:
         model = Article
         fields = [
@@ -22,14 +195,30 @@ class ArticleSerializer(serializers.ModelSerializer):
             'category', 
             'user', 
             'author_name',
-            'author_details'
+            'author_details',
+            'comment_count',
+            'excerpt'
         ]
-        read_only_fields = ['id', 'created_date', 'user', 'author_name', 'author_details']
+        read_only_fields = ['id', 'created_date', 'user', 'author_name', 'author_details', 'comment_count', 'excerpt']
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     article_title = serializers.CharField(source='article.title', read_only=True)
     article_details = ArticleSerializer(source='article', read_only=True)
     
+    expandable_fields = ('article_details',)
+    field_relations = {
+        'article_title': 'article',
+        'article_details': 'article',
+    }
+    values_fields = {
+        'id': 'id',
+        'text': 'text',
+        'created_date': 'created_date',
+        'author_name': 'author_name',
+        'article': 'article',
+        'article_title': 'article__title',
+    }
+    
     class Meta:
         model = Comment
         fields = [
@@ -43,6 +232,42 @@ class CommentSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_date']
 
+class CommentBulkItemSerializer(serializers.ModelSerializer):
+    """
+    Комментарий в пакетной операции: статья задается id и проверяется по
+    заранее загруженному множеству context['article_ids'], без запроса на элемент
+    """
+    article = serializers.IntegerField()
+    
+    class Meta:
+        model = Comment
+        fields = ['text', 'author_name', 'article']
+    
+    def validate_article(self, value):
+        if value not in self.context['article_ids']:
+            raise serializers.ValidationError('Статья не найдена')
+        return value
+
+class ArticleSearchResultSerializer(serializers.ModelSerializer):
+    author_name = serializers.CharField(source='user.username', read_only=True)
+    highlighted_title = serializers.CharField(source='search_title', read_only=True)
+    snippet = serializers.CharField(source='search_snippet', read_only=True)
+    rank = serializers.FloatField(source='search_rank', read_only=True)
+    
+    class Meta:
+        model = Article
+        fields = [
+            'id',
+            'title',
+            'highlighted_title',
+            'snippet',
+            'rank',
+            'created_date',
+            'category',
+            'author_name',
+        ]
+        read_only_fields = fields
+
 # JWT 
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(
@@ -89,7 +314,13 @@ class RegisterSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         validated_data.pop('password_confirm')
-        user = User.objects.create_user(**validated_data)
+        password = validated_data.pop('password')
+        # Как create_user, но хеш считается в пуле процессов (my_siteApp.hashing)
+        user = User(**validated_data)
+        user.username = User.normalize_username(user.username)
+        user.email = User.objects.normalize_email(user.email)
+        user.password = password_pool.make_password(password)
+        user.save()
         return user
 
 class LoginSerializer(serializers.Serializer):
@@ -104,8 +335,8 @@ class LoginSerializer(serializers.Serializer):
         password = attrs.get('password')
 
         if username and password:
-            from django.contrib.auth import authenticate
-            user = authenticate(username=username, password=password)
+            # Пароль проверяется в пуле процессов; при перегрузке - 503
+            user = authenticate(self.context.get('request'), username=username, password=password)
             
             if not user:
                 raise serializers.ValidationError('Неверные учетные данные')
@@ -122,6 +353,16 @@ class TokenResponseSerializer(serializers.Serializer):
     refresh = serializers.CharField()
     user = UserSerializer()
 
+class FilteredTokenVerifySerializer(TokenVerifySerializer):
+    """Проверка токена, в которой таблица отзыва опрашивается через фильтр Блума"""
+
+    def validate(self, attrs):
+        token = UntypedToken(attrs['token'])
+        jti = token.get(jwt_settings.JTI_CLAIM)
+        if jti is not None and is_blacklisted(jti):
+            raise serializers.ValidationError('Токен отозван')
+        return {}
+
 class RefreshTokenSerializer(serializers.Serializer):
     refresh = serializers.CharField(required=True)
 
@@ -0,0 +1,49 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from my_siteApp import images
+
+register = template.Library()
+
+# Форматы в порядке предпочтения: браузер берет первый поддерживаемый <source>
+SOURCE_FORMATS = ('avif', 'webp')
+
+
+def make_srcset(variants):
+    return ', '.join(f'{static(name)} {width}w' for width, name in variants)
+
+
+@register.simple_tag
+def responsive_image(path, alt='', sizes='100vw', loading='lazy', **attrs):
+    """
+    <picture> с AVIF/WebP и JPEG-запасным вариантом по манифесту build_images:
+        {% responsive_image 'images/x.jpg' alt='...' sizes='(max-width: 768px) 300px, 400px' class='rounded' %}
+    Если копий нет (build_images не запускали), выводит обычный <img>
+    """
+    entry = images.get_image(path)
+    if entry is None:
+        extra = format_html_join('', ' {}="{}"', attrs.items())
+        return format_html(
+            '<img src="{}" alt="{}" loading="{}" decoding="async"{}>',
+            static(path), alt, loading, extra,
+        )
+
+    # Собственные размеры картинки, если шаблон не задал свои: браузер
+    # заранее резервирует место и страница не прыгает при загрузке
+    attrs = {'width': entry['width'], 'height': entry['height'], **attrs}
+    extra = format_html_join('', ' {}="{}"', attrs.items())
+    variants = entry['variants']
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        [(images.MIME_TYPES[fmt], make_srcset(variants[fmt]), sizes)
+         for fmt in SOURCE_FORMATS if variants.get(fmt)],
+    )
+    fallback = variants.get('jpeg')
+    if not fallback:
+        return format_html('<picture>{}<img src="{}" alt="{}" loading="{}" decoding="async"{}></picture>',
+                           sources, static(path), alt, loading, extra)
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="{}" decoding="async"{}></picture>',
+        sources, static(fallback[-1][1]), make_srcset(fallback), sizes, alt, loading, extra,
+    )
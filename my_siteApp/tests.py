@@ -1,3 +1,1760 @@
-from django.test import TestCase
+import base64
+import json
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+from io import StringIO
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.core.management import CommandError, call_command
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.auth.signals import user_login_failed
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import buffers, cachestats, hashing, images, jobs, pagecache, search, throttling
+from .assets import StaticFilesMiddleware
+from .management.commands import reconcile_comment_counts
+from .authentication import user_cache
+from .renderers import ORJSONRenderer
+from .serializers import ArticleSerializer, CommentSerializer
+from .models import Article, Comment, Feedback, Job, UserProfile, feedback_buffer, last_login_buffer
+from .routers import PrimaryReplicaRouter, ReplicaRoutingMiddleware
+from . import tokens
+from .tokens import FilteredRefreshToken, outstanding_token_buffer
+from .views import save_new_comment
+from .writequeue import WriteQueue, WriteQueueTimeout
+
+
+class QueryBudgetMixin:
+    """Проверка, что страница укладывается в фиксированный бюджет SQL-запросов"""
+
+    def assertMaxQueries(self, budget, func, *args, **kwargs):
+        with CaptureQueriesContext(connection) as context:
+            result = func(*args, **kwargs)
+        executed = len(context.captured_queries)
+        if executed > budget:
+            queries = '\n'.join(q['sql'] for q in context.captured_queries)
+            self.fail(f'{executed} запросов при бюджете {budget}:\n{queries}')
+        return result
+
+
+class TemporaryBucketStoreMixin:
+    """Ведра ограничителя частоты во временной базе, своей для каждого теста"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.bucket_store = throttling.BucketStore(os.path.join(directory, 'throttle.sqlite3'))
+        patcher = mock.patch.object(throttling, 'bucket_store', self.bucket_store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+# Кеш страниц отключен, чтобы проверялся реальный рендеринг (и бюджет запросов).
+# Реплика не видит незафиксированных данных TestCase, поэтому чтения идут в default
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+    DATABASE_REPLICAS=[],
+)
+class ArticleTestCase(TestCase):
+    """Автор со статьей; подклассы добавляют свои данные после super().setUpTestData()"""
+    article_title = 'Статья'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', email='a@example.com', password='pass12345')
+        cls.article = Article.objects.create(
+            title=cls.article_title, text='Текст статьи', category='works', user=cls.author
+        )
+
+
+class PageQueryBudgetTests(QueryBudgetMixin, ArticleTestCase):
+    ARTICLES_LIST_BUDGET = 3
+    HOME_BUDGET = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        authors = [cls.author] + [User.objects.create_user(f'author{i}', password='pass12345') for i in range(1, 5)]
+        for i in range(20):
+            article = Article.objects.create(
+                title=f'Статья {i}',
+                text='Текст статьи',
+                category='works',
+                user=authors[i % len(authors)],
+            )
+            for j in range(3):
+                Comment.objects.create(article=article, author_name=f'Гость {j}', text='Комментарий')
+                Article.adjust_comment_count(article.pk, 1)
+
+    def test_articles_list_query_budget(self):
+        response = self.assertMaxQueries(
+            self.ARTICLES_LIST_BUDGET, self.client.get, reverse('articles_list')
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '3 комментариев', count=20)
+
+    def test_articles_by_category_query_budget(self):
+        response = self.assertMaxQueries(
+            self.ARTICLES_LIST_BUDGET, self.client.get, reverse('articles_by_category', args=['works'])
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_articles_list_budget_does_not_grow_with_page_size(self):
+        for i in range(20):
+            Article.objects.create(title=f'Еще {i}', text='Текст', category='works', user=self.author)
+        self.assertMaxQueries(self.ARTICLES_LIST_BUDGET, self.client.get, reverse('articles_list'))
+
+    def test_home_query_budget(self):
+        response = self.assertMaxQueries(self.HOME_BUDGET, self.client.get, reverse('home'))
+        self.assertEqual(response.status_code, 200)
+
+
+class KeysetPaginationTests(ArticleTestCase):
+    article_title = 'Статья 0'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(1, 5):
+            Article.objects.create(title=f'Статья {i}', text='Текст', category='works', user=cls.author)
+
+    def make_cursor(self, payload):
+        raw = json.dumps(payload).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    def next_cursor(self, url):
+        response = self.client.get(url, {'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        return parse_qs(urlparse(response.json()['next']).query)['cursor'][0]
+
+    def test_cursor_walks_all_pages(self):
+        url = reverse('api_articles_list')
+        titles, params = [], {'page_size': 2}
+        while True:
+            data = self.client.get(url, params).json()
+            titles += [article['title'] for article in data['results']]
+            if not data['next']:
+                break
+            params = parse_qs(urlparse(data['next']).query)
+        self.assertEqual(titles, [f'Статья {i}' for i in reversed(range(5))])
+
+    def assertInvalidCursor(self, url, cursor):
+        response = self.client.get(url, {'cursor': cursor})
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertEqual(response.json(), {'detail': 'Неверный курсор'})
+
+    def test_invalid_cursors_return_400(self):
+        url = reverse('api_articles_list')
+        for payload in (
+            {'f': 'created_date', 'v': 'garbage', 'id': 1, 'd': True},
+            {'f': 'created_date', 'v': None, 'id': 1, 'd': True},
+            {'f': 'created_date', 'v': '2024-01-01T00:00:00Z', 'id': 'x', 'd': True},
+            {'v': '2024-01-01T00:00:00Z', 'id': 1, 'd': True},
+            ['not', 'a', 'dict'],
+        ):
+            with self.subTest(payload=payload):
+                self.assertInvalidCursor(url, self.make_cursor(payload))
+        self.assertInvalidCursor(url, 'not-base64!')
+
+    def test_cursor_from_other_ordering_returns_400(self):
+        by_comments = reverse('api_articles_sorted_by_comments')
+        by_date = reverse('api_articles_list')
+        self.assertInvalidCursor(by_date, self.next_cursor(by_comments))
+        self.assertInvalidCursor(by_comments, self.next_cursor(by_date))
+
+    def test_invalid_cursor_async_view(self):
+        self.assertInvalidCursor(
+            reverse('api_articles_list_async'),
+            self.make_cursor({'f': 'created_date', 'v': 'garbage', 'id': 1, 'd': True}),
+        )
+
+
+class DynamicFieldsTests(ArticleTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.comment = Comment.objects.create(article=cls.article, author_name='Гость', text='Комментарий')
+
+    def get_article(self, **params):
+        return self.client.get(reverse('api_article_detail', args=[self.article.id]), params)
+
+    def test_default_payload_without_expandable_fields(self):
+        data = self.get_article().json()
+        self.assertEqual(data['author_name'], 'author')
+        self.assertIn('text', data)
+        self.assertNotIn('author_details', data)
+
+    def test_list_excludes_text_unless_requested(self):
+        url = reverse('api_articles_list')
+        item = self.client.get(url).json()['results'][0]
+        self.assertNotIn('text', item)
+        self.assertIn('excerpt', item)
+        item = self.client.get(url, {'fields': 'id,text'}).json()['results'][0]
+        self.assertEqual(item, {'id': self.article.id, 'text': 'Текст статьи'})
+
+    def test_fields_selects_subset(self):
+        data = self.get_article(fields='id, title').json()
+        self.assertEqual(data, {'id': self.article.id, 'title': 'Статья'})
+
+    def test_expand(self):
+        data = self.get_article(fields='id', expand='author_details').json()
+        self.assertEqual(data['author_details']['username'], 'author')
+        self.assertEqual(set(data), {'id', 'author_details'})
+
+    def test_nested_expand(self):
+        url = reverse('api_comment_detail', args=[self.comment.id])
+        data = self.client.get(url, {'expand': 'article_details.author_details'}).json()
+        self.assertEqual(data['article_details']['title'], 'Статья')
+        self.assertEqual(data['article_details']['author_details']['email'], 'a@example.com')
+
+        data = self.client.get(url, {'expand': 'article_details'}).json()
+        self.assertNotIn('author_details', data['article_details'])
+
+    def test_unknown_names_return_400(self):
+        for params in ({'fields': 'id,nope'}, {'expand': 'nope'}):
+            with self.subTest(params=params):
+                response = self.get_article(**params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'detail': 'Неизвестные поля: nope'})
+
+        url = reverse('api_comment_detail', args=[self.comment.id])
+        response = self.client.get(url, {'expand': 'article_details.nope'})
+        self.assertEqual(response.status_code, 400)
+
+        for url in (reverse('api_articles_list'), reverse('api_articles_list_async'),
+                    reverse('api_article_detail_async', args=[self.article.id])):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url, {'fields': 'nope'}).status_code, 400)
+
+
+class SearchViewTests(ArticleTestCase):
+    article_title = 'Имперская живопись'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        search.index_articles([cls.article])
+
+    def test_search_page_finds_article(self):
+        response = self.client.get(reverse('search'), {'q': 'имперск'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<mark>Имперская</mark>')
+
+    def test_huge_page_number_is_clamped(self):
+        for url in (reverse('search'), reverse('api_search_articles')):
+            with self.subTest(url=url):
+                response = self.client.get(url, {'q': 'имперск', 'page': '9' * 30})
+                self.assertEqual(response.status_code, 200)
+
+    def test_unsupported_search_returns_503(self):
+        with mock.patch.object(search, 'is_supported', return_value=False):
+            self.assertEqual(self.client.get(reverse('search'), {'q': 'имперск'}).status_code, 503)
+            self.assertEqual(self.client.get(reverse('api_search_articles'), {'q': 'имперск'}).status_code, 503)
+
+
+class ConditionalGetTests(ArticleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.dict(throttling.SCOPES, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertNotModified(self, url):
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        return etag
+
+    def test_username_change_invalidates_etags(self):
+        urls = [
+            reverse('api_article_detail', args=[self.article.id]),
+            reverse('api_articles_list'),
+            reverse('api_articles_by_category', args=['works']),
+        ]
+        etags = {url: self.assertNotModified(url) for url in urls}
+
+        self.author.username = 'renamed'
+        self.author.save()
+
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('renamed', response.content.decode())
+
+    def test_unrelated_user_save_keeps_etag(self):
+        url = reverse('api_articles_list')
+        etag = self.assertNotModified(url)
+        self.author.last_login = self.article.created_date
+        self.author.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_post_ignores_conditional_headers(self):
+        url = reverse('news_detail', args=[self.article.id])
+        etag = self.assertNotModified(url)
+        response = self.client.post(
+            url, {'author_name': 'Гость', 'text': 'Комментарий'}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.article.comments.count(), 1)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'page-cache-tests'}},
+)
+class PageCacheTests(ArticleTestCase):
+
+    def setUp(self):
+        pagecache.get_cache().clear()
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_anonymous_hit_and_miss(self):
+        url = reverse('news_detail', args=[self.article.id])
+        self.assertEqual(self.get(url)['X-Page-Cache'], 'miss')
+        response = self.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, 'Статья')
+
+    def test_authenticated_and_query_string_bypass_cache(self):
+        url = reverse('articles_list')
+        self.get(url)
+        self.assertNotIn('X-Page-Cache', self.client.get(url, {'page': 1}))
+        self.client.force_login(self.article.user)
+        self.assertNotIn('X-Page-Cache', self.get(url))
+
+    def test_article_save_invalidates_pages(self):
+        urls = [
+            reverse('home'), reverse('articles_list'),
+            reverse('articles_by_category', args=['works']),
+            reverse('news_detail', args=[self.article.id]),
+        ]
+        for url in urls:
+            self.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.article.title = 'Новый заголовок'
+            self.article.save()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.get(url)['X-Page-Cache'], 'miss')
+        self.assertContains(self.get(urls[-1]), 'Новый заголовок')
+
+    def test_comment_invalidates_article_page(self):
+        url = reverse('news_detail', args=[self.article.id])
+        self.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(article=self.article, author_name='Гость', text='Первый комментарий')
+        self.assertContains(self.get(url), 'Первый комментарий')
+
+    def test_invalidation_during_render_is_not_cached(self):
+        # Промах прочитал старые данные, затем статью изменили и сбросили
+        # кеш, и только потом промах записал страницу
+        view = pagecache.cache_anonymous_page(pagecache.news_detail_key)(
+            lambda request, id: self.invalidate_and_render(id)
+        )
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        self.assertEqual(view(request, id=self.article.id)['X-Page-Cache'], 'miss')
+        self.assertEqual(view(request, id=self.article.id)['X-Page-Cache'], 'miss')
+        self.assertEqual(view(request, id=self.article.id)['X-Page-Cache'], 'hit')
+
+    renders = 0
+
+    def invalidate_and_render(self, id):
+        self.renders += 1
+        if self.renders == 1:
+            pagecache.invalidate_keys([pagecache.news_detail_key(id)])
+        return HttpResponse('страница')
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class UserCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='pass12345')
+
+    def setUp(self):
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+
+    def test_each_get_returns_own_copy(self):
+        user_cache.set(('1', 'jti'), self.user)
+        self.user.first_name = 'изменено после set'
+        first = user_cache.get(('1', 'jti'))
+        second = user_cache.get(('1', 'jti'))
+        self.assertIsNot(first, second)
+        first.last_login = timezone.now()
+        self.assertIsNone(second.last_login)
+        self.assertIsNone(user_cache.get(('1', 'jti')).last_login)
+        self.assertEqual(second.first_name, '')
+
+    def test_jwt_requests_reuse_cached_user(self):
+        token = str(FilteredRefreshToken.for_user(self.user).access_token)
+        url = reverse('api_user_profile')
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+        self.assertEqual(self.client.get(url, **headers).json()['username'], 'reader')
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(url, **headers).status_code, 200)
+        self.assertFalse([q for q in context.captured_queries if 'auth_user' in q['sql']])
+
+    def test_user_save_invalidates_cache(self):
+        user_cache.set((str(self.user.pk), 'jti'), self.user)
+        self.user.save()
+        self.assertIsNone(user_cache.get((str(self.user.pk), 'jti')))
+
+
+class BulkQueryBudgetTests(QueryBudgetMixin, ArticleTestCase):
+    # Статьи: выборка изменяемых, SAVEPOINT/RELEASE, два DELETE (комментарии и
+    # статьи), UPDATE, INSERT и по задаче переиндексации на удаление и запись
+    BULK_ARTICLES_BUDGET = 9
+    # Комментарии: выборка изменяемых и статей, SAVEPOINT/RELEASE, DELETE,
+    # UPDATE, INSERT, счетчики статей
+    BULK_COMMENTS_BUDGET = 8
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.admin = User.objects.create_superuser('admin', password='pass12345')
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+
+    def make_articles(self, count):
+        articles = [
+            Article.objects.create(title=f'Статья {i}', text='Текст', category='works', user=self.admin)
+            for i in range(count)
+        ]
+        for article in articles:
+            for j in range(2):
+                Comment.objects.create(article=article, author_name='Гость', text='Комментарий')
+            Article.adjust_comment_count(article.pk, 2)
+        return articles
+
+    def bulk_articles(self, count):
+        articles = self.make_articles(count * 2)
+        Job.objects.all().delete()
+        operations = (
+            [{'op': 'create', 'data': {'title': f'Новая {i}', 'text': 'Текст', 'category': 'works'}}
+             for i in range(count)] +
+            [{'op': 'update', 'id': article.id, 'data': {'title': 'Изменена', 'text': 'Новый текст', 'category': 'news'}}
+             for article in articles[:count]] +
+            [{'op': 'delete', 'id': article.id} for article in articles[count:]]
+        )
+        response = self.assertMaxQueries(
+            self.BULK_ARTICLES_BUDGET, self.api.post,
+            reverse('api_bulk_articles'), {'operations': operations}, format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return articles
+
+    def test_bulk_articles_query_budget(self):
+        for count in (2, 20):
+            with self.subTest(count=count):
+                articles = self.bulk_articles(count)
+                deleted = [article.id for article in articles[count:]]
+                self.assertFalse(Article.objects.filter(id__in=deleted).exists())
+                self.assertFalse(Comment.objects.filter(article_id__in=deleted).exists())
+                self.assertEqual(Job.objects.filter(name='search.reindex_articles').count(), 2)
+
+    def test_bulk_comments_query_budget(self):
+        for count in (2, 20):
+            with self.subTest(count=count):
+                article, other = self.make_articles(2)
+                comments = list(article.comments.all()) + [
+                    Comment.objects.create(article=article, author_name='Гость', text='Еще')
+                    for _ in range(count * 2)
+                ]
+                Article.adjust_comment_count(article.pk, count * 2)
+                operations = (
+                    [{'op': 'create', 'data': {'text': 'Новый', 'author_name': 'Гость', 'article': other.id}}
+                     for _ in range(count)] +
+                    [{'op': 'update', 'id': comment.id, 'data': {'text': 'Изменен', 'author_name': 'Гость', 'article': other.id}}
+                     for comment in comments[:count]] +
+                    [{'op': 'delete', 'id': comment.id} for comment in comments[count:]]
+                )
+                response = self.assertMaxQueries(
+                    self.BULK_COMMENTS_BUDGET, self.api.post,
+                    reverse('api_bulk_comments'), {'operations': operations}, format='json',
+                )
+                self.assertEqual(response.status_code, 200, response.content)
+                article.refresh_from_db()
+                other.refresh_from_db()
+                self.assertEqual(article.comment_count, article.comments.count())
+                self.assertEqual(other.comment_count, other.comments.count())
+
+
+class WriteQueueTests(TransactionTestCase):
+
+    def test_timeout_cancels_queued_write(self):
+        writes = WriteQueue(timeout=0.2)
+        started, release = threading.Event(), threading.Event()
+        calls, errors = [], []
+
+        def slow_write():
+            started.set()
+            release.wait(5)
+            calls.append('slow')
+
+        def submit_slow():
+            try:
+                writes.submit(slow_write)
+            except WriteQueueTimeout as exc:
+                errors.append(exc)
+
+        thread = threading.Thread(target=submit_slow)
+        thread.start()
+        self.assertTrue(started.wait(5))
+
+        # Писатель занят: запись не дождалась очереди и отменена
+        with self.assertRaises(WriteQueueTimeout) as context:
+            writes.submit(calls.append, 'queued')
+        self.assertEqual(context.exception.status_code, 503)
+        self.assertIn('не сохранена', str(context.exception.detail))
+
+        thread.join(5)
+        release.set()
+        # Запись, которая уже выполнялась, - результат неизвестен
+        self.assertEqual(len(errors), 1)
+        self.assertIn('неизвестно', str(errors[0].detail))
+
+        writes.timeout = 5
+        writes.submit(calls.append, 'next')
+        self.assertEqual(calls, ['slow', 'next'])
+
+    def test_submit_returns_result_after_commit(self):
+        writes = WriteQueue()
+        author = User.objects.create_user('author', password='pass12345')
+        article = writes.submit(
+            Article.objects.create, title='Статья', text='Текст', category='works', user=author
+        )
+        self.assertTrue(Article.objects.filter(id=article.id).exists())
+
+
+    def submit_together(self, writes, *calls):
+        """Поставить записи из разных потоков так, чтобы они попали в одну пачку"""
+        outcomes = [None] * len(calls)
+
+        def submit(index, func, *args):
+            try:
+                outcomes[index] = writes.submit(func, *args)
+            except Exception as exc:
+                outcomes[index] = exc
+
+        threads = [threading.Thread(target=submit, args=(i, *call)) for i, call in enumerate(calls)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        return outcomes
+
+    def test_foreign_key_violation_fails_only_its_write(self):
+        writes = WriteQueue(max_delay=1.0)
+        author = User.objects.create_user('author', password='pass12345')
+        article = Article.objects.create(title='Статья', text='Текст', category='works', user=author)
+        good = Comment(article=article, author_name='Гость', text='Комментарий')
+        # Статья удалена между проверкой и записью: внешний ключ нарушится только на COMMIT
+        dangling = Comment(article_id=article.id + 1000, author_name='Гость', text='Комментарий')
+
+        with mock.patch.object(writes, '_execute', wraps=writes._execute) as execute, \
+                self.assertLogs('my_siteApp.writequeue', 'WARNING'):
+            outcomes = self.submit_together(writes, (good.save,), (dangling.save,))
+        self.assertEqual(len(execute.call_args_list[0].args[0]), 2)
+        self.assertIsNone(outcomes[0])
+        self.assertIsInstance(outcomes[1], IntegrityError)
+        self.assertEqual(list(Comment.objects.values_list('id', flat=True)), [good.id])
+
+    def test_comment_for_deleted_article_returns_error(self):
+        writes = WriteQueue(max_delay=1.0)
+        author = User.objects.create_user('author', password='pass12345')
+        article = Article.objects.create(title='Статья', text='Текст', category='works', user=author)
+        good = Comment(article=article, author_name='Гость', text='Комментарий')
+        orphan = Comment(article_id=article.id + 1000, author_name='Гость', text='Комментарий')
+        with mock.patch.object(writes, '_execute', wraps=writes._execute) as execute:
+            outcomes = self.submit_together(writes, (save_new_comment, good), (save_new_comment, orphan))
+        # Запись отменена в своей точке сохранения, COMMIT пачки прошел с первого раза
+        execute.assert_called_once()
+        self.assertEqual(outcomes[0], good)
+        self.assertIsInstance(outcomes[1], Article.DoesNotExist)
+        self.assertEqual(Article.objects.get().comment_count, 1)
+        self.assertEqual(Comment.objects.count(), 1)
+
+    def test_api_comment_for_deleted_article_returns_400(self):
+        author = User.objects.create_user('author', password='pass12345')
+        article = Article.objects.create(title='Статья', text='Текст', category='works', user=author)
+        writes = WriteQueue()
+
+        def delete_then_submit(func, comment):
+            # Проверки в запросе прошли, а статью удалили до записи
+            Article.objects.filter(pk=comment.article_id).delete()
+            return writes.submit(func, comment)
+
+        with mock.patch('my_siteApp.views.write_queue', mock.Mock(submit=delete_then_submit)), \
+                mock.patch.dict(throttling.SCOPES, clear=True):
+            response = APIClient().post(
+                reverse('api_create_comment'), {'article': article.id, 'author_name': 'Гость', 'text': 'Комментарий'}
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Comment.objects.exists())
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class PrimaryReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.middleware = ReplicaRoutingMiddleware(lambda request: HttpResponse())
+
+    def in_request(self, method='GET'):
+        tokens = self.middleware.start(RequestFactory().generic(method, '/'))
+        self.addCleanup(self.middleware.reset, tokens)
+
+    def test_reads_outside_request_use_primary(self):
+        self.assertEqual(self.router.db_for_read(Article), 'default')
+
+    def test_safe_request_reads_from_replica(self):
+        self.in_request()
+        self.assertEqual(self.router.db_for_read(Article), 'replica')
+
+    def test_write_pins_request_to_primary(self):
+        self.in_request()
+        self.router.db_for_write(Article)
+        self.assertEqual(self.router.db_for_read(Article), 'default')
+
+    def test_unsafe_request_uses_primary(self):
+        self.in_request('POST')
+        self.assertEqual(self.router.db_for_read(Article), 'default')
+
+    def test_atomic_block_reads_from_primary(self):
+        self.in_request()
+        with mock.patch.object(connection, 'in_atomic_block', True):
+            self.assertEqual(self.router.db_for_read(Article), 'default')
+
+    def test_related_reads_follow_instance(self):
+        self.in_request()
+        article = Article()
+        article._state.db = 'default'
+        self.assertEqual(self.router.db_for_read(User, instance=article), 'default')
+
+
+class ExportAccessTests(TemporaryBucketStoreMixin, ArticleTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.staff = User.objects.create_user('staff', password='pass12345', is_staff=True)
+        cls.reader = User.objects.create_user('reader', password='pass12345')
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.dict(throttling.SCOPES, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def export(self, user=None):
+        headers = {}
+        if user is not None:
+            headers['HTTP_AUTHORIZATION'] = f'Bearer {FilteredRefreshToken.for_user(user).access_token}'
+        return self.client.get(reverse('api_export_articles'), **headers)
+
+    def test_requires_staff(self):
+        self.assertEqual(self.export().status_code, 401)
+        self.assertEqual(self.export(self.reader).status_code, 403)
+        self.assertEqual(self.client.get(reverse('api_export_comments')).status_code, 401)
+
+    def test_staff_gets_stream(self):
+        response = self.export(self.staff)
+        self.assertEqual(response.status_code, 200)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['Статья'])
+
+    def test_throttled(self):
+        throttling.SCOPES['export'] = {'ip': throttling.parse_rate('2/h')}
+        self.assertEqual(self.export(self.staff).status_code, 200)
+        self.assertEqual(self.export(self.staff).status_code, 200)
+        response = self.export(self.staff)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+
+class StaticFilesMiddlewareTests(SimpleTestCase):
+
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root)
+        os.makedirs(os.path.join(self.static_root, 'css'))
+        path = os.path.join(self.static_root, 'css', 'site.css')
+        with open(path, 'wb') as f:
+            f.write(b'body { color: red; }' * 50)
+        with open(path + '.gz', 'wb') as f:
+            f.write(b'gzipped')
+        settings_override = override_settings(STATIC_ROOT=self.static_root, STATIC_URL='/static/')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_serves_compressed_variant_without_content_disposition(self):
+        middleware = StaticFilesMiddleware(lambda request: HttpResponse('app'))
+        request = RequestFactory().get('/static/css/site.css', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        response = middleware(request)
+        self.assertEqual(b''.join(response.streaming_content), b'gzipped')
+        response.close()
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertNotIn('Content-Disposition', response)
+
+    def test_async_path_does_not_use_thread_pool(self):
+        async def get_response(request):
+            return HttpResponse('app')
+
+        middleware = StaticFilesMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        with mock.patch('django.utils.deprecation.sync_to_async', side_effect=AssertionError):
+            response = async_to_sync(middleware)(RequestFactory().get('/static/css/site.css'))
+            self.assertEqual(b''.join(response.streaming_content), b'body { color: red; }' * 50)
+            response.close()
+            response = async_to_sync(middleware)(RequestFactory().get('/articles/'))
+            self.assertEqual(response.content, b'app')
+
+
+class ThrottlingTests(TemporaryBucketStoreMixin, TestCase):
+
+    def test_bucket_allows_capacity_then_refills(self):
+        capacity, rate = throttling.parse_rate('3/m')
+        for _ in range(3):
+            self.assertEqual(throttling.take_token('k', capacity, rate, now=1000), 0)
+        self.assertAlmostEqual(throttling.take_token('k', capacity, rate, now=1000), 20)
+        # Через 20 секунд пополнился один токен
+        self.assertEqual(throttling.take_token('k', capacity, rate, now=1020), 0)
+        self.assertGreater(throttling.take_token('k', capacity, rate, now=1020), 0)
+        self.assertEqual(throttling.take_token('other', capacity, rate, now=1020), 0)
+
+    def test_sweep_removes_only_full_buckets(self):
+        capacity, rate = throttling.parse_rate('2/m')
+        throttling.take_token('old', capacity, rate, now=1000)
+        throttling.take_token('new', capacity, rate, now=1025)
+        self.assertEqual(len(self.bucket_store), 2)
+        # Ведро "old" полное к 1030, "new" - только к 1055
+        self.assertEqual(self.bucket_store.sweep(now=1040), 1)
+        self.assertEqual(len(self.bucket_store), 1)
+        self.assertEqual(throttling.take_token('new', capacity, rate, now=1040), 0)
+        self.assertGreater(throttling.take_token('new', capacity, rate, now=1040), 0)
+
+    def test_take_sweeps_periodically(self):
+        capacity, rate = throttling.parse_rate('1/s')
+        for i in range(5):
+            throttling.take_token(f'k{i}', capacity, rate, now=1000)
+        throttling.take_token('late', capacity, rate, now=1000 + throttling.SWEEP_INTERVAL)
+        self.assertEqual(len(self.bucket_store), 1)
+
+    def test_concurrent_takes_do_not_exceed_capacity(self):
+        capacity, rate = 20, 1e-6
+        allowed = []
+
+        def worker():
+            for _ in range(10):
+                allowed.append(throttling.take_token('shared', capacity, rate, now=1000) == 0)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sum(allowed), capacity)
+
+    def test_unavailable_store_lets_requests_through(self):
+        broken = throttling.BucketStore('/dev/null/throttle.sqlite3')
+        with mock.patch.object(throttling, 'bucket_store', broken), self.assertLogs('my_siteApp.throttling'):
+            self.assertEqual(throttling.take_token('k', 1, 1, now=1000), 0)
+
+    def test_login_throttled_by_username(self):
+        User.objects.create_user('victim', password='pass12345')
+        url = reverse('api_login')
+        # Часы остановлены: первый вход запускает процессы пула и может занять секунду
+        with mock.patch.dict(throttling.SCOPES, {'login': {'username': throttling.parse_rate('2/m')}}), \
+                mock.patch.object(throttling.time, 'time', return_value=1000.0):
+            for password in ('wrong1', 'wrong2'):
+                response = self.client.post(url, {'username': 'Victim', 'password': password}, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+            response = self.client.post(url, {'username': 'victim', 'password': 'pass12345'}, content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json(), {'detail': throttling.THROTTLED_MESSAGE})
+        self.assertEqual(response['Retry-After'], '30')
+
+
+class PasswordHashingPoolTests(SimpleTestCase):
+
+    def make_pool(self, **kwargs):
+        pool = hashing.PasswordHashingPool(workers=1, **kwargs)
+        # Потоки вместо процессов: функции теста не нужно сериализовать
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        patcher = mock.patch.object(pool, '_get_executor', return_value=executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return pool
+
+    def test_full_pool_rejects_immediately(self):
+        pool = self.make_pool(max_pending=2)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        futures = [pool.submit(release.wait) for _ in range(2)]
+        with self.assertRaises(hashing.HashingPoolBusy):
+            pool.submit(release.wait)
+        release.set()
+        for future in futures:
+            future.result(timeout=5)
+        # Завершенные задачи освобождают места
+        self.assertEqual(pool.submit(sum, [1, 2]).result(timeout=5), 3)
+
+    def test_timeout_returns_busy(self):
+        pool = self.make_pool(max_pending=2, timeout=0.05)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        with self.assertRaises(hashing.HashingPoolBusy):
+            pool.run(release.wait)
+
+
+class HashingAuthenticateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pass12345')
+
+    def setUp(self):
+        patcher = mock.patch.object(hashing, 'password_pool', hashing.PasswordHashingPool(workers=0))
+        self.pool = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.failed = []
+        handler = lambda sender, credentials, **kwargs: self.failed.append(credentials['username'])
+        user_login_failed.connect(handler)
+        self.addCleanup(user_login_failed.disconnect, handler)
+
+    def test_valid_credentials(self):
+        user = hashing.authenticate(username='alice', password='pass12345')
+        self.assertEqual(user, self.user)
+        self.assertEqual(user.backend, hashing.MODEL_BACKEND)
+        self.assertEqual(self.failed, [])
+
+    def test_wrong_password(self):
+        self.assertIsNone(hashing.authenticate(username='alice', password='wrong'))
+        self.assertEqual(self.failed, ['alice'])
+
+    def test_unknown_user_still_hashes_password(self):
+        # Как ModelBackend: время ответа не выдает, есть ли такой пользователь
+        with mock.patch.object(self.pool, 'make_password', wraps=self.pool.make_password) as make_password:
+            self.assertIsNone(hashing.authenticate(username='nobody', password='pass12345'))
+        make_password.assert_called_once_with('pass12345')
+        self.assertEqual(self.failed, ['nobody'])
+
+    def test_inactive_user_rejected_like_model_backend(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertIsNone(ModelBackend().authenticate(None, username='alice', password='pass12345'))
+        self.assertIsNone(hashing.authenticate(username='alice', password='pass12345'))
+        self.assertEqual(self.failed, ['alice'])
+
+    def test_busy_pool_keeps_login_form(self):
+        with mock.patch.dict(throttling.SCOPES, clear=True), \
+                mock.patch.object(self.pool, 'verify_password', side_effect=hashing.HashingPoolBusy()):
+            response = self.client.post(reverse('login'), {'username': 'alice', 'password': 'pass12345'})
+        self.assertEqual(response.status_code, 503)
+        self.assertContains(response, 'value="alice"', status_code=503)
+        self.assertNotContains(response, 'pass12345', status_code=503)
+
+
+class WriteBehindLoginTests(TransactionTestCase):
+    """Вход не пишет в базу: last_login и выданные токены ждут пачки в буферах"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pass12345')
+        for buffer in (last_login_buffer, outstanding_token_buffer):
+            buffer.flush()
+            # Фоновый поток не должен записать пачку посреди теста
+            patcher = mock.patch.object(buffer, 'max_delay', 60)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+            self.addCleanup(buffer.flush)
+        for patcher in (
+            mock.patch.object(hashing, 'password_pool', hashing.PasswordHashingPool(workers=0)),
+            mock.patch.dict(throttling.SCOPES, clear=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def login(self):
+        return self.client.post(
+            reverse('api_login'), {'username': 'alice', 'password': 'pass12345'}, content_type='application/json'
+        )
+
+    def test_jwt_login_does_not_write(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.login()
+        self.assertEqual(response.status_code, 200)
+        writes = [q['sql'] for q in context.captured_queries if not q['sql'].startswith('SELECT')]
+        self.assertEqual(writes, [])
+        self.assertEqual(len(last_login_buffer), 1)
+        self.assertEqual(len(outstanding_token_buffer), 1)
+
+    def test_flush_writes_last_login_and_tokens(self):
+        self.login()
+        self.login()
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.last_login)
+        self.assertFalse(OutstandingToken.objects.exists())
+
+        # Повторные входы одного пользователя схлопнулись в одно обновление
+        self.assertEqual(last_login_buffer.flush(), 1)
+        self.assertEqual(outstanding_token_buffer.flush(), 2)
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+        self.assertEqual(OutstandingToken.objects.filter(user=self.user).count(), 2)
+
+
+class UserProfileSaveTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pass12345')
+
+    def profile_updates(self, user):
+        with CaptureQueriesContext(connection) as context:
+            user.save()
+        table = UserProfile._meta.db_table
+        return [q['sql'] for q in context.captured_queries if q['sql'].startswith(f'UPDATE "{table}"')]
+
+    def test_unchanged_profile_is_not_saved(self):
+        user = User.objects.select_related('userprofile').get(pk=self.user.pk)
+        self.assertEqual(self.profile_updates(user), [])
+        # Профиль, который не загружали, тоже не трогается
+        self.assertEqual(self.profile_updates(User.objects.get(pk=self.user.pk)), [])
+
+    def test_changed_profile_field_is_saved(self):
+        user = User.objects.select_related('userprofile').get(pk=self.user.pk)
+        created_date = timezone.now() - timedelta(days=1)
+        user.userprofile.created_date = created_date
+        self.assertEqual(len(self.profile_updates(user)), 1)
+        self.assertEqual(UserProfile.objects.get(user=self.user).created_date, created_date)
+        # После сохранения профиль снова считается неизмененным
+        self.assertEqual(self.profile_updates(user), [])
+
+
+class FeedbackBufferTests(TransactionTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(feedback_buffer, 'max_delay', 60)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(feedback_buffer.flush)
+
+    def submit(self, name):
+        response = self.client.post(reverse('feedback'), {
+            'name': name, 'email': 'reader@example.com', 'message': 'Вопрос',
+        })
+        self.assertContains(response, name)
+
+    def test_submissions_written_by_flush(self):
+        self.submit('Иван')
+        self.submit('Мария')
+        self.assertFalse(Feedback.objects.exists())
+        self.assertEqual(feedback_buffer.flush(), 2)
+        self.assertEqual(
+            sorted(Feedback.objects.values_list('name', flat=True)), ['Иван', 'Мария']
+        )
+
+    def test_sigterm_flushes_then_calls_previous_handler(self):
+        self.submit('Иван')
+        previous = mock.Mock(side_effect=lambda signum, frame: self.assertTrue(Feedback.objects.exists()))
+        with mock.patch.object(buffers, '_previous_sigterm_handler', previous):
+            buffers._handle_sigterm(signal.SIGTERM, None)
+        previous.assert_called_once_with(signal.SIGTERM, None)
+        self.assertEqual(Feedback.objects.get().name, 'Иван')
+
+    def test_sigterm_without_previous_handler_terminates(self):
+        with mock.patch.object(buffers, '_previous_sigterm_handler', signal.SIG_DFL), \
+                mock.patch.object(buffers.signal, 'signal') as set_handler, \
+                mock.patch.object(buffers.os, 'kill') as kill:
+            buffers._handle_sigterm(signal.SIGTERM, None)
+        set_handler.assert_called_once_with(signal.SIGTERM, signal.SIG_DFL)
+        kill.assert_called_once_with(os.getpid(), signal.SIGTERM)
+
+    def test_handler_installed(self):
+        self.assertIs(signal.getsignal(signal.SIGTERM), buffers._handle_sigterm)
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        self.calls = []
+        for patcher in (
+            mock.patch.dict(jobs.TASKS),
+            mock.patch.object(jobs, 'QUEUES', {'test': 1}),
+            mock.patch.object(jobs.random, 'uniform', return_value=1.0),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        jobs.task('test.record', queue='test')(lambda value: self.calls.append(value))
+        jobs.task('test.fail', queue='test', max_attempts=2)(lambda: 1 / 0)
+
+    def test_claim_respects_queue_limit(self):
+        jobs.enqueue('test.record', {'value': 1})
+        jobs.enqueue('test.record', {'value': 2})
+        jobs.enqueue('test.record', {'value': 3}, delay=60)
+        first = jobs.claim(['test'], 'worker-1')
+        self.assertEqual((first.payload, first.status, first.attempts), ({'value': 1}, Job.RUNNING, 1))
+        # Лимит очереди 1: вторая задача ждет, пока выполняется первая
+        self.assertIsNone(jobs.claim(['test'], 'worker-2'))
+        self.assertTrue(jobs.run_job(first))
+        second = jobs.claim(['test'], 'worker-2')
+        self.assertEqual(second.payload, {'value': 2})
+        self.assertTrue(jobs.run_job(second))
+        # Отложенная задача еще не готова
+        self.assertIsNone(jobs.claim(['test'], 'worker-1'))
+        self.assertEqual(self.calls, [1, 2])
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_dedupe_only_while_pending(self):
+        jobs.enqueue('test.record', {'value': 1}, dedupe_key='k')
+        jobs.enqueue('test.record', {'value': 2}, dedupe_key='k')
+        self.assertEqual(Job.objects.count(), 1)
+        job = jobs.claim(['test'], 'worker')
+        # Выполняемая задача могла прочитать старые данные - новая ставится
+        jobs.enqueue('test.record', {'value': 3}, dedupe_key='k')
+        self.assertEqual(Job.objects.filter(status=Job.PENDING).count(), 1)
+        self.assertTrue(jobs.run_job(job))
+        self.assertEqual(Job.objects.get().payload, {'value': 3})
+
+    def test_failed_job_backs_off_then_fails(self):
+        jobs.enqueue('test.fail')
+        job = jobs.claim(['test'], 'worker')
+        before = timezone.now()
+        with self.assertLogs('my_siteApp.jobs', 'WARNING'):
+            self.assertFalse(jobs.run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.PENDING)
+        self.assertIn('ZeroDivisionError', job.last_error)
+        self.assertGreaterEqual(job.run_at, before + timedelta(seconds=jobs.BACKOFF))
+        self.assertIsNone(jobs.claim(['test'], 'worker'))
+
+        Job.objects.update(run_at=timezone.now())
+        job = jobs.claim(['test'], 'worker')
+        with self.assertLogs('my_siteApp.jobs', 'ERROR'):
+            self.assertFalse(jobs.run_job(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertIsNone(jobs.claim(['test'], 'worker'))
+
+    def test_backoff_grows_up_to_limit(self):
+        self.assertEqual(jobs.get_backoff(1), jobs.BACKOFF)
+        self.assertEqual(jobs.get_backoff(3), jobs.BACKOFF * 4)
+        self.assertEqual(jobs.get_backoff(100), jobs.MAX_BACKOFF)
+
+    def test_requeue_stale(self):
+        stale_at = timezone.now() - timedelta(seconds=jobs.LOCK_TIMEOUT + 1)
+        running = dict(queue='test', name='test.record', status=Job.RUNNING, locked_by='dead')
+        stale = Job.objects.create(payload={'value': 1}, attempts=1, locked_at=stale_at, **running)
+        exhausted = Job.objects.create(payload={'value': 2}, attempts=5, locked_at=stale_at, **running)
+        alive = Job.objects.create(payload={'value': 3}, attempts=1, locked_at=timezone.now(), **running)
+        duplicate = Job.objects.create(payload={'value': 4}, attempts=1, locked_at=stale_at, dedupe_key='k', **running)
+        jobs.enqueue('test.record', {'value': 5}, dedupe_key='k')
+
+        self.assertEqual(jobs.requeue_stale(), 3)
+        statuses = dict(Job.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[stale.id], Job.PENDING)
+        self.assertEqual(statuses[exhausted.id], Job.FAILED)
+        self.assertEqual(statuses[alive.id], Job.RUNNING)
+        # Такая же задача уже ждет в очереди - зависшая удаляется
+        self.assertNotIn(duplicate.id, statuses)
+
+    def test_rollback_discards_job(self):
+        with self.assertRaises(ZeroDivisionError), transaction.atomic():
+            jobs.enqueue('test.record', {'value': 1})
+            1 / 0
+        self.assertFalse(Job.objects.exists())
+
+
+class ArticleReindexJobTests(TransactionTestCase):
+    """Статья и задача переиндексации фиксируются вместе (без TestCase.atomic)"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('author', password='pass12345', is_staff=True)
+        # Только access-токен: refresh через for_user оставил бы запись в буфере
+        self.headers = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.data = {'title': 'Статья', 'text': 'Текст', 'category': 'news'}
+
+    def test_create_enqueues_reindex(self):
+        response = self.client.post(reverse('api_create_article'), self.data, content_type='application/json', **self.headers)
+        self.assertEqual(response.status_code, 201)
+        job = Job.objects.get(name='search.reindex_articles')
+        self.assertEqual(job.payload, {'ids': [response.json()['id']]})
+
+    def test_failed_enqueue_rolls_back_article(self):
+        with mock.patch.object(jobs, 'enqueue', side_effect=DatabaseError), self.assertRaises(DatabaseError):
+            self.client.post(reverse('api_create_article'), self.data, content_type='application/json', **self.headers)
+        self.assertFalse(Article.objects.exists())
+
+        self.client.force_login(self.user)
+        with mock.patch.object(jobs, 'enqueue', side_effect=DatabaseError), self.assertRaises(DatabaseError):
+            self.client.post(reverse('create_article'), self.data)
+        self.assertFalse(Article.objects.exists())
+
+
+class CommentCountTests(ArticleTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.admin = User.objects.create_superuser('admin', password='pass12345')
+        cls.other = Article.objects.create(title='Другая', text='Текст', category='news', user=cls.author)
+
+    def setUp(self):
+        patcher = mock.patch.dict(throttling.SCOPES, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+
+    def add_comment(self, article):
+        response = self.api.post(
+            reverse('api_create_comment'), {'article': article.id, 'author_name': 'Гость', 'text': 'Комментарий'}
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def comment_count(self, article):
+        return Article.objects.values_list('comment_count', flat=True).get(pk=article.pk)
+
+    def test_api_keeps_counter(self):
+        first = self.add_comment(self.article)
+        self.add_comment(self.article)
+        self.assertEqual(self.comment_count(self.article), 2)
+        self.assertEqual(self.api.delete(reverse('api_delete_comment', args=[first])).status_code, 204)
+        self.assertEqual(self.comment_count(self.article), 1)
+
+    def test_counter_never_goes_negative(self):
+        comment_id = self.add_comment(self.article)
+        Article.objects.filter(pk=self.article.pk).update(comment_count=0)
+        self.assertEqual(self.api.delete(reverse('api_delete_comment', args=[comment_id])).status_code, 204)
+        self.assertEqual(self.comment_count(self.article), 0)
+        Article.adjust_comment_counts({self.article.pk: -5, self.other.pk: 2})
+        self.assertEqual(self.comment_count(self.article), 0)
+        self.assertEqual(self.comment_count(self.other), 2)
+
+    def test_most_discussed_order(self):
+        self.add_comment(self.other)
+        self.add_comment(self.other)
+        self.add_comment(self.article)
+        third = Article.objects.create(title='Без комментариев', text='Текст', category='works', user=self.author)
+        url = reverse('api_articles_sorted_by_comments')
+        data = self.client.get(url, {'page_size': 2}).json()
+        self.assertEqual([item['id'] for item in data['results']], [self.other.id, self.article.id])
+        self.assertEqual([item['comment_count'] for item in data['results']], [2, 1])
+        data = self.client.get(data['next']).json()
+        self.assertEqual([item['id'] for item in data['results']], [third.id])
+        data = self.client.get(url, {'order': 'asc'}).json()
+        self.assertEqual([item['id'] for item in data['results']], [third.id, self.article.id, self.other.id])
+
+    def reconcile(self, *args):
+        out = StringIO()
+        call_command('reconcile_comment_counts', *args, stdout=out)
+        return out.getvalue()
+
+    def test_reconcile_fixes_drift(self):
+        self.add_comment(self.article)
+        Article.objects.filter(pk=self.article.pk).update(comment_count=7)
+        Article.objects.filter(pk=self.other.pk).update(comment_count=3)
+
+        output = self.reconcile('--dry-run')
+        self.assertIn('Найдено расхождений: 2', output)
+        self.assertEqual(self.comment_count(self.article), 7)
+
+        with mock.patch.object(pagecache, 'invalidate_articles') as invalidate, \
+                self.captureOnCommitCallbacks(execute=True):
+            output = self.reconcile('--batch-size', '1')
+        self.assertIn('Исправлено расхождений: 2', output)
+        self.assertEqual(self.comment_count(self.article), 1)
+        self.assertEqual(self.comment_count(self.other), 0)
+        invalidated = [article.pk for call in invalidate.call_args_list for article in call.args[0]]
+        self.assertEqual(sorted(invalidated), sorted([self.article.pk, self.other.pk]))
+
+    def test_reconcile_keeps_concurrent_comment(self):
+        Article.objects.filter(pk=self.article.pk).update(comment_count=5)
+        find_drifted = reconcile_comment_counts.Command.find_drifted
+
+        def find_then_comment(command, batch):
+            drifted = find_drifted(command, batch)
+            # Комментарий добавлен между подсчетом и записью
+            self.add_comment(self.article)
+            return drifted
+
+        with mock.patch.object(reconcile_comment_counts.Command, 'find_drifted', find_then_comment):
+            self.reconcile()
+        self.assertEqual(self.comment_count(self.article), 1)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'blacklist-tests'}},
+)
+class BlacklistFilterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='pass12345')
+
+    def setUp(self):
+        # Фильтр процесса мог остаться от прошлых тестов: строим заново и
+        # запоминаем версию и эпоху из очищенного кеша
+        tokens.cache.clear()
+        tokens.blacklist_filter.rebuild()
+        tokens.blacklist_filter.might_contain('')
+
+    def revoke(self, token):
+        with self.captureOnCommitCallbacks(execute=True):
+            token.blacklist()
+
+    def test_bloom_filter(self):
+        bloom = tokens.BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f'jti-{i}')
+        self.assertTrue(all(f'jti-{i}' in bloom for i in range(1000)))
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 200)
+
+    def test_revoked_token_rejected_on_refresh(self):
+        token = FilteredRefreshToken.for_user(self.user)
+        self.revoke(token)
+        self.assertTrue(tokens.blacklist_filter.might_contain(token['jti']))
+        response = self.client.post(reverse('api_token_refresh'), {'refresh': str(token)}, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_other_process_syncs_after_revoke(self):
+        # Фильтр соседнего воркера: построен до отзыва, узнает о нем по версии в кеше
+        other = tokens.BlacklistFilter()
+        token = FilteredRefreshToken.for_user(self.user)
+        self.assertFalse(other.might_contain(token['jti']))
+        self.revoke(token)
+        with self.assertNumQueries(1):
+            self.assertTrue(other.might_contain(token['jti']))
+        with self.assertNumQueries(0):
+            self.assertTrue(other.might_contain(token['jti']))
+
+    def test_database_checked_only_on_filter_match(self):
+        token = FilteredRefreshToken.for_user(self.user)
+        # Конструктор проверяет отзыв (check_blacklist)
+        with self.assertNumQueries(0):
+            FilteredRefreshToken(str(token))
+        # Ложное срабатывание фильтра: решает запрос к базе
+        with mock.patch.object(tokens.blacklist_filter, 'might_contain', return_value=True), self.assertNumQueries(1):
+            FilteredRefreshToken(str(token))
+        self.revoke(token)
+        with self.assertRaises(TokenError):
+            FilteredRefreshToken(str(token))
+
+    def test_compaction_removes_expired_and_resets_filters(self):
+        expired_at = timezone.now() - timedelta(days=1)
+        expired = OutstandingToken.objects.create(
+            user=self.user, jti='expired', token='x', created_at=expired_at, expires_at=expired_at
+        )
+        BlacklistedToken.objects.create(token=expired)
+        live = FilteredRefreshToken.for_user(self.user)
+        self.revoke(live)
+        self.assertTrue(tokens.blacklist_filter.might_contain('expired'))
+
+        out = StringIO()
+        call_command('compact_token_blacklist', '--batch-size', '1', stdout=out)
+        self.assertIn('Удалено выданных токенов: 1, отозванных: 1', out.getvalue())
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), [live['jti']])
+        # Новая эпоха: фильтр перестроен без удаленных записей
+        self.assertFalse(tokens.blacklist_filter.might_contain('expired'))
+        self.assertTrue(tokens.blacklist_filter.might_contain(live['jti']))
+
+
+class AsyncEndpointTests(ArticleTestCase):
+    """Асинхронные эндпоинты отвечают так же, как синхронные"""
+    PAIRS = [
+        ('api_articles_list', 'api_articles_list_async', []),
+        ('api_articles_by_category', 'api_articles_by_category_async', ['works']),
+        ('api_comments_list', 'api_comments_list_async', []),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(4):
+            article = Article.objects.create(
+                title=f'Статья {i}', text='Текст', category='works' if i % 2 else 'news', user=cls.author
+            )
+            Comment.objects.create(article=article, author_name='Гость', text=f'Комментарий {i}')
+            Comment.objects.create(article=cls.article, author_name='Гость', text=f'Ответ {i}')
+
+    def get(self, url, params=None, **headers):
+        return self.client.get(url, params or {}, HTTP_ACCEPT='application/json', **headers)
+
+    def walk(self, url):
+        items, params, cursors = [], {'page_size': 2}, []
+        while True:
+            data = self.get(url, params).json()
+            items += data['results']
+            if not data['next']:
+                return items, cursors
+            params = parse_qs(urlparse(data['next']).query)
+            cursors.append(params['cursor'][0])
+
+    def test_pages_match_sync_endpoints(self):
+        for sync_name, async_name, args in self.PAIRS:
+            for params in ({}, {'order': 'asc'}, {'fields': 'id'}):
+                with self.subTest(url=sync_name, params=params):
+                    sync_data = self.get(reverse(sync_name, args=args), params).json()
+                    async_data = self.get(reverse(async_name, args=args), params).json()
+                    self.assertEqual(async_data['results'], sync_data['results'])
+
+        url = reverse('api_article_detail', args=[self.article.id])
+        async_url = reverse('api_article_detail_async', args=[self.article.id])
+        self.assertEqual(self.get(async_url).json(), self.get(url).json())
+
+    def test_cursor_round_trip(self):
+        for sync_name, async_name, args in self.PAIRS:
+            with self.subTest(url=async_name):
+                async_items, async_cursors = self.walk(reverse(async_name, args=args))
+                sync_items, sync_cursors = self.walk(reverse(sync_name, args=args))
+                self.assertEqual(async_items, sync_items)
+                self.assertEqual(async_cursors, sync_cursors)
+                self.assertEqual(len({item['id'] for item in async_items}), len(async_items))
+
+    def test_conditional_get(self):
+        urls = [(reverse(sync_name, args=args), reverse(async_name, args=args)) for sync_name, async_name, args in self.PAIRS]
+        urls.append((reverse('api_article_detail', args=[self.article.id]),
+                     reverse('api_article_detail_async', args=[self.article.id])))
+        for sync_url, async_url in urls:
+            with self.subTest(url=async_url):
+                response = self.get(async_url)
+                etag = response['ETag']
+                self.assertEqual(etag, self.get(sync_url)['ETag'])
+                self.assertIn('Last-Modified', response)
+                self.assertEqual(self.get(async_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        etag = self.get(urls[0][1])['ETag']
+        Comment.objects.create(article=self.article, author_name='Гость', text='Новый')
+        Article.adjust_comment_count(self.article.pk, 1)
+        self.assertEqual(self.get(urls[0][1], HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.get(reverse('api_article_detail_async', args=[0])).status_code, 404)
+
+
+class ImportContentTests(ArticleTestCase):
+
+    def import_rows(self, kind, rows, suffix='.ndjson'):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, f'{kind}{suffix}')
+        with open(path, 'w', encoding='utf-8') as f:
+            if suffix == '.csv':
+                f.write(rows)
+            else:
+                f.write('\n'.join(json.dumps(row, ensure_ascii=False) for row in rows))
+        out, err = StringIO(), StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_content', kind, path, '--batch-size', '2', stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_articles(self):
+        out, err = self.import_rows('articles', [
+            {'title': 'Импорт', 'text': 'Текст <b>', 'category': 'news', 'author': 'author',
+             'created_date': '2024-01-02T03:04:05'},
+            {'title': 'Без категории', 'author': 'author'},
+            {'title': 'Чужой', 'author': 'nobody'},
+            {'title': '', 'author': 'author'},
+            {'title': 'Дата', 'author': 'author', 'created_date': 'вчера'},
+            {'title': 'Категория', 'author': 'author', 'category': 'blog'},
+            {'title': 5, 'author': 'author'},
+            {'title': 'Автор', 'author': ['author']},
+            {'title': 'Текст', 'author': 'author', 'text': {'a': 1}},
+        ])
+        self.assertIn('Создано: 2, пропущено: 7 из 9', out)
+        self.assertIn('должны быть строками: title', err)
+        article = Article.objects.get(title='Импорт')
+        self.assertEqual((article.category, article.created_date.year), ('news', 2024))
+        self.assertEqual(article.rendered_html, '<p>Текст &lt;b&gt;</p>')
+        self.assertEqual(Article.objects.get(title='Без категории').category, 'news')
+        imported = sorted(Article.objects.exclude(pk=self.article.pk).values_list('id', flat=True))
+        self.assertIn(imported, [job.payload['ids'] for job in Job.objects.all()])
+
+    def test_comments(self):
+        out, err = self.import_rows('comments', [
+            {'article': self.article.id, 'text': 'Первый', 'author_name': 'Гость'},
+            {'article': str(self.article.id), 'text': 'Второй', 'author_name': 'Гость'},
+            {'article': 0, 'text': 'Нет статьи', 'author_name': 'Гость'},
+            {'article': self.article.id, 'text': '', 'author_name': 'Гость'},
+            {'article': self.article.id, 'text': 'Имя', 'author_name': 5},
+            {'article': self.article.id, 'text': 7, 'author_name': 'Гость'},
+        ])
+        self.assertIn('Создано: 2, пропущено: 4 из 6', out)
+        self.assertIn('должны быть строками: author_name', err)
+        self.article.refresh_from_db()
+        self.assertEqual(self.article.comment_count, 2)
+
+    def test_users_csv(self):
+        out, _ = self.import_rows(
+            'users',
+            'username,email,password\nreader,r@example.com,secret123\nauthor,a@example.com,\n,x@example.com,\n',
+            suffix='.csv',
+        )
+        self.assertIn('Создано: 1, пропущено: 2 из 3', out)
+        user = User.objects.get(username='reader')
+        self.assertTrue(user.check_password('secret123'))
+        self.assertTrue(UserProfile.objects.filter(user=user).exists())
+
+    def test_users_wrong_types(self):
+        out, err = self.import_rows('users', [
+            {'username': 'reader', 'email': 'r@example.com'},
+            {'username': 'writer', 'password': 12345},
+        ])
+        self.assertIn('Создано: 1, пропущено: 1 из 2', out)
+        self.assertIn('должны быть строками: password', err)
+
+
+class ResponsiveImageTests(SimpleTestCase):
+    MANIFEST = {
+        'images/picture.jpg': {
+            'digest': 'abc123',
+            'width': 640,
+            'height': 480,
+            'variants': {
+                'avif': [[320, 'responsive/picture-abc123-320w.avif'], [640, 'responsive/picture-abc123-640w.avif']],
+                'webp': [[320, 'responsive/picture-abc123-320w.webp'], [640, 'responsive/picture-abc123-640w.webp']],
+                'jpeg': [[320, 'responsive/picture-abc123-320w.jpg'], [640, 'responsive/picture-abc123-640w.jpg']],
+            },
+        },
+        'images/webp-only.png': {
+            'digest': 'def456',
+            'width': 320,
+            'height': 200,
+            'variants': {'webp': [[320, 'responsive/webp-only-def456-320w.webp']]},
+        },
+    }
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        for patcher in (
+            mock.patch.object(images, 'ROOT', self.root),
+            mock.patch.dict(images._manifest_cache, {'mtime': None, 'data': {}}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write_manifest(self, manifest):
+        images.write_manifest(manifest)
+        # Время изменения должно отличаться от прошлой записи
+        stat = os.stat(images.manifest_path())
+        os.utime(images.manifest_path(), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    def render(self, path, extra=''):
+        return Template(
+            "{% load responsive_images %}{% responsive_image path alt='Картина' " + extra + " %}"
+        ).render(Context({'path': path}))
+
+    def test_manifest_lookup_and_reload(self):
+        self.assertIsNone(images.get_image('images/picture.jpg'))
+        self.write_manifest(self.MANIFEST)
+        self.assertEqual(images.get_image('images/picture.jpg')['width'], 640)
+        self.assertIsNone(images.get_image('images/other.jpg'))
+        self.write_manifest({})
+        self.assertIsNone(images.get_image('images/picture.jpg'))
+
+    def test_broken_manifest_treated_as_empty(self):
+        os.makedirs(os.path.dirname(images.manifest_path()))
+        with open(images.manifest_path(), 'w') as f:
+            f.write('{not json')
+        self.assertIsNone(images.get_image('images/picture.jpg'))
+
+    def test_picture_with_srcset(self):
+        self.write_manifest(self.MANIFEST)
+        html = self.render('images/picture.jpg', "sizes='(max-width: 768px) 300px, 400px' class='rounded'")
+        sizes = 'sizes="(max-width: 768px) 300px, 400px"'
+        self.assertTrue(html.startswith('<picture><source type="image/avif" '))
+        self.assertIn(
+            '<source type="image/avif" srcset="/static/responsive/picture-abc123-320w.avif 320w, '
+            f'/static/responsive/picture-abc123-640w.avif 640w" {sizes}>', html
+        )
+        self.assertLess(html.index('image/avif'), html.index('image/webp'))
+        self.assertIn(
+            '<img src="/static/responsive/picture-abc123-640w.jpg" '
+            'srcset="/static/responsive/picture-abc123-320w.jpg 320w, /static/responsive/picture-abc123-640w.jpg 640w" '
+            f'{sizes} alt="Картина" loading="lazy" decoding="async" width="640" height="480" class="rounded">',
+            html,
+        )
+
+    def test_without_jpeg_falls_back_to_original(self):
+        self.write_manifest(self.MANIFEST)
+        html = self.render('images/webp-only.png')
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn('<img src="/static/images/webp-only.png" alt="Картина"', html)
+
+    def test_without_manifest_plain_img(self):
+        html = self.render('images/picture.jpg', "width='300'")
+        self.assertEqual(
+            html, '<img src="/static/images/picture.jpg" alt="Картина" loading="lazy" decoding="async" width="300">'
+        )
+
+    def test_target_widths(self):
+        with mock.patch.object(images, 'WIDTHS', [320, 480, 640, 800]):
+            self.assertEqual(images.target_widths(500), [320, 480, 500])
+            self.assertEqual(images.target_widths(2000), [320, 480, 640, 800])
+            self.assertEqual(images.target_widths(100), [100])
+
+    def test_build_without_pillow(self):
+        with mock.patch.dict(sys.modules, {'PIL': None}), self.assertRaisesMessage(CommandError, 'Pillow'):
+            call_command('build_images')
+
+    @skipUnless(find_spec('PIL'), 'нужен Pillow')
+    def test_build_only_changed_sources(self):
+        from PIL import Image
+
+        os.makedirs(os.path.join(self.root, 'images'))
+        source = os.path.join(self.root, 'images', 'picture.png')
+        Image.new('RGB', (500, 300), 'red').save(source)
+        with mock.patch.object(images, 'FORMATS', ['jpeg']):
+            self.assertEqual(images.build_all(), (1, 0))
+            entry = images.read_manifest()['images/picture.png']
+            self.assertEqual([width for width, _ in entry['variants']['jpeg']], [320, 480, 500])
+            self.assertTrue(all(os.path.exists(os.path.join(self.root, name)) for name in images.output_files(entry)))
+            self.assertEqual(images.build_all(), (0, 1))
+            os.remove(source)
+            self.assertEqual(images.build_all(), (0, 0))
+        self.assertEqual(images.read_manifest(), {})
+        self.assertFalse(any(os.path.exists(os.path.join(self.root, name)) for name in images.output_files(entry)))
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    'template_fragments': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'fragment-tests'},
+})
+class CommentFragmentTests(ArticleTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.old = Comment.objects.create(article=cls.article, author_name='Гость', text='Старый комментарий')
+        Comment.objects.filter(pk=cls.old.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        Comment.objects.create(article=cls.article, author_name='Гость', text='Новый комментарий')
+        Article.adjust_comment_count(cls.article.pk, 2)
+
+    def setUp(self):
+        patcher = mock.patch.dict(throttling.SCOPES, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_page(self):
+        response = self.client.get(reverse('news_detail', args=[self.article.id]))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_create_changes_fragment_key(self):
+        version = self.get_page().context['comments_version']
+        response = self.client.post(
+            reverse('news_detail', args=[self.article.id]), {'author_name': 'Читатель', 'text': 'Свежий'}, follow=True
+        )
+        self.assertNotEqual(response.context['comments_version'], version)
+        self.assertContains(response, 'Свежий')
+
+    def test_delete_changes_fragment_key_despite_drifted_counter(self):
+        response = self.get_page()
+        version = response.context['comments_version']
+        self.assertContains(response, 'Старый комментарий')
+        # Удаление старого комментария не меняет max(updated_at), а счетчик
+        # статьи не уменьшен (расхождение, которое чинит reconcile_comment_counts)
+        self.old.delete()
+        response = self.get_page()
+        self.assertNotEqual(response.context['comments_version'], version)
+        self.assertNotContains(response, 'Старый комментарий')
+        self.assertContains(response, 'Комментарии (1)')
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'my_siteApp.cachestats.InstrumentedLocMemCache', 'LOCATION': 'stats-default'},
+    'template_fragments': {'BACKEND': 'my_siteApp.cachestats.InstrumentedLocMemCache', 'LOCATION': 'stats-fragments'},
+})
+class CacheStatsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='pass12345')
+        cls.reader = User.objects.create_user('reader', password='pass12345')
+
+    def setUp(self):
+        cachestats.reset_all_stats()
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+
+    def test_hit_rate(self):
+        from django.core.cache import caches
+
+        fragments = caches['template_fragments']
+        fragments.set('key', 'value')
+        fragments.get('key')
+        fragments.get('key')
+        fragments.get('missing')
+        stats = self.api.get(reverse('api_cache_stats')).json()
+        self.assertEqual(stats['template_fragments'], {'hits': 2, 'misses': 1, 'hit_rate': 0.6667})
+        self.assertIn('default', stats)
+
+        self.assertEqual(self.api.delete(reverse('api_cache_stats')).status_code, 204)
+        stats = self.api.get(reverse('api_cache_stats')).json()
+        self.assertEqual(stats['template_fragments'], {'hits': 0, 'misses': 0, 'hit_rate': None})
+
+    def test_staff_only(self):
+        self.api.force_authenticate(self.reader)
+        self.assertEqual(self.api.get(reverse('api_cache_stats')).status_code, 403)
+
+
+class RenderedFieldsTests(ArticleTestCase):
+
+    def test_save_recomputes_rendered_fields(self):
+        text = ' '.join(f'слово{i}' for i in range(40)) + '\n\n<script>'
+        self.article.text = text
+        self.article.save()
+        self.article.refresh_from_db()
+        self.assertEqual(self.article.excerpt, ' '.join(f'слово{i}' for i in range(30)) + ' …')
+        self.assertTrue(self.article.rendered_html.startswith('<p>слово0 '))
+        self.assertIn('<p>&lt;script&gt;</p>', self.article.rendered_html)
+
+    def test_update_fields_with_text_includes_rendered_fields(self):
+        self.article.text = 'Первая строка\nВторая'
+        with CaptureQueriesContext(connection) as context:
+            self.article.save(update_fields=['text'])
+        updates = [q['sql'] for q in context.captured_queries if q['sql'].startswith('UPDATE "my_siteApp_article"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"rendered_html"', updates[0])
+        self.article.refresh_from_db()
+        self.assertEqual(self.article.rendered_html, '<p>Первая строка<br>Вторая</p>')
+        self.assertEqual(self.article.excerpt, 'Первая строка Вторая')
+
+    def test_deferred_text_keeps_rendered_fields(self):
+        article = Article.objects.defer('text').get(pk=self.article.pk)
+        article.title = 'Новый заголовок'
+        article.save()
+        self.article.refresh_from_db()
+        self.assertEqual(self.article.rendered_html, '<p>Текст статьи</p>')
+
+    def backfill(self, *args):
+        out = StringIO()
+        call_command('backfill_article_html', *args, stdout=out)
+        return out.getvalue()
+
+    def test_backfill_fills_only_stale_rows(self):
+        stale = Article.objects.create(title='Старая', text='Текст старой', category='works', user=self.author)
+        Article.objects.filter(pk=stale.pk).update(excerpt='', rendered_html='')
+        # Заполненная строка с нестандартным HTML: без --all ее не трогают
+        Article.objects.filter(pk=self.article.pk).update(rendered_html='<p>вручную</p>')
+
+        self.assertIn('Обновлено статей: 1', self.backfill('--batch-size', '1'))
+        stale.refresh_from_db()
+        self.assertEqual((stale.excerpt, stale.rendered_html), ('Текст старой', '<p>Текст старой</p>'))
+        self.article.refresh_from_db()
+        self.assertEqual(self.article.rendered_html, '<p>вручную</p>')
+
+        self.assertIn('Обновлено статей: 0', self.backfill())
+        self.assertIn('Обновлено статей: 2', self.backfill('--all'))
+        self.article.refresh_from_db()
+        self.assertEqual(self.article.rendered_html, '<p>Текст статьи</p>')
+
+
+class ValuesFastPathTests(ArticleTestCase):
+    """Быстрый путь (.values() + ORJSONRenderer) должен отдавать те же байты, что DRF"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.odd_article = Article.objects.create(
+            title='Заголовок \u2028 с «кавычками» и \u2029',
+            text='Ünïcödé ✓ \u2028 текст <b>"</b>',
+            category='works',
+            user=cls.author,
+        )
+        Comment.objects.create(article=cls.article, author_name='Гость', text='Обычный')
+        Comment.objects.create(article=cls.odd_article, author_name='Ёж \u2028', text='😀 \u2029 \\ "')
+
+    def render_both(self, serializer_class, queryset, fields=None):
+        serializer = serializer_class(fields=fields, list_mode=True)
+        self.assertTrue(serializer.can_use_values())
+        queryset = queryset.order_by('-created_date', '-id')
+
+        rows = list(serializer.optimize_queryset(queryset))
+        expected = JSONRenderer().render(serializer_class(rows, many=True, fields=fields, list_mode=True).data)
+        actual = ORJSONRenderer().render(serializer.represent_values(list(serializer.get_values_queryset(queryset))))
+        return expected, actual
+
+    def test_same_bytes(self):
+        for serializer_class, queryset in (
+            (ArticleSerializer, Article.objects.all()),
+            (CommentSerializer, Comment.objects.all()),
+        ):
+            with self.subTest(serializer=serializer_class.__name__):
+                expected, actual = self.render_both(serializer_class, queryset)
+                self.assertEqual(actual, expected)
+                self.assertIn(b'\\u2028', actual)
+                self.assertNotIn('\u2028'.encode(), actual)
+                # Не-ASCII пишется как есть, без \\u-экранирования
+                self.assertNotIn(b'\\u04', actual)
+
+    def test_same_bytes_for_field_subsets(self):
+        for serializer_class, queryset, fields in (
+            (ArticleSerializer, Article.objects.all(), ['id', 'title', 'author_name']),
+            (ArticleSerializer, Article.objects.all(), ['text', 'created_date']),
+            (CommentSerializer, Comment.objects.all(), ['article_title', 'text']),
+            (CommentSerializer, Comment.objects.all(), ['created_date']),
+        ):
+            with self.subTest(fields=fields):
+                expected, actual = self.render_both(serializer_class, queryset, fields)
+                self.assertEqual(actual, expected)
+                self.assertEqual(list(json.loads(actual)[0]), [
+                    name for name in serializer_class.Meta.fields if name in fields
+                ])
+
+    def test_same_bytes_for_null_dates(self):
+        # В схеме даты NOT NULL, поэтому строки с NULL собираем вручную:
+        # одни и те же значения - моделью для DRF и словарем для .values()
+        comments = [
+            Comment(id=1, article=self.article, author_name='Гость', text='Без даты', created_date=None),
+            Comment(id=2, article=self.odd_article, author_name='Гость', text='\u2028', created_date=timezone.now()),
+        ]
+        rows = [
+            {
+                'id': comment.id,
+                'text': comment.text,
+                'created_date': comment.created_date,
+                'author_name': comment.author_name,
+                'article': comment.article_id,
+                'article_title': comment.article.title,
+            }
+            for comment in comments
+        ]
+        serializer = CommentSerializer(list_mode=True)
+        expected = JSONRenderer().render(CommentSerializer(comments, many=True, list_mode=True).data)
+        actual = ORJSONRenderer().render(serializer.represent_values(rows))
+        self.assertEqual(actual, expected)
+        self.assertIn(b'"created_date":null', actual)
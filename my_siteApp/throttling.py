@@ -0,0 +1,265 @@
+"""
+Ограничение частоты запросов (token bucket) для входа, регистрации,
+анонимных комментариев и выгрузок.
+
+У каждого ключа (IP клиента или имя пользователя из формы) свое ведро на N
+токенов, которое пополняется со скоростью N токенов за период. Запрос
+забирает токен, а при пустом ведре сразу получает 429 с Retry-After - до
+DRF, разбора формы, хеширования пароля и запросов к базе. Лимиты задаются
+по эндпоинтам в THROTTLES.
+
+Ведра хранятся в отдельной SQLite-базе THROTTLE_DB (общей для всех
+воркеров на машине), одна строка на ключ. Проверка - одна короткая
+транзакция BEGIN IMMEDIATE по первичному ключу, поэтому параллельные
+воркеры не проскакивают лимит, а ее цена не растет с числом ведер (в
+отличие от файлового кеша Django, который при каждой записи обходит весь
+каталог). Ведра, которые снова наполнились, не нужны: каждый процесс раз
+в SWEEP_INTERVAL секунд удаляет их по индексу пачками. Если база ведер
+недоступна, запрос пропускается (с записью в лог).
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse, JsonResponse
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_DB = getattr(
+    settings, 'THROTTLE_DB', os.path.join(settings.BASE_DIR, 'cache', 'throttle.sqlite3')
+)
+SWEEP_INTERVAL = 60
+SWEEP_BATCH = 1000
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+THROTTLED_MESSAGE = 'Слишком много запросов, попробуйте позже'
+
+
+def parse_rate(rate):
+    """'10/m' -> (емкость ведра, пополнение в токенах за секунду)"""
+    try:
+        count, period = rate.split('/')
+        capacity = int(count)
+        seconds = PERIODS[period[0]]
+    except (ValueError, KeyError, IndexError):
+        raise ImproperlyConfigured(f'THROTTLES: неверный лимит {rate!r}, ожидается "число/s|m|h|d"')
+    if capacity <= 0:
+        raise ImproperlyConfigured(f'THROTTLES: лимит {rate!r} должен быть положительным')
+    return capacity, capacity / seconds
+
+
+SCOPES = {
+    scope: {kind: parse_rate(rate) for kind, rate in limits.items()}
+    for scope, limits in getattr(settings, 'THROTTLES', {}).items()
+}
+
+
+class ThrottleStats:
+    """Счетчики пропущенных и отклоненных запросов по эндпоинтам (в памяти процесса)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def record(self, scope, rejected_by=None):
+        with self._lock:
+            counts = self._counts.setdefault(scope, {'allowed': 0, 'rejected': {}})
+            if rejected_by is None:
+                counts['allowed'] += 1
+            else:
+                counts['rejected'][rejected_by] = counts['rejected'].get(rejected_by, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                scope: {'allowed': counts['allowed'], 'rejected': dict(counts['rejected'])}
+                for scope, counts in self._counts.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+stats = ThrottleStats()
+
+
+class BucketStore:
+    """Ведра в SQLite: соединение на поток, одна транзакция на проверку"""
+
+    def __init__(self, path, sweep_interval=SWEEP_INTERVAL):
+        self.path = path
+        self.sweep_interval = sweep_interval
+        self._local = threading.local()
+        self._next_sweep = 0
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # isolation_level=None: транзакциями управляем сами (BEGIN IMMEDIATE)
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        # Потеря последних изменений ведер при сбое питания не страшна
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS bucket ('
+            'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, '
+            'expires REAL NOT NULL) WITHOUT ROWID'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS bucket_expires ON bucket (expires)')
+        return conn
+
+    def get_connection(self):
+        # После fork соединение родителя использовать нельзя
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.conn = self._connect()
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def take(self, key, capacity, rate, now):
+        """0, если токен взят, иначе сколько секунд ждать следующего"""
+        conn = self.get_connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM bucket WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row or (capacity, now)
+            tokens = min(capacity, tokens + max(now - updated, 0) * rate)
+            if tokens < 1:
+                # Отказ ничего не пишет: ведро пополнится по времени
+                conn.execute('COMMIT')
+                return (1 - tokens) / rate
+            tokens -= 1
+            # expires - момент, когда ведро снова полное и строку можно удалить
+            conn.execute(
+                'INSERT INTO bucket (key, tokens, updated, expires) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, '
+                'updated = excluded.updated, expires = excluded.expires',
+                (key, tokens, now, now + (capacity - tokens) / rate),
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_interval
+            self.sweep(now)
+        return 0
+
+    def sweep(self, now=None):
+        """Удалить наполнившиеся ведра пачками по SWEEP_BATCH; возвращает число удаленных"""
+        now = time.time() if now is None else now
+        conn = self.get_connection()
+        deleted = 0
+        while True:
+            cursor = conn.execute(
+                'DELETE FROM bucket WHERE key IN '
+                '(SELECT key FROM bucket WHERE expires <= ? LIMIT ?)',
+                (now, SWEEP_BATCH),
+            )
+            deleted += cursor.rowcount
+            if cursor.rowcount < SWEEP_BATCH:
+                return deleted
+
+    def __len__(self):
+        return self.get_connection().execute('SELECT count(*) FROM bucket').fetchone()[0]
+
+    def clear(self):
+        self.get_connection().execute('DELETE FROM bucket')
+
+
+bucket_store = BucketStore(THROTTLE_DB)
+
+
+def take_token(key, capacity, rate, now=None):
+    """
+    Забрать токен из ведра key. Возвращает 0, если запрос можно пропустить,
+    иначе - сколько секунд ждать следующего токена
+    """
+    now = time.time() if now is None else now
+    try:
+        return bucket_store.take(key, capacity, rate, now)
+    except (sqlite3.Error, OSError):
+        logger.warning('Ограничитель частоты недоступен, запрос пропущен', exc_info=True)
+        return 0
+
+
+def get_client_ip(request):
+    return request.META.get('REMOTE_ADDR') or 'unknown'
+
+
+def get_username(request):
+    """Имя пользователя из JSON или формы без DRF; None, если его нет"""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return None
+        value = data.get('username') if isinstance(data, dict) else None
+    else:
+        value = request.POST.get('username')
+    if not isinstance(value, str) or not value.strip():
+        return None
+    return value.strip().lower()
+
+
+KEY_FUNCTIONS = {
+    'ip': get_client_ip,
+    'username': get_username,
+}
+
+
+def make_key(scope, kind, value):
+    digest = hashlib.sha256(value.encode('utf-8')).hexdigest()[:32]
+    return f'throttle:{scope}:{kind}:{digest}'
+
+
+def check(scope, request):
+    """0, если запрос укладывается во все лимиты scope, иначе Retry-After в секундах"""
+    for kind, (capacity, rate) in SCOPES.get(scope, {}).items():
+        value = KEY_FUNCTIONS[kind](request)
+        if value is None:
+            continue
+        retry_after = take_token(make_key(scope, kind, value), capacity, rate)
+        if retry_after:
+            stats.record(scope, rejected_by=kind)
+            return retry_after
+    stats.record(scope)
+    return 0
+
+
+def throttled_response(request, retry_after):
+    if request.path.startswith('/api/'):
+        response = JsonResponse({'detail': THROTTLED_MESSAGE}, status=429)
+    else:
+        response = HttpResponse(THROTTLED_MESSAGE, status=429, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+
+def throttle(scope, methods=('POST',)):
+    """
+    Декоратор view: лимиты THROTTLES[scope] для запросов с методами methods.
+    Ставится над @api_view, чтобы отказ не доходил до DRF и аутентификации
+    """
+    if scope in SCOPES:
+        for kind in SCOPES[scope]:
+            if kind not in KEY_FUNCTIONS:
+                raise ImproperlyConfigured(f'THROTTLES[{scope!r}]: неизвестный ключ {kind!r}')
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapped_view(request, *args, **kwargs):
+            if request.method in methods:
+                retry_after = check(scope, request)
+                if retry_after:
+                    return throttled_response(request, retry_after)
+            return view_func(request, *args, **kwargs)
+        return wrapped_view
+    return decorator
@@ -0,0 +1,164 @@
+"""
+Быстрая проверка отозванных refresh-токенов.
+
+simplejwt проверяет каждый refresh-токен JOIN-запросом к
+OutstandingToken/BlacklistedToken, а эти таблицы только растут. Здесь
+перед запросом стоит фильтр Блума по jti отозванных токенов: если фильтр
+говорит "точно нет", в базу не ходим, и только возможные совпадения
+проверяются запросом.
+
+Фильтр строится лениво при первой проверке в процессе и догружает новые
+записи по id. Процессы узнают об отзыве токена в соседнем воркере через
+версию в общем кеше; команда compact_token_blacklist меняет эпоху, и
+фильтры перестраиваются целиком.
+"""
+import hashlib
+import math
+import threading
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import BlacklistMixin, RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .buffers import create_buffer
+
+VERSION_KEY = 'jwt_blacklist:version'
+EPOCH_KEY = 'jwt_blacklist:epoch'
+
+
+class BloomFilter:
+    """Фильтр Блума с двойным хешированием (h1 + i * h2)"""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class BlacklistFilter:
+    """Фильтр отозванных jti процесса, синхронизируемый с базой по id записей"""
+    min_capacity = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filter = None
+        self._last_id = 0
+        self._version = None
+        self._epoch = None
+
+    def _load(self, bloom, since_id):
+        rows = (
+            BlacklistedToken.objects.filter(id__gt=since_id)
+            .order_by('id')
+            .values_list('id', 'token__jti')
+            .iterator(chunk_size=5000)
+        )
+        last_id = since_id
+        for row_id, jti in rows:
+            bloom.add(jti)
+            last_id = row_id
+        return last_id
+
+    def rebuild(self):
+        with self._lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        capacity = max(BlacklistedToken.objects.count() * 2, self.min_capacity)
+        bloom = BloomFilter(capacity)
+        self._last_id = self._load(bloom, 0)
+        self._filter = bloom
+
+    def _sync(self):
+        shared = cache.get_many([VERSION_KEY, EPOCH_KEY])
+        version, epoch = shared.get(VERSION_KEY), shared.get(EPOCH_KEY)
+        if self._filter is None or epoch != self._epoch:
+            self._rebuild()
+        elif version != self._version:
+            self._last_id = self._load(self._filter, self._last_id)
+            if self._filter.count > self._filter.capacity:
+                self._rebuild()
+        self._version, self._epoch = version, epoch
+
+    def might_contain(self, jti):
+        with self._lock:
+            self._sync()
+            return jti in self._filter
+
+    def add(self, jti):
+        """Вызывается при отзыве токена в этом процессе"""
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+        # Остальные процессы догрузят запись, увидев новую версию
+        transaction.on_commit(lambda: cache.set(VERSION_KEY, uuid.uuid4().hex, None))
+
+    @staticmethod
+    def reset_epoch():
+        """После удаления записей все процессы перестраивают фильтр с нуля"""
+        cache.set(EPOCH_KEY, uuid.uuid4().hex, None)
+
+
+blacklist_filter = BlacklistFilter()
+
+
+def write_outstanding_tokens(tokens):
+    # Токен мог попасть в таблицу раньше через blacklist() (get_or_create)
+    OutstandingToken.objects.bulk_create(tokens, ignore_conflicts=True)
+
+
+outstanding_token_buffer = create_buffer(write_outstanding_tokens, 'outstanding_tokens')
+
+
+class FilteredRefreshToken(RefreshToken):
+    """RefreshToken, который ходит в таблицу отзыва только при срабатывании фильтра"""
+
+    @classmethod
+    def for_user(cls, user):
+        """
+        Как у simplejwt, но запись о выданном токене идет через буфер, а не
+        INSERT в запросе входа. blacklist() сам создает запись, если ее
+        еще нет, так что отозвать токен можно и до записи пачки
+        """
+        token = super(BlacklistMixin, cls).for_user(user)
+        outstanding_token_buffer.add(OutstandingToken(
+            user=user,
+            jti=token[api_settings.JTI_CLAIM],
+            token=str(token),
+            created_at=token.current_time,
+            expires_at=datetime_from_epoch(token['exp']),
+        ))
+        return token
+
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        if not blacklist_filter.might_contain(jti):
+            return
+        super().check_blacklist()
+
+
+def is_blacklisted(jti):
+    if not blacklist_filter.might_contain(jti):
+        return False
+    return BlacklistedToken.objects.filter(token__jti=jti).exists()
@@ -1,6 +1,7 @@
 from django.urls import path
 from . import views
 from rest_framework_simplejwt.views import TokenVerifyView
+from .serializers import FilteredTokenVerifySerializer
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -15,6 +16,7 @@ urlpatterns = [
     path('articles/', views.articles_list, name='articles_list'),
     path('articles/<str:category>/', views.articles_list, name='articles_by_category'),
     path('news/<int:id>/', views.news_detail, name='news_detail'),
+    path('search/', views.search_articles, name='search'),
     
     path('create-article/', views.create_article, name='create_article'),
     path('edit-article/<int:id>/', views.edit_article, name='edit_article'),
@@ -29,21 +31,36 @@ urlpatterns = [
     path('api/articles/<int:id>/', views.api_article_detail, name='api_article_detail'),
     path('api/articles/category/<str:category>/', views.api_articles_by_category, name='api_articles_by_category'),
     path('api/articles/sort/date/', views.api_articles_sorted_by_date, name='api_articles_sorted_by_date'),
+    path('api/articles/sort/comments/', views.api_articles_sorted_by_comments, name='api_articles_sorted_by_comments'),
+    path('api/articles/search/', views.api_search_articles, name='api_search_articles'),
+    path('api/articles/export/', views.api_export_articles, name='api_export_articles'),
+    
+    # асинхронные версии (ASGI)
+    path('api/async/articles/', views.api_articles_list_async, name='api_articles_list_async'),
+    path('api/async/articles/<int:id>/', views.api_article_detail_async, name='api_article_detail_async'),
+    path('api/async/articles/category/<str:category>/', views.api_articles_by_category_async, name='api_articles_by_category_async'),
+    path('api/async/comment/', views.api_comments_list_async, name='api_comments_list_async'),
     
     path('api/comment/', views.api_comments_list, name='api_comments_list'),
     path('api/comment/<int:id>/', views.api_comment_detail, name='api_comment_detail'),
+    path('api/comment/bulk/', views.api_bulk_comments, name='api_bulk_comments'),
+    path('api/comment/export/', views.api_export_comments, name='api_export_comments'),
     path('api/comment/create/', views.api_create_comment, name='api_create_comment'),
     path('api/comment/<int:id>/update/', views.api_update_comment, name='api_update_comment'),
     path('api/comment/<int:id>/delete/', views.api_delete_comment, name='api_delete_comment'),
     
+    path('api/cache/stats/', views.api_cache_stats, name='api_cache_stats'),
+    path('api/throttle/stats/', views.api_throttle_stats, name='api_throttle_stats'),
+    
     # JWT
     path('api/auth/register/', views.api_register, name='api_register'),
     path('api/auth/login/', views.api_login, name='api_login'),
     path('api/auth/logout/', views.api_logout, name='api_logout'),
     path('api/auth/token/refresh/', views.api_token_refresh, name='api_token_refresh'),
-    path('api/auth/token/verify/', TokenVerifyView.as_view(), name='api_token_verify'),
+    path('api/auth/token/verify/', TokenVerifyView.as_view(serializer_class=FilteredTokenVerifySerializer), name='api_token_verify'),
     path('api/auth/profile/', views.api_user_profile, name='api_user_profile'),
     
+    path('api/articles/bulk/', views.api_bulk_articles, name='api_bulk_articles'),
     path('api/articles/create/', views.api_create_article, name='api_create_article'),
     path('api/articles/<int:id>/update/', views.api_update_article, name='api_update_article'),
     path('api/articles/<int:id>/delete/', views.api_delete_article, name='api_delete_article'),
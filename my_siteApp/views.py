@@ -1,21 +1,44 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth import login, authenticate, logout
-from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
+from django.contrib.auth import login, logout
+from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
-from .models import Article, Comment
-from .forms import ArticleForm, CommentForm, FeedbackForm
+from .models import Article, Comment, Feedback, feedback_buffer, record_last_login
+from .forms import ArticleForm, CommentForm, FeedbackForm, LoginForm
 from .serializers import *
-from datetime import datetime
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.response import Response
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.exceptions import APIException
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 from .serializers import ArticleSerializer, CommentSerializer
-from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from .pagination import KeysetPagination
+from .renderers import ORJSONRenderer
+from . import search
+from . import export
+from .conditional import (
+    conditional, article_version, comment_version, article_list_version,
+    comment_list_version, news_detail_version,
+)
+from .writequeue import write_queue, WriteQueueTimeout
+from . import cachestats
+from . import throttling
+from .throttling import throttle
+from .hashing import HashingPoolBusy
+from .pagecache import cache_anonymous_page, home_key, articles_list_key, news_detail_key
+from rest_framework.utils.urls import replace_query_param
+from .tokens import FilteredRefreshToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .authentication import CachedJWTAuthentication
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max
+from django.utils import timezone
 
+@throttle('register')
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def api_register(request):
@@ -26,7 +49,7 @@ def api_register(request):
         user = serializer.save()
         
         # Генерация JWT токенов
-        refresh = RefreshToken.for_user(user)
+        refresh = FilteredRefreshToken.for_user(user)
         
         return Response({
             'message': 'Регистрация прошла успешно!',
@@ -37,15 +60,18 @@ def api_register(request):
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@throttle('login')
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def api_login(request):
 
-    serializer = LoginSerializer(data=request.data)
+    serializer = LoginSerializer(data=request.data, context={'request': request})
     
     if serializer.is_valid():
         user = serializer.validated_data['user']
-        refresh = RefreshToken.for_user(user)
+        refresh = FilteredRefreshToken.for_user(user)
+        if jwt_settings.UPDATE_LAST_LOGIN:
+            record_last_login(None, user)
         
         return Response({
             'message': 'Вход выполнен успешно!',
@@ -63,7 +89,7 @@ def api_logout(request):
     try:
         refresh_token = request.data.get('refresh')
         if refresh_token:
-            token = RefreshToken(refresh_token)
+            token = FilteredRefreshToken(refresh_token)
             token.blacklist()
         
         return Response({
@@ -86,7 +112,7 @@ def api_token_refresh(request):
         }, status=status.HTTP_400_BAD_REQUEST)
     
     try:
-        refresh = RefreshToken(refresh_token)
+        refresh = FilteredRefreshToken(refresh_token)
         access_token = str(refresh.access_token)
         
         return Response({
@@ -108,7 +134,7 @@ def jwt_required(view_func):
 
     def wrapped_view(request, *args, **kwargs):
         try:
-            jwt_auth = JWTAuthentication()
+            jwt_auth = CachedJWTAuthentication()
             auth_result = jwt_auth.authenticate(request)
             
             if auth_result is not None:
@@ -128,24 +154,52 @@ def jwt_required(view_func):
     
     return wrapped_view
 
+# Рендереры списков: orjson вместо json, вывод побайтно тот же
+LIST_RENDERERS = [ORJSONRenderer, BrowsableAPIRenderer]
 
+def page_queryset(serializer, queryset, paginator):
+    """
+    Запрос страницы списка. Если выбранные поля позволяют, строки читаются
+    словарями через .values() (быстрый путь), иначе - моделями
+    """
+    if serializer.can_use_values():
+        return serializer.get_values_queryset(queryset, extra=('id', paginator.ordering_field))
+    return serializer.optimize_queryset(queryset)
+
+def page_data(serializer, page, context):
+    if serializer.can_use_values():
+        return serializer.represent_values(page)
+    return type(serializer)(page, many=True, context=context, list_mode=True).data
+
+def paginated_response(request, queryset, serializer_class, default_order='desc', ordering_field=None):
+    """Курсорная пагинация списка с учетом параметра order (asc/desc)"""
+    sort_order = request.GET.get('order', default_order)
+    paginator = KeysetPagination(descending=(sort_order != 'asc'), ordering_field=ordering_field)
+    context = {'request': request}
+    serializer = serializer_class(context=context, list_mode=True)
+    page = paginator.paginate_queryset(page_queryset(serializer, queryset, paginator), request)
+    return paginator.get_paginated_response(page_data(serializer, page, context))
 
 # эндпоинты 
+@conditional(article_list_version)
 @api_view(['GET'])
+@renderer_classes(LIST_RENDERERS)
 @permission_classes([AllowAny])
 def api_articles_list(request):
     """Список всех статей"""
     articles = Article.objects.all()
-    serializer = ArticleSerializer(articles, many=True)
-    return Response(serializer.data)
+    return paginated_response(request, articles, ArticleSerializer)
 
+@conditional(article_version)
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def api_article_detail(request, id):
     """Статья по ID"""
     try:
-        article = Article.objects.get(id=id)
-        serializer = ArticleSerializer(article)
+        context = {'request': request}
+        articles = ArticleSerializer(context=context).optimize_queryset(Article.objects.all())
+        article = articles.get(id=id)
+        serializer = ArticleSerializer(article, context=context)
         return Response(serializer.data)
     except Article.DoesNotExist:
         return Response(
@@ -168,9 +222,10 @@ def api_create_article(request):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        article = serializer.save(user=request.user)
+        with transaction.atomic():
+            article = serializer.save(user=request.user)
         return Response(
-            ArticleSerializer(article).data, 
+            ArticleSerializer(article, context={'request': request}).data, 
             status=status.HTTP_201_CREATED
         )
     
@@ -205,7 +260,8 @@ def api_update_article(request, id):
                     status=status.HTTP_403_FORBIDDEN
                 )
         
-        serializer.save()
+        with transaction.atomic():
+            serializer.save()
         return Response(serializer.data)
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -234,7 +290,148 @@ def api_delete_article(request, id):
         status=status.HTTP_204_NO_CONTENT
     )
 
+BULK_MAX_OPERATIONS = 1000
+BULK_OPERATIONS = ('create', 'update', 'delete')
+
+def parse_bulk_operations(request):
+    """
+    Разбор тела пакетного запроса: {"operations": [...]} или просто [...].
+    Возвращает (operations, results, error_response); в results для каждой
+    операции заготовлен словарь ответа, а для некорректных - сразу ошибка
+    """
+    operations = request.data.get('operations') if isinstance(request.data, dict) else request.data
+    if not isinstance(operations, list) or not operations:
+        return None, None, Response(
+            {'error': 'Ожидается непустой список operations'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(operations) > BULK_MAX_OPERATIONS:
+        return None, None, Response(
+            {'error': f'Не больше {BULK_MAX_OPERATIONS} операций за запрос'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    results = []
+    seen_ids = set()
+    for index, operation in enumerate(operations):
+        result = {'index': index}
+        results.append(result)
+        if not isinstance(operation, dict) or operation.get('op') not in BULK_OPERATIONS:
+            result.update(status=400, errors={'op': 'Ожидается create, update или delete'})
+            continue
+        result['op'] = operation['op']
+        if operation['op'] == 'create':
+            continue
+        object_id = operation.get('id')
+        if not isinstance(object_id, int) or isinstance(object_id, bool):
+            result.update(status=400, errors={'id': 'Ожидается целое число'})
+        elif object_id in seen_ids:
+            result.update(status=400, errors={'id': 'Объект уже встречается в этом пакете'})
+        else:
+            result['id'] = object_id
+            seen_ids.add(object_id)
+    return operations, results, None
+
+def bulk_response(results):
+    """
+    Если хоть одна операция не прошла проверку, ничего не записано - 400,
+    а корректные операции помечаются 424 (не выполнены из-за соседних)
+    """
+    failed = any('errors' in result for result in results)
+    if failed:
+        for result in results:
+            result.setdefault('status', 424)
+    return Response(
+        {'results': results},
+        status=status.HTTP_400_BAD_REQUEST if failed else status.HTTP_200_OK
+    )
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def api_bulk_articles(request):
+    """Пакетное создание/обновление/удаление статей в одной транзакции"""
+    operations, results, error = parse_bulk_operations(request)
+    if error:
+        return error
+    
+    ids = [result['id'] for result in results if 'id' in result]
+    articles = Article.objects.select_related('user').in_bulk(ids)
+    user = request.user
+    to_create, to_update, to_delete = [], [], []
+    
+    for operation, result in zip(operations, results):
+        if 'errors' in result:
+            continue
+        op = result['op']
+        
+        if op == 'create':
+            serializer = ArticleSerializer(data=operation.get('data'))
+            if not serializer.is_valid():
+                result.update(status=400, errors=serializer.errors)
+                continue
+            category = serializer.validated_data.get('category', 'news')
+            if not Article.can_user_create_article(user, category):
+                result.update(status=403, errors={'category': 'У вас нет прав для создания статей в этой категории!'})
+                continue
+            to_create.append((result, Article(user=user, **serializer.validated_data)))
+            continue
+        
+        article = articles.get(result['id'])
+        if article is None:
+            result.update(status=404, errors={'id': 'Статья не найдена'})
+            continue
+        if article.user_id != user.id and not user.is_superuser:
+            result.update(status=403, errors={'id': 'Вы можете изменять только свои статьи!'})
+            continue
+        
+        if op == 'delete':
+            to_delete.append((result, article))
+            continue
+        
+        serializer = ArticleSerializer(article, data=operation.get('data'), partial=False)
+        if not serializer.is_valid():
+            result.update(status=400, errors=serializer.errors)
+            continue
+        new_category = serializer.validated_data.get('category', article.category)
+        if new_category != article.category and not Article.can_user_create_article(user, new_category):
+            result.update(status=403, errors={'category': 'У вас нет прав для изменения категории на эту!'})
+            continue
+        for field, value in serializer.validated_data.items():
+            setattr(article, field, value)
+        to_update.append((result, article))
+    
+    if any('errors' in result for result in results):
+        return bulk_response(results)
+    
+    now = timezone.now()
+    with transaction.atomic():
+        if to_delete:
+            Article.bulk_delete([article for _, article in to_delete])
+        for _, article in to_create + to_update:
+            article.update_rendered_fields()
+        if to_update:
+            for _, article in to_update:
+                article.updated_at = now
+            Article.objects.bulk_update(
+                [article for _, article in to_update],
+                ['title', 'text', 'category', 'updated_at', *Article.RENDERED_FIELDS]
+            )
+        if to_create:
+            Article.objects.bulk_create([article for _, article in to_create])
+        Article.after_bulk_save([article for _, article in to_create + to_update])
+    
+    context = {'request': request}
+    for result, article in to_create:
+        result.update(status=201, id=article.id, data=ArticleSerializer(article, context=context).data)
+    for result, article in to_update:
+        result.update(status=200, data=ArticleSerializer(article, context=context).data)
+    for result, _ in to_delete:
+        result.update(status=204)
+    return bulk_response(results)
+
+@conditional(article_list_version)
 @api_view(['GET'])
+@renderer_classes(LIST_RENDERERS)
 @permission_classes([AllowAny])
 def api_articles_by_category(request, category):
     """Фильтр по категории"""
@@ -246,38 +443,88 @@ def api_articles_by_category(request, category):
         )
     
     articles = Article.objects.filter(category=category)
-    serializer = ArticleSerializer(articles, many=True)
-    return Response(serializer.data)
+    return paginated_response(request, articles, ArticleSerializer)
 
+@conditional(article_list_version)
 @api_view(['GET'])
+@renderer_classes(LIST_RENDERERS)
 @permission_classes([AllowAny])
 def api_articles_sorted_by_date(request):
     """Сортировка по дате"""
-    sort_order = request.GET.get('order', 'desc') 
+    articles = Article.objects.all()
+    return paginated_response(request, articles, ArticleSerializer)
+
+@conditional(article_list_version)
+@api_view(['GET'])
+@renderer_classes(LIST_RENDERERS)
+@permission_classes([AllowAny])
+def api_articles_sorted_by_comments(request):
+    """Сортировка по числу комментариев (самые обсуждаемые)"""
+    articles = Article.objects.all()
+    return paginated_response(request, articles, ArticleSerializer, ordering_field='comment_count')
+
+def search_page(request, page_size=20, max_page=500):
+    """
+    Одна страница результатов полнотекстового поиска. Номер страницы
+    ограничен max_page: огромный ?page= переполнил бы OFFSET в SQLite
+    """
+    query = request.GET.get('q', '').strip()
+    category = request.GET.get('category') or None
+    try:
+        page = min(max(int(request.GET.get('page', 1)), 1), max_page)
+    except ValueError:
+        page = 1
     
-    if sort_order == 'asc':
-        articles = Article.objects.all().order_by('created_date')
-    else:
-        articles = Article.objects.all().order_by('-created_date')
+    results = search.search_articles(
+        query, category=category, offset=(page - 1) * page_size, limit=page_size
+    )
+    has_next = len(results) > page_size and page < max_page
+    return query, category, page, results[:page_size], has_next
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def api_search_articles(request):
+    """Полнотекстовый поиск по статьям"""
+    if not search.is_supported():
+        return Response(
+            {'error': 'Поиск недоступен'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
     
-    serializer = ArticleSerializer(articles, many=True)
-    return Response(serializer.data)
+    category = request.GET.get('category')
+    if category and category not in dict(Article.CATEGORY_CHOICES):
+        return Response(
+            {'error': 'Неверная категория'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    query, category, page, results, has_next = search_page(request)
+    next_url = None
+    if has_next:
+        next_url = replace_query_param(request.build_absolute_uri(), 'page', page + 1)
+    
+    serializer = ArticleSearchResultSerializer(results, many=True)
+    return Response({'next': next_url, 'results': serializer.data})
 
+@conditional(comment_list_version)
 @api_view(['GET'])
+@renderer_classes(LIST_RENDERERS)
 @permission_classes([AllowAny])
 def api_comments_list(request):
     """Список всех комментариев"""
     comments = Comment.objects.all()
-    serializer = CommentSerializer(comments, many=True)
-    return Response(serializer.data)
+    return paginated_response(request, comments, CommentSerializer, default_order='asc')
 
+@conditional(comment_version)
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def api_comment_detail(request, id):
     """Комментарий по ID"""
     try:
-        comment = Comment.objects.get(id=id)
-        serializer = CommentSerializer(comment)
+        context = {'request': request}
+        comments = CommentSerializer(context=context).optimize_queryset(Comment.objects.all())
+        comment = comments.get(id=id)
+        serializer = CommentSerializer(comment, context=context)
         return Response(serializer.data)
     except Comment.DoesNotExist:
         return Response(
@@ -285,6 +532,60 @@ def api_comment_detail(request, id):
             status=status.HTTP_404_NOT_FOUND
         )
 
+def export_response(request, kind):
+    """
+    Потоковая выгрузка: ?format=ndjson|json, ?category=, ?date_from=, ?date_to=
+    (даты в ISO 8601, date_to включительно). Только для персонала: выгрузка
+    читает таблицу целиком
+    """
+    if not request.user.is_authenticated:
+        return json_response({'error': 'Требуется аутентификация'}, status=status.HTTP_401_UNAUTHORIZED)
+    if not request.user.is_staff:
+        return json_response({'error': 'Выгрузка доступна только персоналу'}, status=status.HTTP_403_FORBIDDEN)
+    
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in export.FORMATS:
+        return json_response({'error': 'Неверный формат, допустимо: ndjson, json'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        filters = export.get_filters(
+            category=request.GET.get('category'),
+            date_from=request.GET.get('date_from'),
+            date_to=request.GET.get('date_to'),
+        )
+    except ValueError as e:
+        return json_response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    response = StreamingHttpResponse(
+        export.stream(kind, export_format, **filters),
+        content_type=export.FORMATS[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{export_format}"'
+    return response
+
+# Обычные Django view, а не @api_view: DRF занимает параметр ?format=
+# под выбор рендерера и буферизует ответ
+@throttle('export', methods=('GET',))
+@require_GET
+def api_export_articles(request):
+    """Выгрузка статей"""
+    return export_response(request, 'articles')
+
+@throttle('export', methods=('GET',))
+@require_GET
+def api_export_comments(request):
+    """Выгрузка комментариев"""
+    return export_response(request, 'comments')
+
+def save_new_comment(comment):
+    """Сохранение нового комментария вместе со счетчиком (выполняется в потоке-писателе)"""
+    comment.save()
+    if not Article.adjust_comment_count(comment.article_id, 1):
+        # Статью удалили после проверки в запросе. Внешний ключ SQLite проверил
+        # бы только на COMMIT всей пачки, поэтому откатываем запись здесь
+        raise Article.DoesNotExist('Статья не найдена')
+    return comment
+
+@throttle('comment')
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def api_create_comment(request):
@@ -299,9 +600,15 @@ def api_create_comment(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        comment = serializer.save()
+        try:
+            comment = write_queue.submit(save_new_comment, Comment(**serializer.validated_data))
+        except (Article.DoesNotExist, IntegrityError):
+            return Response(
+                {'error': 'Статья не найдена'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
         return Response(
-            CommentSerializer(comment).data, 
+            CommentSerializer(comment, context={'request': request}).data, 
             status=status.HTTP_201_CREATED
         )
     
@@ -328,7 +635,12 @@ def api_update_comment(request, id):
     serializer = CommentSerializer(comment, data=request.data, partial=False)
     
     if serializer.is_valid():
-        serializer.save()
+        old_article_id = comment.article_id
+        with transaction.atomic():
+            serializer.save()
+            if comment.article_id != old_article_id:
+                Article.adjust_comment_count(old_article_id, -1)
+                Article.adjust_comment_count(comment.article_id, 1)
         return Response(serializer.data)
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -351,12 +663,182 @@ def api_delete_comment(request, id):
             status=status.HTTP_403_FORBIDDEN
         )
 
-    comment.delete()
+    with transaction.atomic():
+        comment.delete()
+        Article.adjust_comment_count(comment.article_id, -1)
     return Response(
         {'message': 'Комментарий успешно удален'}, 
         status=status.HTTP_204_NO_CONTENT
     )
 
+BULK_COMMENT_FIELDS = ['id', 'text', 'created_date', 'author_name', 'article']
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def api_bulk_comments(request):
+    """Пакетное создание/обновление/удаление комментариев в одной транзакции"""
+    operations, results, error = parse_bulk_operations(request)
+    if error:
+        return error
+    
+    ids = [result['id'] for result in results if 'id' in result]
+    comments = Comment.objects.in_bulk(ids)
+    
+    referenced = set()
+    for operation, result in zip(operations, results):
+        data = operation.get('data') if isinstance(operation, dict) else None
+        if isinstance(data, dict) and isinstance(data.get('article'), int):
+            referenced.add(data['article'])
+    context = {'article_ids': set(Article.objects.filter(id__in=referenced).values_list('id', flat=True))}
+    
+    is_moderator = request.user.is_superuser
+    to_create, to_update, to_delete = [], [], []
+    count_deltas = {}
+    
+    for operation, result in zip(operations, results):
+        if 'errors' in result:
+            continue
+        op = result['op']
+        
+        if op == 'create':
+            serializer = CommentBulkItemSerializer(data=operation.get('data'), context=context)
+            if not serializer.is_valid():
+                result.update(status=400, errors=serializer.errors)
+                continue
+            data = serializer.validated_data
+            comment = Comment(text=data['text'], author_name=data['author_name'], article_id=data['article'])
+            to_create.append((result, comment))
+            count_deltas[comment.article_id] = count_deltas.get(comment.article_id, 0) + 1
+            continue
+        
+        if not is_moderator:
+            result.update(status=403, errors={'id': 'У вас нет прав для изменения комментариев!'})
+            continue
+        comment = comments.get(result['id'])
+        if comment is None:
+            result.update(status=404, errors={'id': 'Комментарий не найден'})
+            continue
+        
+        if op == 'delete':
+            to_delete.append((result, comment))
+            count_deltas[comment.article_id] = count_deltas.get(comment.article_id, 0) - 1
+            continue
+        
+        serializer = CommentBulkItemSerializer(data=operation.get('data'), context=context)
+        if not serializer.is_valid():
+            result.update(status=400, errors=serializer.errors)
+            continue
+        data = serializer.validated_data
+        if data['article'] != comment.article_id:
+            count_deltas[comment.article_id] = count_deltas.get(comment.article_id, 0) - 1
+            count_deltas[data['article']] = count_deltas.get(data['article'], 0) + 1
+        comment.text = data['text']
+        comment.author_name = data['author_name']
+        comment.article_id = data['article']
+        to_update.append((result, comment))
+    
+    if any('errors' in result for result in results):
+        return bulk_response(results)
+    
+    now = timezone.now()
+    with transaction.atomic():
+        if to_delete:
+            Comment.bulk_delete([comment for _, comment in to_delete])
+        if to_update:
+            for _, comment in to_update:
+                comment.updated_at = now
+            Comment.objects.bulk_update(
+                [comment for _, comment in to_update],
+                ['text', 'author_name', 'article', 'updated_at']
+            )
+        if to_create:
+            Comment.objects.bulk_create([comment for _, comment in to_create])
+        Article.adjust_comment_counts(count_deltas)
+        Comment.after_bulk_save([comment for _, comment in to_create + to_update])
+    
+    for result, comment in to_create:
+        result.update(status=201, id=comment.id, data=CommentSerializer(comment, fields=BULK_COMMENT_FIELDS).data)
+    for result, comment in to_update:
+        result.update(status=200, data=CommentSerializer(comment, fields=BULK_COMMENT_FIELDS).data)
+    for result, _ in to_delete:
+        result.update(status=204)
+    return bulk_response(results)
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def api_cache_stats(request):
+    """Попадания и промахи кешей этого процесса; DELETE обнуляет счетчики"""
+    if request.method == 'DELETE':
+        cachestats.reset_all_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response(cachestats.collect_stats())
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def api_throttle_stats(request):
+    """Пропущенные и отклоненные ограничителем запросы этого процесса; DELETE обнуляет"""
+    if request.method == 'DELETE':
+        throttling.stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response(throttling.stats.stats())
+
+# асинхронные эндпоинты чтения (ASGI)
+# Те же ответы (и те же ETag/304), что у api_articles_list и др., но без пула
+# потоков на весь view: запросы идут через асинхронный ORM, сериализация - в
+# цикле событий
+def json_response(data, status=200):
+    return HttpResponse(
+        ORJSONRenderer().render(data), status=status, content_type='application/json'
+    )
+
+async def apaginated_response(request, queryset, serializer_class, default_order='desc'):
+    """Асинхронный вариант paginated_response"""
+    sort_order = request.GET.get('order', default_order)
+    paginator = KeysetPagination(descending=(sort_order != 'asc'))
+    context = {'request': request}
+    serializer = serializer_class(context=context, list_mode=True)
+    try:
+        page = await paginator.apaginate_queryset(page_queryset(serializer, queryset, paginator), request)
+    except APIException as exc:
+        return json_response({'detail': exc.detail}, status=exc.status_code)
+    return json_response(paginator.get_paginated_data(page_data(serializer, page, context)))
+
+@conditional(article_list_version)
+@require_GET
+async def api_articles_list_async(request):
+    """Список всех статей"""
+    return await apaginated_response(request, Article.objects.all(), ArticleSerializer)
+
+@conditional(article_version)
+@require_GET
+async def api_article_detail_async(request, id):
+    """Статья по ID"""
+    context = {'request': request}
+    try:
+        articles = ArticleSerializer(context=context).optimize_queryset(Article.objects.all())
+        article = await articles.aget(id=id)
+    except APIException as exc:
+        return json_response({'detail': exc.detail}, status=exc.status_code)
+    except Article.DoesNotExist:
+        return json_response({'error': 'Статья не найдена'}, status=status.HTTP_404_NOT_FOUND)
+    return json_response(ArticleSerializer(article, context=context).data)
+
+@conditional(article_list_version)
+@require_GET
+async def api_articles_by_category_async(request, category):
+    """Фильтр по категории"""
+    if category not in dict(Article.CATEGORY_CHOICES):
+        return json_response({'error': 'Неверная категория'}, status=status.HTTP_400_BAD_REQUEST)
+    articles = Article.objects.filter(category=category)
+    return await apaginated_response(request, articles, ArticleSerializer)
+
+@conditional(comment_list_version)
+@require_GET
+async def api_comments_list_async(request):
+    """Список всех комментариев"""
+    return await apaginated_response(request, Comment.objects.all(), CommentSerializer, default_order='asc')
+
+@throttle('register')
 def register(request):
     """Отображение страницы регистрации и обработка формы"""
     if request.method == 'POST':
@@ -373,23 +855,29 @@ def register(request):
     
     return render(request, 'my_siteApp/register.html', {'form': form})
 
+@throttle('login')
 def user_login(request):
     """Отображение страницы входа и обработка формы"""
     if request.method == 'POST':
-        form = AuthenticationForm(request, data=request.POST)
-        if form.is_valid():
-            username = form.cleaned_data.get('username')
-            password = form.cleaned_data.get('password')
-            user = authenticate(username=username, password=password)
-            if user is not None:
-                login(request, user)
-                messages.success(request, f'Добро пожаловать, {username}. За Императора!')
-                next_url = request.GET.get('next', 'home')
-                return redirect(next_url)
+        form = LoginForm(request, data=request.POST)
+        try:
+            # Форма уже проверила пароль (в пуле процессов), второй
+            # authenticate не нужен
+            is_valid = form.is_valid()
+        except HashingPoolBusy as e:
+            # Форма остается заполненной: имя пользователя вводить заново не нужно
+            messages.error(request, e.detail)
+            return render(request, 'my_siteApp/login.html', {'form': form}, status=503)
+        if is_valid:
+            user = form.get_user()
+            login(request, user)
+            messages.success(request, f'Добро пожаловать, {user.get_username()}. За Императора!')
+            next_url = request.GET.get('next', 'home')
+            return redirect(next_url)
         else:
             messages.error(request, 'Неверное имя пользователя или пароль.')
     else:
-        form = AuthenticationForm()
+        form = LoginForm()
     
     return render(request, 'my_siteApp/login.html', {'form': form})
 
@@ -414,7 +902,8 @@ def create_article(request):
             
             article = form.save(commit=False)
             article.user = request.user
-            article.save()
+            with transaction.atomic():
+                article.save()
             messages.success(request, 'Статья успешно создана!')
             return redirect('articles_list')
     else:
@@ -440,7 +929,8 @@ def edit_article(request, id):
                     messages.error(request, 'У вас нет прав для изменения категории на эту!')
                     return redirect('articles_list')
             
-            form.save()
+            with transaction.atomic():
+                form.save()
             messages.success(request, 'Статья успешно обновлена!')
             return redirect('news_detail', id=article.id)
     else:
@@ -502,9 +992,10 @@ def delete_article_page(request, id):
     
     return render(request, 'my_siteApp/delete_article.html', {'article': article})
 
+@cache_anonymous_page(articles_list_key)
 def articles_list(request, category=None):
     """Отображение списка статей"""
-    articles = Article.objects.all()
+    articles = Article.objects.with_card_data()
     
     if category:
         valid_categories = dict(Article.CATEGORY_CHOICES).keys()
@@ -520,33 +1011,75 @@ def articles_list(request, category=None):
     }
     return render(request, 'my_siteApp/articles_list.html', context)
 
+@throttle('comment')
+@conditional(news_detail_version)
+@cache_anonymous_page(news_detail_key)
 def news_detail(request, id):
     """Отображение детальной страницы статьи с комментариями"""
-    article = get_object_or_404(Article, id=id)
+    # Текст на странице берется из rendered_html
+    article = get_object_or_404(Article.objects.defer('text'), id=id)
     comments = article.comments.all()
+    response_status = 200
     
     if request.method == 'POST':
         comment_form = CommentForm(request.POST)
         if comment_form.is_valid():
             comment = comment_form.save(commit=False)
             comment.article = article
-            comment.save()
-            messages.success(request, 'Ваш комментарий добавлен!')
-            return redirect('news_detail', id=id)
+            try:
+                write_queue.submit(save_new_comment, comment)
+            except (Article.DoesNotExist, IntegrityError):
+                raise Http404('Статья не найдена')
+            except WriteQueueTimeout as e:
+                messages.error(request, e.detail)
+                response_status = 503
+            else:
+                messages.success(request, 'Ваш комментарий добавлен!')
+                return redirect('news_detail', id=id)
     else:
         comment_form = CommentForm()
     
+    # Версия списка комментариев для кеша фрагмента: при попадании сами
+    # комментарии не запрашиваются (queryset ленивый). Число считается здесь
+    # же, а не берется из comment_count: счетчик может разойтись с таблицей,
+    # а удаление старого комментария не меняет max(updated_at)
+    stats = comments.order_by().aggregate(last=Max('updated_at'), total=Count('id'))
+    last_change = stats['last']
     context = {
         'article': article,
         'comments': comments,
         'comment_form': comment_form,
-        'comments_count': comments.count(),
+        'comments_count': stats['total'],
+        'comments_version': f'{stats["total"]}:{last_change.isoformat() if last_change else ""}',
+    }
+    return render(request, 'my_siteApp/news_detail.html', context, status=response_status)
+
+def search_articles(request):
+    """Страница полнотекстового поиска"""
+    if not search.is_supported():
+        context = {'search_unavailable': True, 'category_choices': Article.CATEGORY_CHOICES}
+        return render(request, 'my_siteApp/search.html', context, status=503)
+    
+    category = request.GET.get('category')
+    if category and category not in dict(Article.CATEGORY_CHOICES):
+        messages.error(request, 'Неверная категория')
+        return redirect('search')
+    
+    query, category, page, results, has_next = search_page(request)
+    context = {
+        'query': query,
+        'current_category': category,
+        'category_choices': Article.CATEGORY_CHOICES,
+        'results': results,
+        'page': page,
+        'has_next': has_next,
     }
-    return render(request, 'my_siteApp/news_detail.html', context)
+    return render(request, 'my_siteApp/search.html', context)
 
+@cache_anonymous_page(home_key)
 def home(request):
     """Домашняя страница"""
-    latest_articles = Article.objects.all()[:3]
+    latest_articles = Article.objects.with_card_data()[:3]
     return render(request, 'my_siteApp/home.html', {'latest_articles': latest_articles})
 
 def works(request):
@@ -563,17 +1096,7 @@ def feedback(request):
         form = FeedbackForm(request.POST)
         if form.is_valid():
             name = form.cleaned_data['name']
-            email = form.cleaned_data['email']
-            message = form.cleaned_data['message']
-            
-            print("\n" + "="*50)
-            print("НОВОЕ СООБЩЕНИЕ ИЗ ФОРМЫ ОБРАТНОЙ СВЯЗИ")
-            print("="*50)
-            print(f"Имя: {name}")
-            print(f"Email: {email}")
-            print(f"Сообщение: {message}")
-            print(f"Время отправки: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            print("="*50 + "\n")
+            feedback_buffer.add(Feedback(**form.cleaned_data))
             
             context = {'form_submitted': True, 'name': name}
             return render(request, 'my_siteApp/feedback.html', context)
@@ -0,0 +1,157 @@
+"""
+Очередь записи в SQLite с одним писателем на процесс.
+
+SQLite допускает одну пишущую транзакцию на файл, поэтому параллельные
+POST комментариев упираются в блокировку и повторные попытки. Здесь мелкие
+записи (функции) ставятся в очередь, а единственный поток-писатель
+собирает их в пачку и выполняет в одной транзакции: каждая функция в своей
+точке сохранения, так что ошибка одной не отменяет остальные, а на всю
+пачку приходится один COMMIT. Вызывающий поток ждет фиксации своей записи.
+
+Внешние ключи SQLite проверяет только при COMMIT (Django объявляет их
+DEFERRABLE INITIALLY DEFERRED), точка сохранения нарушения не видит. Если
+COMMIT пачки упал с IntegrityError, записи выполняются заново, каждая в
+своей транзакции: ошибку получает только нарушившая ключ. Поэтому функция
+должна давать тот же результат при повторе после отката.
+
+Внутри уже открытой транзакции (и в тестах, где TestCase держит atomic)
+функция выполняется сразу в текущем потоке.
+
+Если запись не зафиксирована за TIMEOUT секунд, вызывающий код получает
+WriteQueueTimeout (503). Запись, которую писатель еще не начал, при этом
+отменяется и не выполнится позже; если она уже выполняется, в ответе
+сказано, что результат неизвестен.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+logger = logging.getLogger(__name__)
+
+WRITE_QUEUE_SETTINGS = getattr(settings, 'SQLITE_WRITE_QUEUE', {})
+
+
+class WriteQueueTimeout(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Сервер перегружен, запись не сохранена. Повторите позже'
+    default_code = 'write_queue_timeout'
+
+
+class WriteQueue:
+
+    def __init__(self, enabled=True, max_batch=100, max_delay=0.002, timeout=30):
+        self.enabled = enabled
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """Выполнить func в потоке-писателе и вернуть ее результат после COMMIT"""
+        if (
+            not self.enabled
+            or connection.vendor != 'sqlite'
+            or connection.in_atomic_block
+            or threading.current_thread() is self._thread
+        ):
+            with transaction.atomic():
+                return func(*args, **kwargs)
+
+        future = Future()
+        self._ensure_thread()
+        self._queue.put((func, args, kwargs, future))
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # Отмененную запись писатель пропустит; не отменилась - уже выполняется
+            if future.cancel():
+                raise WriteQueueTimeout()
+            raise WriteQueueTimeout(
+                'Сервер перегружен, неизвестно, сохранена ли запись. Проверьте, прежде чем повторять'
+            )
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='sqlite-writer', daemon=True
+                )
+                self._thread.start()
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            try:
+                self._commit(batch)
+            except Exception as exc:
+                logger.exception('Ошибка фиксации пачки записей')
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                # Соединение могло остаться в неопределенном состоянии
+                connection.close()
+
+    def _execute(self, writes):
+        results = []
+        with transaction.atomic():
+            for func, args, kwargs, future in writes:
+                try:
+                    with transaction.atomic():
+                        results.append((future, func(*args, **kwargs), None))
+                except Exception as exc:
+                    results.append((future, None, exc))
+        return results
+
+    def _commit(self, batch):
+        # Вызывающий поток не дождался и отменил запись
+        writes = [write for write in batch if write[-1].set_running_or_notify_cancel()]
+        try:
+            results = self._execute(writes)
+        except IntegrityError:
+            if len(writes) == 1:
+                raise
+            logger.warning('COMMIT пачки из %d записей нарушил внешний ключ, записи фиксируются по одной', len(writes))
+            results = []
+            for write in writes:
+                try:
+                    results += self._execute([write])
+                except IntegrityError as exc:
+                    results.append((write[-1], None, exc))
+        for future, result, exc in results:
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+
+
+write_queue = WriteQueue(
+    enabled=WRITE_QUEUE_SETTINGS.get('ENABLED', True),
+    max_batch=WRITE_QUEUE_SETTINGS.get('MAX_BATCH', 100),
+    max_delay=WRITE_QUEUE_SETTINGS.get('MAX_DELAY', 0.002),
+    timeout=WRITE_QUEUE_SETTINGS.get('TIMEOUT', 30),
+)
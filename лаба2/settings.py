@@ -49,7 +49,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'my_siteApp.authentication.MiddlewareJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
@@ -84,8 +84,25 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
+# Хеширование паролей при входе и регистрации в пуле процессов
+# (my_siteApp.hashing). Сверх MAX_PENDING задач вход сразу отвечает 503;
+# WORKERS=0 - хешировать в потоке запроса
+PASSWORD_HASHING = {
+    'WORKERS': 2,
+    'MAX_PENDING': 8,
+    'TIMEOUT': 10,
+}
+
+# Кеш пользователей для JWT-аутентификации (my_siteApp.authentication)
+JWT_USER_CACHE = {
+    'MAX_SIZE': 1024,
+    'TTL': 60,
+}
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'my_siteApp.assets.StaticFilesMiddleware',
+    'my_siteApp.routers.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -118,13 +135,130 @@ WSGI_APPLICATION = 'лаба2.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# WAL позволяет читать во время записи, synchronous=NORMAL в режиме WAL
+# не теряет целостность, а timeout задает busy_timeout в секундах.
+# IMMEDIATE берет блокировку записи в начале транзакции, а не при первом
+# UPDATE, чтобы не ловить "database is locked" посреди транзакции
+SQLITE_INIT_COMMAND = (
+    'PRAGMA journal_mode=WAL;'
+    'PRAGMA synchronous=NORMAL;'
+    'PRAGMA mmap_size=268435456;'
+    'PRAGMA temp_store=MEMORY;'
+    'PRAGMA cache_size=-20000'
+)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': SQLITE_INIT_COMMAND,
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
+# Реплика только для чтения: локально это тот же файл, открытый с mode=ro,
+# в продакшене - любая база-реплика. Чтения GET-запросов распределяются
+# по DATABASE_REPLICAS роутером my_siteApp.routers.PrimaryReplicaRouter
+DATABASES['replica'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': (BASE_DIR / 'db.sqlite3').as_uri() + '?mode=ro',
+    'OPTIONS': {
+        'init_command': (
+            'PRAGMA query_only=ON;'
+            'PRAGMA mmap_size=268435456;'
+            'PRAGMA temp_store=MEMORY;'
+            'PRAGMA cache_size=-20000'
+        ),
+        'timeout': 20,
+    },
+    'TEST': {
+        'MIRROR': 'default',
+    },
+}
+
+DATABASE_ROUTERS = ['my_siteApp.routers.PrimaryReplicaRouter']
+DATABASE_REPLICAS = ['replica']
+DATABASE_REPLICA_PIN_SECONDS = 5
+
+# Очередь записи с одним писателем на процесс (my_siteApp.writequeue)
+SQLITE_WRITE_QUEUE = {
+    'ENABLED': True,
+    'MAX_BATCH': 100,
+    'MAX_DELAY': 0.002,
+    'TIMEOUT': 30,
+}
+
+# Отложенная пакетная запись мелких обновлений (my_siteApp.buffers):
+# last_login, выданные refresh-токены, обращения из формы. Пачка пишется,
+# когда набралось MAX_SIZE элементов или прошло MAX_DELAY секунд
+WRITE_BEHIND = {
+    'ENABLED': True,
+    'MAX_SIZE': 500,
+    'MAX_DELAY': 1.0,
+}
+
+# Очередь фоновых задач в базе (my_siteApp.jobs), выполняется командой
+# manage.py run_jobs. QUEUES - сколько задач каждой очереди может
+# выполняться одновременно во всех воркерах. ENABLED=False - выполнять
+# задачи сразу при постановке
+JOB_QUEUE = {
+    'ENABLED': True,
+    'QUEUES': {
+        'default': 2,
+        # FTS5 пишет в одну таблицу, параллельные записи только ждали бы блокировку
+        'search': 1,
+    },
+    'POLL_INTERVAL': 1.0,
+    'LOCK_TIMEOUT': 300,
+    'BACKOFF': 5,
+    'MAX_BACKOFF': 3600,
+}
+
+
+# Cache
+# Файловый кеш общий для всех воркеров на машине: на нем держится кеш
+# страниц для анонимов (my_siteApp.pagecache)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'my_siteApp.cachestats.InstrumentedFileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'default'),
+        'TIMEOUT': 600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # {% cache %} берет этот алиас. Версия данных входит в ключ фрагмента,
+    # поэтому инвалидация не нужна, а память процесса быстрее файлов
+    'template_fragments': {
+        'BACKEND': 'my_siteApp.cachestats.InstrumentedLocMemCache',
+        'LOCATION': 'template-fragments',
+        'TIMEOUT': 86400,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+}
+
+PAGE_CACHE_ALIAS = 'default'
+PAGE_CACHE_TIMEOUT = 600
+
+# Ограничение частоты запросов по эндпоинтам: ведро на IP клиента и/или
+# на имя пользователя из формы, лимит "число/период" (s, m, h, d).
+# Отклоненные запросы получают 429 до хеширования пароля и записи в базу.
+# Ведра хранятся в отдельной SQLite-базе, общей для воркеров на машине
+THROTTLE_DB = os.path.join(BASE_DIR, 'cache', 'throttle.sqlite3')
+THROTTLES = {
+    'login': {'ip': '30/m', 'username': '10/m'},
+    'register': {'ip': '10/h'},
+    'comment': {'ip': '20/m'},
+    # Полная выгрузка таблиц (api/articles/export/, api/comment/export/)
+    'export': {'ip': '30/h'},
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -164,6 +298,26 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),
 ]
+# collectstatic: имена с хешем содержимого и сжатые копии .gz/.br рядом,
+# отдаются my_siteApp.assets.StaticFilesMiddleware
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'my_siteApp.assets.CompressedManifestStaticFilesStorage',
+    },
+}
+# Адаптивные копии изображений: manage.py build_images (нужен Pillow)
+RESPONSIVE_IMAGES = {
+    'SOURCE': 'images',
+    'OUTPUT': 'responsive',
+    'WIDTHS': [320, 480, 640, 800],
+    'FORMATS': ['avif', 'webp', 'jpeg'],
+    'QUALITY': {'avif': 50, 'webp': 75, 'jpeg': 80},
+}
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 